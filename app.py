@@ -1,12 +1,28 @@
 import streamlit as st
 import snowflake.connector
 import pandas as pd
+import numpy as np
 import os
 import configparser
+import pickle
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
+import re
+import bisect
+import heapq
+import uuid
 import ssl
 import urllib3
 import requests
+import sys
+import threading
+import time
+import warnings
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 load_dotenv()
 
@@ -37,13 +53,128 @@ st.info("🔓 SSL verification globally disabled for corporate network compatibi
 
 st.set_page_config(page_title="Snowflake Lineage Explorer", layout="wide")
 
+# Process-wide cache settings (shared by every browser session on this server)
+SHARED_CACHE_TTL_SECONDS = int(os.getenv('LINEAGE_CACHE_TTL_SECONDS', '900'))
+SHARED_CACHE_MAX_MB = int(os.getenv('LINEAGE_CACHE_MAX_MB', '512'))
+
+# Daily ACCESS_HISTORY partial aggregates are cached here once the day is closed
+ACCESS_PARTITION_CACHE_DIR = os.getenv('LINEAGE_ACCESS_CACHE_DIR', '.lineage_cache/access_history')
+ACCESS_HISTORY_LATENCY_HOURS = 3  # ACCOUNT_USAGE.ACCESS_HISTORY can lag by up to 3 hours
+
+# Approximate access history: Snowflake HLL sketches have 2^12 registers,
+# a relative standard error of 1.04 / sqrt(4096) ~ 1.6%
+ACCESS_HLL_REGISTERS = 4096
+ACCESS_HLL_STANDARD_ERROR = 1.04 / ACCESS_HLL_REGISTERS ** 0.5
+# Exported sketches are sent back to Snowflake to be merged, at most this much SQL per statement
+HLL_COMBINE_BATCH_BYTES = 512 * 1024
+ERROR_BOUND_Z = 1.96  # Reported error bounds are ~95% intervals
+
+# Access-history windows end on fixed boundaries so repeated requests share SQL text
+ACCESS_WINDOW_BUCKET_MINUTES = 60
+
+# Attached as QUERY_TAG to every generated statement
+APP_QUERY_TAG = {'app': 'snowflake-lineage-explorer', 'version': '1.0.0'}
+# Queries waiting for a result-cache check are kept per session up to this many / this long
+QUERY_STATS_MAX_PENDING = 1000
+QUERY_STATS_MAX_AGE_HOURS = 24
+
+# Whole-account lineage crawl checkpoints
+CRAWL_CHECKPOINT_DIR = os.getenv('LINEAGE_CRAWL_DIR', '.lineage_crawl')
+GET_LINEAGE_MAX_DEPTH = 5  # GET_LINEAGE traverses at most 5 levels per call
+CRAWL_DEPTH = GET_LINEAGE_MAX_DEPTH
+# Progress records appended to a crawl's progress.jsonl before state.json is rewritten
+CRAWL_COMPACT_RECORDS = 10000
+
+# Adaptive depth probes this many levels before choosing the final depth
+ADAPTIVE_PROBE_DEPTH = 2
+
+# Per-session memory budget for stored analysis results; older results spill to disk
+SESSION_RESULT_BUDGET_MB = int(os.getenv('LINEAGE_SESSION_BUDGET_MB', '256'))
+RESULT_SPILL_DIR = os.getenv('LINEAGE_SPILL_DIR', '.lineage_cache/spill')
+RESULT_SPILL_MAX_AGE_HOURS = 24
+
+# Reachability bitsets take about nodes^2 / 4 bytes; nodes beyond this budget are left out
+REACHABILITY_MAX_MB = int(os.getenv('LINEAGE_REACHABILITY_MAX_MB', '256'))
+REACHABILITY_MAX_NODES = int((REACHABILITY_MAX_MB * 1024 * 1024 * 4) ** 0.5)
+
+# Background jobs: state and results persist here so a reloaded page can reattach
+JOB_DIR = os.getenv('LINEAGE_JOB_DIR', '.lineage_jobs')
+JOB_WORKERS = int(os.getenv('LINEAGE_JOB_WORKERS', '4'))
+JOB_MAX_PER_USER = int(os.getenv('LINEAGE_JOBS_PER_USER', '2'))
+JOB_MAX_AGE_HOURS = 24
+JOB_POLL_SECONDS = 2
+
+# Table/view/column dropdowns are listed in sorted pages of this many names
+METADATA_PAGE_SIZE = int(os.getenv('LINEAGE_METADATA_PAGE_SIZE', '1000'))
+
+# Record every result as a fixture, or serve recorded fixtures offline instead of Snowflake
+RECORD_DIR = os.getenv('LINEAGE_RECORD_DIR')
+REPLAY_DIR = os.getenv('LINEAGE_REPLAY_DIR')
+REPLAY_LATENCY_MS = int(os.getenv('LINEAGE_REPLAY_LATENCY_MS', '0'))
+
+def fragment(func=None, **kwargs):
+    """st.fragment when available (Streamlit >= 1.37), so a panel reruns on its own.
+
+    On older Streamlit versions the function runs as part of the full script.
+    """
+    decorator = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+    if decorator is None:
+        return func if func is not None else (lambda f: f)
+    return decorator(func, **kwargs) if func is not None else decorator(**kwargs)
+
+def rerun_fragment():
+    """Rerun only the current fragment during a fragment rerun, otherwise the whole app.
+
+    Streamlit rejects scope="fragment" while a fragment runs as part of a full run.
+    """
+    ctx = get_script_run_ctx()
+    if hasattr(st, 'fragment') and getattr(ctx, 'fragment_ids_this_run', None):
+        st.rerun(scope="fragment")
+    st.rerun()
+
+def csv_data(df, key):
+    """CSV export of a frame, serialized once per frame instead of on every rerun"""
+    cached = st.session_state.get(f'{key}_csv')
+    if cached and cached[0] is df:
+        return cached[1]
+    data = df.to_csv(index=False)
+    st.session_state[f'{key}_csv'] = (df, data)
+    return data
+
+SNOWFLAKE_ENV_VARS = [
+    'SNOWFLAKE_USER', 'SNOWFLAKE_ACCOUNT', 'SNOWFLAKE_PASSWORD', 'SNOWFLAKE_AUTHENTICATOR',
+    'SNOWFLAKE_ROLE', 'SNOWFLAKE_WAREHOUSE', 'SNOWFLAKE_DATABASE', 'SNOWFLAKE_SCHEMA',
+]
+
 def load_snowflake_config():
-    """Load Snowflake configuration from config file or environment variables"""
+    """Load Snowflake configuration, re-parsing only when the file or environment changes"""
+    config_file = 'snowflake_config.toml'
+    modified_time = os.path.getmtime(config_file) if os.path.exists(config_file) else None
+    env_values = tuple(os.getenv(name) for name in SNOWFLAKE_ENV_VARS)
+    connection_params, _ = read_snowflake_config(config_file, modified_time, env_values)
+    return dict(connection_params)
+
+def show_config_source():
+    """Show where the configuration was loaded from (or why the file was ignored)"""
+    config_file = 'snowflake_config.toml'
+    modified_time = os.path.getmtime(config_file) if os.path.exists(config_file) else None
+    env_values = tuple(os.getenv(name) for name in SNOWFLAKE_ENV_VARS)
+    _, messages = read_snowflake_config(config_file, modified_time, env_values)
+    for level, message in messages:
+        getattr(st, level)(message)
+
+@st.cache_data(show_spinner=False)
+def read_snowflake_config(config_file, modified_time, env_values):
+    """Parse configuration from config file or environment variables.
+
+    modified_time and env_values only key the cache. Returns the connection
+    parameters and the status messages to show for them.
+    """
     connection_params = {}
+    messages = []
     
     # Try to load from Snowflake config file first
-    config_file = 'snowflake_config.toml'
-    if os.path.exists(config_file):
+    if modified_time is not None:
         try:
             config = configparser.ConfigParser()
             config.read(config_file)
@@ -84,11 +215,11 @@ def load_snowflake_config():
                     break  # Use the first connection found
                     
             if connection_params:
-                st.info("📁 Using configuration from snowflake_config.toml")
-                return connection_params
+                messages.append(('info', "📁 Using configuration from snowflake_config.toml"))
+                return connection_params, messages
                 
         except Exception as e:
-            st.warning(f"Could not parse config file: {str(e)}")
+            messages.append(('warning', f"Could not parse config file: {str(e)}"))
     
     # Fallback to environment variables
     connection_params = {
@@ -116,67 +247,967 @@ def load_snowflake_config():
         connection_params['schema'] = os.getenv('SNOWFLAKE_SCHEMA')
     
     if connection_params.get('user') and connection_params.get('account'):
-        st.info("🔧 Using configuration from .env file")
+        messages.append(('info', "🔧 Using configuration from .env file"))
     
-    return connection_params
+    return connection_params, messages
 
 def create_connection():
     """Create connection to Snowflake"""
     try:
-        connection_params = load_snowflake_config()
-        
-        # Validate required parameters
-        if not connection_params.get('user') or not connection_params.get('account'):
-            st.error("Missing required connection parameters. Please check your configuration.")
-            return None
-        
-        # Remove any None or empty values
-        connection_params = {k: v for k, v in connection_params.items() if v}
-        
-        
-        # SSL configuration for corporate networks
-        ssl_options = {
-            'insecure_mode': True,  # Required for corporate SSL inspection
-            'ocsp_fail_open': True,  # Allow connection if OCSP check fails
-            'disable_request_pooling': True,  # Helps with SSL issues
-            'validate_default_parameters': False,  # Skip parameter validation
-        }
-        
-        # Create connection with SSL bypass
-        conn = snowflake.connector.connect(**connection_params, **ssl_options)
-        return conn
+        return connect_snowflake()
+    except ValueError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Connection failed: {str(e)}")
         return None
 
-def execute_lineage_query(conn, object_name, object_type, direction, depth):
-    """Execute GET_LINEAGE query and return results"""
+def connect_snowflake():
+    """Open a Snowflake connection from the configuration (raises on failure)"""
+    if REPLAY_DIR:
+        return ReplayConnection(REPLAY_DIR, REPLAY_LATENCY_MS)
+    connection_params = load_snowflake_config()
+    
+    # Validate required parameters
+    if not connection_params.get('user') or not connection_params.get('account'):
+        raise ValueError("Missing required connection parameters. Please check your configuration.")
+    
+    # Remove any None or empty values
+    connection_params = {k: v for k, v in connection_params.items() if v}
+    
+    # SSL configuration for corporate networks
+    ssl_options = {
+        'insecure_mode': True,  # Required for corporate SSL inspection
+        'ocsp_fail_open': True,  # Allow connection if OCSP check fails
+        'disable_request_pooling': True,  # Helps with SSL issues
+        'validate_default_parameters': False,  # Skip parameter validation
+    }
+    
+    # Statements without a more specific tag (SHOW, DDL/DML, probes) are still attributed to the app
+    session_parameters = {'QUERY_TAG': query_tag('other')}
+    
+    # Create connection with SSL bypass
+    conn = snowflake.connector.connect(**connection_params, **ssl_options, session_parameters=session_parameters)
+    if RECORD_DIR:
+        return RecordingConnection(conn, RECORD_DIR)
+    return conn
+
+def fixture_key(query):
+    """Fixture file name for a statement, stable across runs.
+
+    Whitespace and generated staging table suffixes are normalized, and
+    access-history window timestamps become day offsets from today, so a
+    replay matches recordings made on earlier days.
+    """
+    today = datetime.now(timezone.utc).date()
+    def day_offset(match):
+        return f"'<today{(datetime.strptime(match.group(1), '%Y-%m-%d').date() - today).days:+d}d>'"
+    normalized = ' '.join(query.split())
+    normalized = re.sub(r"'(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2} \+0000'", day_offset, normalized)
+    normalized = re.sub(r"_STAGE_[0-9A-F]{8}\b", "_STAGE_<id>", normalized)
+    return hashlib.sha256(normalized.encode()).hexdigest()[:32]
+
+class RecordingCursor:
+    """Cursor wrapper that saves every statement's result as a fixture"""
+
+    def __init__(self, cursor, fixture_dir):
+        self._cursor = cursor
+        self._fixture_dir = fixture_dir
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, *args, **kwargs):
+        self._cursor.execute(query, *args, **kwargs)
+        description = self._cursor.description
+        rows = self._cursor.fetchall() if description else []
+        fixture = {
+            'query': query,
+            'description': [tuple(desc) for desc in description] if description else None,
+            'rows': rows,
+            'rowcount': self._cursor.rowcount,
+        }
+        path = os.path.join(self._fixture_dir, f"{fixture_key(query)}.pkl")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(fixture, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        # Rows were consumed for the fixture, so serve them from it
+        self._replay = ReplayCursor.from_fixture(fixture, self._cursor.sfqid)
+        return self
+
+    def fetchall(self):
+        return self._replay.fetchall()
+
+    def fetchone(self):
+        return self._replay.fetchone()
+
+    @property
+    def description(self):
+        return self._replay.description
+
+class RecordingConnection:
+    """Real Snowflake connection that records every result into fixture_dir"""
+
+    def __init__(self, conn, fixture_dir):
+        self._conn = conn
+        self._fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self._conn.cursor(*args, **kwargs), self._fixture_dir)
+
+def record_explored_path(path):
+    """Append the picker choices of one analysis to RECORD_DIR/paths.jsonl so load_harness.py can replay them"""
+    if not RECORD_DIR:
+        return
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    with open(os.path.join(RECORD_DIR, 'paths.jsonl'), 'a') as f:
+        f.write(json.dumps(path) + '\n')
+
+class ReplayCursor:
+    """Serves recorded results offline, after a simulated warehouse latency"""
+
+    def __init__(self, fixture_dir=None, latency_seconds=0.0):
+        self._fixture_dir = fixture_dir
+        self._latency_seconds = latency_seconds
+        self._rows = []
+        self._position = 0
+        self.description = None
+        self.rowcount = None
+        self.sfqid = None
+
+    @classmethod
+    def from_fixture(cls, fixture, query_id=None):
+        cursor = cls()
+        cursor._load(fixture, query_id)
+        return cursor
+
+    def _load(self, fixture, query_id):
+        self._rows = fixture['rows']
+        self._position = 0
+        self.description = fixture['description']
+        self.rowcount = fixture['rowcount']
+        self.sfqid = query_id
+
+    def execute(self, query, *args, **kwargs):
+        if self._latency_seconds:
+            time.sleep(self._latency_seconds)
+        path = os.path.join(self._fixture_dir, f"{fixture_key(query)}.pkl")
+        try:
+            with open(path, 'rb') as f:
+                fixture = pickle.load(f)
+        except FileNotFoundError:
+            raise LookupError(f"No recorded response for this statement (fixture {os.path.basename(path)}). Record it with LINEAGE_RECORD_DIR first.")
+        self._load(fixture, uuid.uuid4().hex)
+        return self
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def close(self):
+        pass
+
+class ReplayConnection:
+    """Offline stand-in for a Snowflake connection, backed by recorded fixtures"""
+
+    def __init__(self, fixture_dir, latency_ms=0):
+        if not os.path.isdir(fixture_dir):
+            raise ValueError(f"Replay fixture directory {fixture_dir} does not exist")
+        self.fixture_dir = fixture_dir
+        self.latency_seconds = latency_ms / 1000
+        self.session_id = 0
+
+    def cursor(self, *args, **kwargs):
+        return ReplayCursor(self.fixture_dir, self.latency_seconds)
+
+    def close(self):
+        pass
+
+def get_cache_scope(conn):
+    """Identify the privilege scope (account + active roles) of a connection"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT CURRENT_ACCOUNT(), CURRENT_ROLE(), CURRENT_SECONDARY_ROLES()")
+        result = cursor.fetchone()
+        return tuple(result) if result else None
+    except Exception:
+        # Without a known role we cannot share safely - fall back to per-session caching
+        return None
+
+def refresh_session_identity(conn):
+    """Re-read the role scope and connection details of the session's connection.
+
+    Custom queries may switch roles (USE ROLE, USE SECONDARY ROLES), so this runs
+    after them too. When the scope changed, listings cached in the session under
+    the old roles are dropped. Returns True if the scope changed.
+    """
+    previous = st.session_state.get('cache_scope')
+    scope = get_cache_scope(conn)
+    st.session_state.cache_scope = scope
     try:
-        query = f"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT CURRENT_USER(), CURRENT_ROLE(), CURRENT_WAREHOUSE(), CURRENT_DATABASE()")
+        st.session_state.connection_details = cursor.fetchone()
+    except Exception:
+        pass  # Don't fail if we can't get connection details
+    if scope == previous and scope is not None:
+        return False
+    # An unknown scope can't be compared, so treat it as changed
+    for key in [key for key in st.session_state.keys() if key.startswith('cached_')]:
+        del st.session_state[key]
+    st.session_state.databases = []
+    return True
+
+def estimate_size(value):
+    """Rough in-memory size in bytes of a cached value"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class SharedResultCache:
+    """Thread-safe LRU cache with a TTL and a memory bound, shared across sessions.
+
+    Keys always start with the cache scope (account + roles), so sessions only
+    ever see entries produced under the same privileges. Cached values are
+    shared by reference and must be treated as read-only.
+    """
+
+    def __init__(self, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._total_bytes = 0
+        self._inflight = {}  # key -> Event, so concurrent sessions wait for one load
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader, should_store=None):
+        """Return the cached value for key, calling loader() on a miss"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, size, value = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return value
+                    self._remove(key)
+                pending = self._inflight.get(key)
+                if pending is None:
+                    # This caller performs the load; others wait for it
+                    pending = threading.Event()
+                    self._inflight[key] = pending
+                    self.misses += 1
+                    break
+            pending.wait()
+
+        try:
+            value = loader()
+            if should_store is None or should_store(value):
+                self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        """Store a value loaded outside of get_or_load (e.g. in a batch)"""
+        self._store(key, value)
+
+    def invalidate(self, scope):
+        """Drop every entry cached under the given scope"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == scope]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'megabytes': self._total_bytes / (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _store(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return  # Never let a single oversized result flush the whole cache
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._total_bytes += size
+            # Evict least recently used entries until we are back under the bound
+            while self._total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+@st.cache_resource
+def get_shared_cache():
+    """Single cache instance for the whole server process"""
+    return SharedResultCache(SHARED_CACHE_TTL_SECONDS, SHARED_CACHE_MAX_MB * 1024 * 1024)
+
+def load_cached(kind, key_parts, loader, should_store=None):
+    """Load a value through the shared cache, isolated by the session's role scope"""
+    scope = st.session_state.get('cache_scope')
+    if scope is None:
+        # Unknown privileges: keep the value private to this session
+        session_key = '_'.join(['cached', kind] + [str(part) for part in key_parts])
+        if session_key not in st.session_state:
+            value = loader()
+            if should_store is not None and not should_store(value):
+                return value
+            st.session_state[session_key] = value
+        return st.session_state[session_key]
+    return get_shared_cache().get_or_load((scope, kind) + tuple(key_parts), loader, should_store)
+
+def paged_options(kind, key_parts, make_listing):
+    """Names loaded so far for a paged dropdown, plus the listing if more pages remain.
+
+    Partial listings live in the session; only complete lists go to the shared cache.
+    """
+    scope = st.session_state.get('cache_scope')
+    cache_key = (scope, kind) + tuple(key_parts)
+    if scope is not None:
+        cached = get_shared_cache().get(cache_key)
+        if cached is not None:
+            return cached, None
+    session_key = '_'.join(['cached', 'listing', kind] + [str(part) for part in key_parts])
+    listing = st.session_state.get(session_key)
+    if listing is None:
+        listing = make_listing()
+        try:
+            listing.load_more(st.session_state.connection)
+        except Exception as e:
+            st.error(f"Failed to fetch {kind}: {str(e)}")
+            return [], None
+        st.session_state[session_key] = listing
+    if not listing.complete:
+        return listing.names, listing
+    if scope is not None and listing.names:
+        get_shared_cache().put(cache_key, listing.names)
+        del st.session_state[session_key]
+    return listing.names, None
+
+def render_load_more(listing, label):
+    """'Load more' control under a dropdown whose listing has more pages"""
+    if listing is None:
+        return
+    st.caption(f"Showing the first {len(listing.names):,} {label} in name order")
+    if st.button(f"⏬ Load more {label}", key=f"load_more_{label}"):
+        try:
+            with st.spinner(f"Loading more {label}..."):
+                listing.load_more(st.session_state.connection)
+        except Exception as e:
+            st.error(f"Failed to fetch more {label}: {str(e)}")
+            return
+        rerun_fragment()
+
+def is_non_empty(value):
+    """Don't cache empty metadata lists - they usually mean the fetch failed"""
+    return bool(value)
+
+def is_successful_query(value):
+    """Only cache (df, query) pairs where the query succeeded"""
+    return value[0] is not None
+
+def compact_lineage_result(value):
+    """Compact the frame of a (df, query) pair before it is cached"""
+    df, query = value
+    return compact_frame(df), query
+
+def compact_frame(df):
+    """Return a memory-compact copy of a result frame.
+
+    Repeated strings (object, domain and column names) are dictionary-encoded
+    as categoricals and integer columns (DISTANCE, counts) use the narrowest dtype.
+    """
+    if df is None:
+        return None
+    compact = df.copy()
+    for col in compact.columns:
+        series = compact[col]
+        if series.dtype == object:
+            # Only encode string columns where values actually repeat
+            if (pd.api.types.infer_dtype(series, skipna=True) == 'string'
+                    and series.nunique(dropna=True) <= max(1, len(series) // 2)):
+                compact[col] = series.astype('category')
+        elif pd.api.types.is_integer_dtype(series):
+            compact[col] = pd.to_numeric(series, downcast='integer')
+    return compact
+
+def results_size(results):
+    """In-memory size in bytes of a stored lineage/access result"""
+    return estimate_size(results.get('df')) + estimate_size(results.get('access_df'))
+
+def make_private_dirs(*paths):
+    """Create directories (outermost first) that only the app's own user can access"""
+    for path in paths:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        os.chmod(path, 0o700)
+
+def get_spill_dir():
+    """Per-session directory for results spilled out of memory"""
+    if 'spill_session_id' not in st.session_state:
+        st.session_state.spill_session_id = uuid.uuid4().hex
+        cleanup_spill_dir()
+    spill_dir = os.path.join(RESULT_SPILL_DIR, st.session_state.spill_session_id)
+    # Spilled results are pickles read back by the app, so only its own user may write them
+    make_private_dirs(RESULT_SPILL_DIR, spill_dir)
+    return spill_dir
+
+def cleanup_spill_dir():
+    """Remove spilled results left behind by sessions that ended long ago"""
+    cutoff = time.time() - RESULT_SPILL_MAX_AGE_HOURS * 3600
+    if not os.path.isdir(RESULT_SPILL_DIR):
+        return
+    for session_dir in os.listdir(RESULT_SPILL_DIR):
+        path = os.path.join(RESULT_SPILL_DIR, session_dir)
+        try:
+            files = [os.path.join(path, name) for name in os.listdir(path)]
+            if all(os.path.getmtime(f) < cutoff for f in files):
+                for f in files:
+                    os.remove(f)
+                os.rmdir(path)
+        except OSError:
+            pass  # Another worker may be cleaning up the same directory
+
+def remember_results(results):
+    """Make results the active analysis and keep older ones within the session budget"""
+    history = st.session_state.setdefault('result_history', [])
+    history.insert(0, {
+        'id': uuid.uuid4().hex,
+        'label': f"{results['object_name']} • {results['direction']} • {results['depth_display']}",
+        'results': results,
+        'spill_path': None,
+    })
+    st.session_state.lineage_results = results
+    # Every explored result feeds the reachability index for downstream counts
+    session_reachability_index().add_frame(results['df'])
+    enforce_session_budget()
+
+def enforce_session_budget():
+    """Spill the oldest in-memory results to disk until the session fits its budget"""
+    history = st.session_state.get('result_history', [])
+    budget = SESSION_RESULT_BUDGET_MB * 1024 * 1024
+    in_memory = [entry for entry in history if entry['results'] is not None]
+    used = sum(results_size(entry['results']) for entry in in_memory)
+    # The active result (first entry) always stays in memory
+    for entry in reversed(in_memory[1:]):
+        if used <= budget:
+            break
+        used -= results_size(entry['results'])
+        path = os.path.join(get_spill_dir(), f"{entry['id']}.pkl")
+        try:
+            with open(path, 'wb') as f:
+                pickle.dump(entry['results'], f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            st.warning(f"Could not spill older results to disk: {str(e)}")
+            return
+        entry['results'] = None
+        entry['spill_path'] = path
+
+def restore_results(entry_id):
+    """Bring a previous analysis back into memory and make it active"""
+    history = st.session_state.get('result_history', [])
+    for position, entry in enumerate(history):
+        if entry['id'] != entry_id:
+            continue
+        if entry['results'] is None:
+            try:
+                with open(entry['spill_path'], 'rb') as f:
+                    entry['results'] = pickle.load(f)
+            except (OSError, pickle.UnpicklingError) as e:
+                st.error(f"Could not restore results from disk: {str(e)}")
+                history.pop(position)
+                return
+            os.remove(entry['spill_path'])
+            entry['spill_path'] = None
+        history.insert(0, history.pop(position))
+        st.session_state.lineage_results = entry['results']
+        enforce_session_budget()
+        return
+
+def qualified_node_names(df, side):
+    """Fully qualified node names (DB.SCHEMA.OBJECT[.COLUMN]) for one side of GET_LINEAGE output"""
+    name_col = f'{side}_OBJECT_NAME'
+    if name_col not in df.columns:
+        return None
+    names = df[name_col].astype(str)
+    db_col, schema_col = f'{side}_OBJECT_DATABASE', f'{side}_OBJECT_SCHEMA'
+    if db_col in df.columns and schema_col in df.columns:
+        names = df[db_col].astype(str) + '.' + df[schema_col].astype(str) + '.' + names
+    column_col = f'{side}_COLUMN_NAME'
+    if column_col in df.columns:
+        names = names.where(df[column_col].isna(), names + '.' + df[column_col].astype(str))
+    return names
+
+def qualified_node_codes(df, side):
+    """Factorized qualified node names for one side: (code per row, unique names).
+
+    Rows are grouped on the name parts first, so the strings are only built
+    once per distinct node instead of once per row.
+    """
+    if f'{side}_OBJECT_NAME' not in df.columns:
+        return None, None
+    parts = [col for col in (f'{side}_OBJECT_DATABASE', f'{side}_OBJECT_SCHEMA', f'{side}_OBJECT_NAME', f'{side}_COLUMN_NAME')
+             if col in df.columns]
+    codes = df.groupby(parts, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    names = qualified_node_names(df.iloc[first_rows], side).to_numpy(dtype=object)
+    return codes, names
+
+def glob_pattern(pattern):
+    """Anchored regular expression for a shell-style glob (*, ?, [seq], [!seq])"""
+    parts, i = [], 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        elif char == '[' and pattern.find(']', i + 1) > i + 1:
+            end = pattern.find(']', i + 1)
+            body = pattern[i + 1:end]
+            negate = body.startswith('!')
+            body = body[1:] if negate else body
+            parts.append('[' + ('^' if negate else '') + body.replace('\\', '\\\\') + ']')
+            i = end
+        elif char in '.^$+(){}|\\[]':
+            parts.append('\\' + char)
+        else:
+            parts.append(char)
+        i += 1
+    return '^' + ''.join(parts) + '$'
+
+class LineageSearchIndex:
+    """Dictionary-encoded search index over the names in one lineage result.
+
+    Every distinct name (qualified source/target objects, domains, columns) is
+    stored once in a shared vocabulary and each row keeps one integer code per
+    field. A query is matched against the vocabulary with vectorized string
+    operations and expanded to a boolean row mask with one gather per field.
+    Qualified source/target names double as graph nodes; their CSR adjacency
+    is built once and answers "paths through X" with a vectorized BFS.
+    """
+
+    SEARCH_FIELDS = [
+        'SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME', 'OBJECT_NAME',
+        'SOURCE_OBJECT_DOMAIN', 'TARGET_OBJECT_DOMAIN', 'OBJECT_DOMAIN',
+        'SOURCE_COLUMN_NAME', 'TARGET_COLUMN_NAME',
+    ]
+
+    def __init__(self, df):
+        self.df = df
+        self.row_count = len(df)
+        field_codes, field_terms = [], []
+        for col in self.SEARCH_FIELDS:
+            if col in df.columns:
+                codes, uniques = pd.factorize(df[col])
+                field_codes.append(codes)
+                field_terms.append(np.asarray(uniques.astype(str), dtype=object))
+        source_codes, source_names = qualified_node_codes(df, 'SOURCE')
+        target_codes, target_names = qualified_node_codes(df, 'TARGET')
+        has_graph = source_codes is not None and target_codes is not None
+        if has_graph:
+            field_codes += [source_codes, target_codes]
+            field_terms += [source_names, target_names]
+
+        # Map every field's local codes onto one shared vocabulary; missing values
+        # point at a sentinel id one past the end of the vocabulary
+        all_terms = np.concatenate(field_terms) if field_terms else np.array([], dtype=object)
+        term_ids, vocabulary = pd.factorize(all_terms)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        sentinel = len(self.vocabulary)
+        self._codes = []
+        offset = 0
+        for codes, terms in zip(field_codes, field_terms):
+            local_to_global = np.append(term_ids[offset:offset + len(terms)], sentinel).astype(np.int32)
+            self._codes.append(local_to_global[codes])  # code -1 picks the sentinel
+            offset += len(terms)
+        self._terms_upper = pd.Series(self.vocabulary, dtype='string[pyarrow]').str.upper()
+
+        # Node graph of the result for "paths through X" queries
+        self._graph = None
+        if has_graph:
+            sources, targets = self._codes[-2], self._codes[-1]
+            self._graph = (sources, targets, self._csr(sources, targets, sentinel), self._csr(targets, sources, sentinel))
+            self._is_node = np.zeros(sentinel, dtype=bool)
+            self._is_node[sources] = True
+            self._is_node[targets] = True
+
+    @staticmethod
+    def _csr(from_ids, to_ids, size):
+        """Compressed sparse row adjacency (indptr, indices) for from_ids -> to_ids edges"""
+        order = np.argsort(from_ids, kind='stable')
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(from_ids, minlength=size), out=indptr[1:])
+        return indptr, to_ids[order]
+
+    def matching_terms(self, query, mode='Contains'):
+        """Boolean mask over the vocabulary of terms matching the query"""
+        if mode in ('Regex', 'Glob'):
+            pattern = glob_pattern(query) if mode == 'Glob' else query
+            try:
+                compiled = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern: {str(e)}")
+            try:
+                # Vectorized (RE2) matching; patterns RE2 can't handle fall back to re
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)  # "has match groups"
+                    matches = self._terms_upper.str.contains(pattern, case=False, regex=True)
+            except Exception:
+                return np.fromiter((compiled.search(term) is not None for term in self.vocabulary),
+                                   dtype=bool, count=len(self.vocabulary))
+            return matches.to_numpy(dtype=bool, na_value=False)
+
+        needle = query.upper()
+        if mode == 'Prefix':
+            matches = self._terms_upper.str.startswith(needle)
+        else:
+            matches = self._terms_upper.str.contains(needle, regex=False)
+        return matches.to_numpy(dtype=bool, na_value=False)
+
+    def row_mask(self, term_mask):
+        """Rows where any indexed field holds one of the masked terms"""
+        lookup = np.append(term_mask, False)  # the sentinel never matches
+        mask = np.zeros(self.row_count, dtype=bool)
+        for codes in self._codes:
+            mask |= lookup[codes]
+        return mask
+
+    def search(self, query, mode='Contains'):
+        """Row positions whose indexed fields match the query"""
+        return np.flatnonzero(self.row_mask(self.matching_terms(query, mode)))
+
+    def paths_through(self, query, mode='Contains'):
+        """Row positions of edges lying on any lineage path through a matching node"""
+        if self._graph is None:
+            return self.search(query, mode)
+        start = np.flatnonzero(self.matching_terms(query, mode) & self._is_node)
+        if not len(start):
+            return np.array([], dtype=np.int64)
+
+        sources, targets, forward, backward = self._graph
+        ancestors = self._reachable(start, backward)
+        descendants = self._reachable(start, forward)
+        # An edge u -> v is on a path through X if v reaches X or u is reached from X
+        return np.flatnonzero(ancestors[targets] | descendants[sources])
+
+    @staticmethod
+    def _reachable(start, adjacency):
+        """Boolean mask of nodes reachable from start (inclusive) in a CSR adjacency"""
+        indptr, indices = adjacency
+        seen = np.zeros(len(indptr) - 1, dtype=bool)
+        seen[start] = True
+        frontier = start
+        while len(frontier):
+            begins = indptr[frontier]
+            counts = indptr[frontier + 1] - begins
+            total = int(counts.sum())
+            if not total:
+                break
+            # Gather the neighbours of the whole frontier in one step
+            positions = np.repeat(begins - np.cumsum(counts) + counts, counts) + np.arange(total)
+            neighbours = indices[positions]
+            frontier = np.unique(neighbours[~seen[neighbours]])
+            seen[frontier] = True
+        return seen
+
+def get_search_index(df):
+    """Build the search index once per lineage result and reuse it on reruns"""
+    cached = st.session_state.get('search_index')
+    if cached is None or cached.df is not df:
+        with st.spinner("Indexing lineage results..."):
+            cached = LineageSearchIndex(df)
+        st.session_state.search_index = cached
+    return cached
+
+def filter_frame_positions(df, text):
+    """Row positions where any text column contains the filter text (case-insensitive)"""
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Match against the (small) category list, then expand through the codes
+            matching = np.flatnonzero(series.cat.categories.astype(str).str.contains(text, case=False, regex=False))
+            mask |= np.isin(series.cat.codes.to_numpy(), matching)
+        elif series.dtype == object:
+            mask |= series.astype(str).str.contains(text, case=False, regex=False).to_numpy()
+    return np.flatnonzero(mask)
+
+def sorted_positions(df, key, sort_column, ascending):
+    """Row positions of df in sort order, cached per frame so paging doesn't re-sort"""
+    cache_key = f'{key}_sort_cache'
+    cached = st.session_state.get(cache_key)
+    if cached and cached[0] is df and cached[1] == (sort_column, ascending):
+        return cached[2]
+    if sort_column:
+        positions = (df[sort_column].reset_index(drop=True)
+                     .sort_values(ascending=ascending, kind='stable', na_position='last')
+                     .index.to_numpy())
+    else:
+        positions = np.arange(len(df))
+    st.session_state[cache_key] = (df, (sort_column, ascending), positions)
+    return positions
+
+def render_paged_dataframe(df, key, row_positions=None, filterable=True):
+    """Sort, filter and page a frame on the server, sending only the visible window.
+
+    row_positions optionally restricts the view to a subset of rows (e.g. search matches)
+    while keeping the sort of the full frame cached.
+    """
+    col_page1, col_page2, col_page3, col_page4 = st.columns([2, 1, 2, 1])
+    with col_page1:
+        sort_column = st.selectbox("Sort by", options=[""] + list(df.columns), key=f'{key}_sort_column')
+    with col_page2:
+        ascending = st.selectbox("Order", options=["Ascending", "Descending"], key=f'{key}_sort_order') == "Ascending"
+    with col_page3:
+        filter_text = st.text_input("Filter rows", key=f'{key}_filter', disabled=not filterable,
+                                    help="Keep rows where any text column contains this value")
+    with col_page4:
+        page_size = st.selectbox("Rows per page", options=[50, 100, 250, 1000], index=1, key=f'{key}_page_size')
+
+    positions = sorted_positions(df, key, sort_column, ascending)
+    if row_positions is not None:
+        positions = positions[np.isin(positions, row_positions)]
+    if filterable and filter_text:
+        positions = positions[np.isin(positions, filter_frame_positions(df, filter_text))]
+
+    # Start from the first page whenever the view changes
+    view_signature = (id(df), sort_column, ascending, filter_text, page_size, len(positions))
+    if st.session_state.get(f'{key}_view') != view_signature:
+        st.session_state[f'{key}_view'] = view_signature
+        st.session_state[f'{key}_page'] = 1
+
+    total_rows = len(positions)
+    page_count = max(1, -(-total_rows // page_size))
+    page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key=f'{key}_page')
+    start = (page - 1) * page_size
+    window = positions[start:start + page_size]
+
+    st.dataframe(df.iloc[window], use_container_width=True)
+    if total_rows:
+        st.caption(f"Rows {start + 1:,}–{start + len(window):,} of {total_rows:,} • page {page} of {page_count}")
+    else:
+        st.caption("No rows match the current filter")
+
+def bucket_time(moment):
+    """Floor a UTC timestamp to the result-cache bucket boundary"""
+    bucket_seconds = ACCESS_WINDOW_BUCKET_MINUTES * 60
+    return datetime.fromtimestamp(int(moment.timestamp()) // bucket_seconds * bucket_seconds, timezone.utc)
+
+def access_window(window_days, now=None):
+    """[start, end) of an access-history window, aligned to fixed bucket boundaries"""
+    end = bucket_time(now or datetime.now(timezone.utc))
+    return end - timedelta(days=window_days), end
+
+def access_time_filter(start, end):
+    """Literal query_start_time range; unlike CURRENT_TIMESTAMP() it keeps the SQL cacheable"""
+    return (f"query_start_time >= '{start.strftime('%Y-%m-%d %H:%M:%S')} +0000'::TIMESTAMP_TZ"
+            f"\n              AND query_start_time < '{end.strftime('%Y-%m-%d %H:%M:%S')} +0000'::TIMESTAMP_TZ")
+
+def query_tag(query_type):
+    """Structured QUERY_TAG attached to every statement the app generates"""
+    return json.dumps({**APP_QUERY_TAG, 'query_type': query_type}, sort_keys=True)
+
+class QueryCacheStats:
+    """Process-wide record of generated queries and how many hit the result cache.
+
+    Queries waiting for a check are kept per session in a bounded queue and
+    dropped after QUERY_STATS_MAX_AGE_HOURS, so sessions that never check
+    don't accumulate them.
+    """
+
+    def __init__(self, max_pending=QUERY_STATS_MAX_PENDING, max_age_seconds=QUERY_STATS_MAX_AGE_HOURS * 3600):
+        self.max_pending = max_pending
+        self.max_age_seconds = max_age_seconds
+        self._pending = {}  # session_id -> deque of (recorded_at, query_type, query_id)
+        self._counts = {}  # query_type -> {'executed', 'checked', 'hits'}
+        self._lock = threading.Lock()
+
+    def record(self, query_type, query_id, session_id):
+        with self._lock:
+            counts = self._counts.setdefault(query_type, {'executed': 0, 'checked': 0, 'hits': 0})
+            counts['executed'] += 1
+            now = time.time()
+            if query_id:
+                pending = self._pending.setdefault(session_id, deque(maxlen=self.max_pending))
+                pending.append((now, query_type, query_id))
+            self._expire(now)
+
+    def _expire(self, now):
+        cutoff = now - self.max_age_seconds
+        for session_id, pending in list(self._pending.items()):
+            while pending and pending[0][0] < cutoff:
+                pending.popleft()
+            if not pending:
+                del self._pending[session_id]
+
+    def take_pending(self, session_id):
+        """Unchecked (query_type, query_id) pairs of a session, oldest first"""
+        with self._lock:
+            self._expire(time.time())
+            return [(query_type, query_id) for _, query_type, query_id in self._pending.pop(session_id, ())]
+
+    def resolve(self, checked, hit_ids):
+        """Count checked queries and the ones served from the result cache"""
+        with self._lock:
+            for query_type, query_id in checked:
+                counts = self._counts[query_type]
+                counts['checked'] += 1
+                counts['hits'] += 1 if query_id in hit_ids else 0
+
+    def summary(self):
+        with self._lock:
+            rows = [
+                (query_type, c['executed'], c['checked'], c['hits'],
+                 f"{c['hits'] / c['checked']:.0%}" if c['checked'] else "n/a")
+                for query_type, c in sorted(self._counts.items())
+            ]
+        return pd.DataFrame(rows, columns=['QUERY_TYPE', 'EXECUTED', 'CHECKED', 'RESULT_CACHE_HITS', 'HIT_RATE'])
+
+@st.cache_resource
+def get_query_stats():
+    """Single query statistics instance for the whole server process"""
+    return QueryCacheStats()
+
+def refresh_result_cache_stats(conn, database=None):
+    """Look up this session's recent queries and classify result-cache hits.
+
+    Queries answered from the result cache scan no bytes and need no warehouse,
+    which QUERY_HISTORY_BY_SESSION exposes as BYTES_SCANNED = 0 and an empty
+    WAREHOUSE_SIZE.
+    """
+    stats = get_query_stats()
+    session_id = getattr(conn, 'session_id', None)
+    pending = stats.take_pending(session_id)
+    if not pending:
+        return 0
+    function = f"{database}.INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION" if database else "INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION"
+    query_ids = "', '".join(query_id for _, query_id in pending)
+    # Not routed through fetch_frame so the lookup itself isn't counted
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT query_id, bytes_scanned, warehouse_size
+        FROM TABLE({function}(RESULT_LIMIT => 10000))
+        WHERE query_id IN ('{query_ids}')
+        """, _statement_params={'QUERY_TAG': query_tag('cache_stats')})
+    history = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
+    found = set(history['QUERY_ID'])
+    hits = set(history.loc[(history['BYTES_SCANNED'].fillna(0) == 0) & history['WAREHOUSE_SIZE'].isna(), 'QUERY_ID'])
+    # Queries that aged out of the session history cannot be classified
+    stats.resolve([item for item in pending if item[1] in found], hits)
+    return len(found)
+
+def build_lineage_query(object_name, object_type, direction, depth):
+    """Build the GET_LINEAGE query text"""
+    # Normalize inputs so equivalent requests produce byte-identical SQL
+    object_name, object_type, direction, depth = object_name.strip(), object_type.lower(), direction.upper(), int(depth)
+    return f"""
         SELECT
             *
         FROM TABLE (SNOWFLAKE.CORE.GET_LINEAGE('{object_name}', '{object_type}', '{direction}', {depth}))
         """
-        
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(results, columns=columns)
+
+def fetch_frame(conn, query, query_type='custom_query'):
+    """Run a tagged query and return its results as a DataFrame (raises on failure)"""
+    cursor = conn.cursor()
+    cursor.execute(query, _statement_params={'QUERY_TAG': query_tag(query_type)})
+    get_query_stats().record(query_type, cursor.sfqid, getattr(conn, 'session_id', None))
+    results = cursor.fetchall()
+    columns = [desc[0] for desc in cursor.description]
+    return pd.DataFrame(results, columns=columns)
+
+def execute_lineage_query(conn, object_name, object_type, direction, depth):
+    """Execute GET_LINEAGE query and return results"""
+    try:
+        query = build_lineage_query(object_name, object_type, direction, depth)
+        df = fetch_frame(conn, query, 'lineage')
         return df, query
     except Exception as e:
         st.error(f"Lineage query execution failed: {str(e)}")
         return None, None
 
+def show_database_names(conn):
+    """Sorted database names from SHOW DATABASES; raises on failure"""
+    cursor = conn.cursor()
+    cursor.execute("SHOW DATABASES")
+    results = cursor.fetchall()
+    # Extract database names from the results (usually in the 'name' column)
+    return sorted(row[1] for row in results)  # name is typically the second column
+
+def show_schema_names(conn, database, include_system_schemas=False):
+    """Sorted schema names from SHOW SCHEMAS, without system schemas unless asked; raises on failure"""
+    cursor = conn.cursor()
+    cursor.execute(f"SHOW SCHEMAS IN DATABASE {database}")
+    results = cursor.fetchall()
+    # Extract schema names from the results
+    all_schemas = [row[1] for row in results]  # name is typically the second column
+    
+    if include_system_schemas:
+        return sorted(all_schemas)
+    
+    # Filter out common system/internal schemas that users typically don't need
+    system_schemas = {
+        'INFORMATION_SCHEMA', 'ACCOUNT_USAGE', 'READER_ACCOUNT_USAGE',
+        'DATA_SHARING_USAGE', 'ORGANIZATION_USAGE', 'SNOWFLAKE',
+        'SNOWFLAKE_SAMPLE_DATA'
+    }
+    
+    # Keep user schemas and common schemas like PUBLIC, RAW_*, etc.
+    user_schemas = []
+    for schema in all_schemas:
+        if (schema not in system_schemas and 
+            not schema.startswith('SNOWFLAKE_') and
+            not schema.startswith('__')):
+            user_schemas.append(schema)
+    
+    return sorted(user_schemas)
+
 def fetch_databases(conn):
     """Fetch list of databases"""
     try:
-        cursor = conn.cursor()
-        cursor.execute("SHOW DATABASES")
-        results = cursor.fetchall()
-        # Extract database names from the results (usually in the 'name' column)
-        databases = [row[1] for row in results]  # name is typically the second column
-        return sorted(databases)
+        return show_database_names(conn)
     except Exception as e:
         st.error(f"Failed to fetch databases: {str(e)}")
         return []
@@ -184,31 +1215,7 @@ def fetch_databases(conn):
 def fetch_schemas(conn, database, include_system_schemas=False):
     """Fetch list of schemas for a given database"""
     try:
-        cursor = conn.cursor()
-        cursor.execute(f"SHOW SCHEMAS IN DATABASE {database}")
-        results = cursor.fetchall()
-        # Extract schema names from the results
-        all_schemas = [row[1] for row in results]  # name is typically the second column
-        
-        if include_system_schemas:
-            return sorted(all_schemas)
-        
-        # Filter out common system/internal schemas that users typically don't need
-        system_schemas = {
-            'INFORMATION_SCHEMA', 'ACCOUNT_USAGE', 'READER_ACCOUNT_USAGE',
-            'DATA_SHARING_USAGE', 'ORGANIZATION_USAGE', 'SNOWFLAKE',
-            'SNOWFLAKE_SAMPLE_DATA'
-        }
-        
-        # Keep user schemas and common schemas like PUBLIC, RAW_*, etc.
-        user_schemas = []
-        for schema in all_schemas:
-            if (schema not in system_schemas and 
-                not schema.startswith('SNOWFLAKE_') and
-                not schema.startswith('__')):
-                user_schemas.append(schema)
-        
-        return sorted(user_schemas)
+        return show_schema_names(conn, database, include_system_schemas)
     except Exception as e:
         st.error(f"Failed to fetch schemas for database {database}: {str(e)}")
         return []
@@ -216,21 +1223,10 @@ def fetch_schemas(conn, database, include_system_schemas=False):
 def fetch_tables(conn, database, schema):
     """Fetch list of tables and views for a given database and schema"""
     try:
-        cursor = conn.cursor()
-        
-        # Get tables
-        cursor.execute(f"SHOW TABLES IN SCHEMA {database}.{schema}")
-        table_results = cursor.fetchall()
-        tables = [row[1] for row in table_results]  # name is typically the second column
-        
-        # Get views
-        cursor.execute(f"SHOW VIEWS IN SCHEMA {database}.{schema}")
-        view_results = cursor.fetchall()
-        views = [row[1] for row in view_results]  # name is typically the second column
-        
-        # Combine and sort
-        all_objects = tables + views
-        return sorted(all_objects)
+        listing = table_listing(database, schema)
+        while not listing.complete:
+            listing.load_more(conn)
+        return listing.names
     except Exception as e:
         st.error(f"Failed to fetch tables and views for {database}.{schema}: {str(e)}")
         return []
@@ -238,16 +1234,105 @@ def fetch_tables(conn, database, schema):
 def fetch_columns(conn, database, schema, table):
     """Fetch list of columns for a given table"""
     try:
-        cursor = conn.cursor()
-        cursor.execute(f"SHOW COLUMNS IN TABLE {database}.{schema}.{table}")
-        results = cursor.fetchall()
-        # Extract column names from the results
-        columns = [row[2] for row in results]  # column_name is typically the third column
-        return sorted(columns)
+        listing = column_listing(database, schema, table)
+        while not listing.complete:
+            listing.load_more(conn)
+        return listing.names
     except Exception as e:
         st.error(f"Failed to fetch columns for {database}.{schema}.{table}: {str(e)}")
         return []
 
+def quote_identifier(name):
+    """Double-quoted identifier, so names from SHOW output are used exactly as returned"""
+    return '"' + name.replace('"', '""') + '"'
+
+def show_names_page(conn, kind, database, schema, after, limit):
+    """One page of SHOW TABLES/VIEWS, starting after the given name; returns (names, rows)"""
+    from_clause = f" FROM '{after.replace(chr(39), chr(39) * 2)}'" if after is not None else ""
+    cursor = conn.cursor()
+    cursor.execute(f"SHOW {kind} IN SCHEMA {quote_identifier(database)}.{quote_identifier(schema)} LIMIT {limit}{from_clause}")
+    rows = cursor.fetchall()
+    names = [row[1] for row in rows]  # name is typically the second column
+    # Keyset cursor: never repeat the name the page started from
+    return [name for name in names if after is None or name > after], len(rows)
+
+def column_names_page(conn, database, schema, table, after, limit, loaded):
+    """One page of column names after the keyset cursor; returns (names, rows).
+
+    SHOW COLUMNS needs no running warehouse but has no LIMIT ... FROM, so the
+    sorted names are read once into the loaded dict and paged client-side.
+    """
+    if 'names' not in loaded:
+        cursor = conn.cursor()
+        cursor.execute(f"SHOW COLUMNS IN {quote_identifier(database)}.{quote_identifier(schema)}.{quote_identifier(table)}")
+        name_index = [desc[0].lower() for desc in cursor.description].index('column_name')
+        loaded['names'] = sorted({row[name_index] for row in cursor.fetchall()})
+    names = loaded['names']
+    start = 0 if after is None else bisect.bisect_right(names, after)
+    page = names[start:start + limit]
+    return page, len(page)
+
+class PagedListing:
+    """Sorted names from one or more paged sources, merged as pages arrive.
+
+    Each source is a function (conn, after, limit) -> (names, rows) returning
+    sorted names after the keyset cursor. A merged name is only released once
+    every unfinished source has paged past it, so names loaded so far are
+    always a sorted prefix of the full listing.
+    """
+
+    def __init__(self, sources, page_size):
+        self.page_size = page_size
+        self.names = []
+        self._sources = {
+            key: {'fetch': fetch, 'after': None, 'buffer': [], 'done': False}
+            for key, fetch in sources.items()
+        }
+
+    @property
+    def complete(self):
+        return all(source['done'] and not source['buffer'] for source in self._sources.values())
+
+    def load_more(self, conn):
+        """Fetch the next page of every source that needs one (concurrently) and merge"""
+        needing_page = [source for source in self._sources.values()
+                        if not source['done'] and len(source['buffer']) < self.page_size]
+
+        def fetch_page(source):
+            return source['fetch'](conn, source['after'], self.page_size)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(needing_page))) as executor:
+            pages = list(executor.map(fetch_page, needing_page))
+        for source, (names, rows) in zip(needing_page, pages):
+            source['buffer'].extend(sorted(names))
+            if names:
+                source['after'] = source['buffer'][-1]
+            source['done'] = rows < self.page_size or not names
+
+        # Only names up to every unfinished source's cursor are final
+        open_cursors = [source['after'] for source in self._sources.values() if not source['done']]
+        bound = min(open_cursors) if open_cursors else None
+        released = []
+        for source in self._sources.values():
+            cut = len(source['buffer']) if bound is None else bisect.bisect_right(source['buffer'], bound)
+            released.append(source['buffer'][:cut])
+            source['buffer'] = source['buffer'][cut:]
+        self.names.extend(heapq.merge(*released))
+
+def table_listing(database, schema):
+    """Paged listing of a schema's tables and views (SHOW TABLES and SHOW VIEWS merged)"""
+    return PagedListing({
+        kind: lambda conn, after, limit, kind=kind: show_names_page(conn, kind, database, schema, after, limit)
+        for kind in ('TABLES', 'VIEWS')
+    }, METADATA_PAGE_SIZE)
+
+def column_listing(database, schema, table):
+    """Paged listing of a table's columns"""
+    loaded = {}
+    return PagedListing({
+        'COLUMNS': lambda conn, after, limit: column_names_page(conn, database, schema, table, after, limit, loaded)
+    }, METADATA_PAGE_SIZE)
+
 def save_results_to_snowflake(conn, df, database, schema, table_name):
     """Save DataFrame results to a Snowflake table"""
     try:
@@ -273,63 +1358,183 @@ def save_results_to_snowflake(conn, df, database, schema, table_name):
         cursor.execute(create_sql)
         
         # Prepare data for bulk insert
-        if not df.empty:
-            # Create a temporary staging table or use direct insert
-            insert_values = []
-            for _, row in df.iterrows():
-                # Escape single quotes and handle None values
-                escaped_values = []
-                for val in row:
-                    if pd.isna(val) or val is None:
-                        escaped_values.append("NULL")
-                    else:
-                        # Convert to string and escape quotes
-                        str_val = str(val).replace("'", "''")
-                        escaped_values.append(f"'{str_val}'")
-                
-                insert_values.append(f"({', '.join(escaped_values)}, CURRENT_TIMESTAMP(), CURRENT_USER())")
-            
-            # Batch insert (split into chunks if too large)
-            chunk_size = 1000
-            total_rows = len(insert_values)
-            
-            for i in range(0, total_rows, chunk_size):
-                chunk = insert_values[i:i + chunk_size]
-                values_clause = ', '.join(chunk)
-                
-                insert_sql = f"""
-                INSERT INTO {full_table_name} 
-                ({', '.join([f'"{col}"' for col in df.columns])}, CREATED_AT, CREATED_BY)
-                VALUES {values_clause}
-                """
-                cursor.execute(insert_sql)
+        insert_dataframe(cursor, full_table_name, df, ['CREATED_AT', 'CREATED_BY'], ['CURRENT_TIMESTAMP()', 'CURRENT_USER()'])
         
         return True, len(df)
     except Exception as e:
         return False, str(e)
 
-def execute_access_history_query(conn, lineage_df):
+def insert_dataframe(cursor, full_table_name, df, extra_columns=(), extra_values=()):
+    """Insert DataFrame rows as escaped VALUES batches, plus optional SQL expression columns"""
+    if df.empty:
+        return
+    insert_values = []
+    for _, row in df.iterrows():
+        # Escape single quotes and handle None values
+        escaped_values = []
+        for val in row:
+            if pd.isna(val) or val is None:
+                escaped_values.append("NULL")
+            else:
+                # Convert to string and escape quotes
+                str_val = str(val).replace("'", "''")
+                escaped_values.append(f"'{str_val}'")
+        
+        insert_values.append(f"({', '.join(escaped_values + list(extra_values))})")
+    
+    # Batch insert (split into chunks if too large)
+    chunk_size = 1000
+    column_list = ', '.join([f'"{col}"' for col in df.columns] + list(extra_columns))
+    
+    for i in range(0, len(insert_values), chunk_size):
+        values_clause = ', '.join(insert_values[i:i + chunk_size])
+        
+        insert_sql = f"""
+        INSERT INTO {full_table_name} 
+        ({column_list})
+        VALUES {values_clause}
+        """
+        cursor.execute(insert_sql)
+
+def edge_hashes(df):
+    """Stable MD5 hash of every result row, used to detect changed lineage edges"""
+    combined = None
+    for col in df.columns:
+        series = df[col]
+        # Numpy strips trailing NULs when converting to str, so the NULL marker can't end in one
+        values = series.astype(object).where(series.notna(), '\x00NULL').astype(str)
+        combined = values if combined is None else combined + '\x1f' + values
+    if combined is None:
+        return pd.Series([], dtype=object)
+    return pd.Series([hashlib.md5(value.encode()).hexdigest() for value in combined], index=df.index)
+
+def save_results_incrementally(conn, df, database, schema, table_name):
+    """Persist results as a history table, writing only edges that changed since the last save.
+
+    Each row carries EDGE_HASH, VALID_FROM and VALID_TO. New edges are merged in
+    as current rows (VALID_TO NULL) and current edges missing from df are
+    expired by setting VALID_TO, so unchanged rows are never rewritten.
+    Returns (True, {'inserted', 'expired', 'unchanged'}) or (False, error).
+    """
+    full_table_name = f"{database}.{schema}.{table_name}"
+    cursor = conn.cursor()
+    try:
+        columns_def = [f'"{col}" VARCHAR(16777216)' for col in df.columns]
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {full_table_name} (
+            {', '.join(columns_def)},
+            EDGE_HASH VARCHAR(32),
+            VALID_FROM TIMESTAMP_LTZ,
+            VALID_TO TIMESTAMP_LTZ,
+            CREATED_BY VARCHAR DEFAULT CURRENT_USER()
+        )
+        """)
+        try:
+            cursor.execute(f"SELECT EDGE_HASH FROM {full_table_name} WHERE VALID_TO IS NULL")
+        except Exception:
+            return False, f"{full_table_name} was not created in incremental mode (no EDGE_HASH column). Choose another table name or replace it once."
+        current_hashes = {row[0] for row in cursor.fetchall()}
+        
+        hashed_df = df.copy()
+        hashed_df['EDGE_HASH'] = edge_hashes(df)
+        hashed_df = hashed_df.drop_duplicates(subset='EDGE_HASH')
+        batch_hashes = set(hashed_df['EDGE_HASH'])
+        new_rows = hashed_df[~hashed_df['EDGE_HASH'].isin(current_hashes)]
+        removed_hashes = sorted(current_hashes - batch_hashes)
+        
+        # Stage only the changed rows (DDL would implicitly commit, so do it before BEGIN)
+        stage_table = None
+        if not new_rows.empty:
+            stage_table = f"{full_table_name}_STAGE_{uuid.uuid4().hex[:8].upper()}"
+            cursor.execute(f"CREATE TEMPORARY TABLE {stage_table} ({', '.join(columns_def)}, EDGE_HASH VARCHAR(32))")
+            insert_dataframe(cursor, stage_table, new_rows)
+        
+        inserted, expired = 0, 0
+        cursor.execute("SET SAVE_TIMESTAMP = CURRENT_TIMESTAMP()")
+        cursor.execute("BEGIN")
+        if stage_table:
+            # MERGE the staged rows in as current edges
+            column_list = ', '.join(f'"{col}"' for col in df.columns)
+            source_list = ', '.join(f's."{col}"' for col in df.columns)
+            cursor.execute(f"""
+            MERGE INTO {full_table_name} t
+            USING {stage_table} s
+            ON t.EDGE_HASH = s.EDGE_HASH AND t.VALID_TO IS NULL
+            WHEN NOT MATCHED THEN INSERT ({column_list}, EDGE_HASH, VALID_FROM, VALID_TO)
+            VALUES ({source_list}, s.EDGE_HASH, $SAVE_TIMESTAMP, NULL)
+            """)
+            inserted = cursor.rowcount or 0
+        if removed_hashes:
+            # Expire edges that are no longer part of the lineage
+            chunk_size = 1000
+            for i in range(0, len(removed_hashes), chunk_size):
+                hash_list = "', '".join(removed_hashes[i:i + chunk_size])
+                cursor.execute(f"""
+                UPDATE {full_table_name}
+                SET VALID_TO = $SAVE_TIMESTAMP
+                WHERE VALID_TO IS NULL AND EDGE_HASH IN ('{hash_list}')
+                """)
+                expired += cursor.rowcount or 0
+        cursor.execute("COMMIT")
+        if stage_table:
+            cursor.execute(f"DROP TABLE IF EXISTS {stage_table}")
+        return True, {'inserted': inserted, 'expired': expired, 'unchanged': len(batch_hashes) - len(new_rows)}
+    except Exception as e:
+        try:
+            cursor.execute("ROLLBACK")
+        except Exception:
+            pass
+        return False, str(e)
+
+def lineage_object_names(lineage_df):
+    """Unique object names referenced by lineage results"""
+    object_names = set()
+    
+    # Get objects from different columns in lineage results
+    for col in ['OBJECT_NAME', 'SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME']:
+        if col in lineage_df.columns:
+            object_names.update(lineage_df[col].dropna().unique())
+    return object_names
+
+def execute_access_history_query(conn, lineage_df, window_days=7, approximate=False, sample_percent=None):
     """Execute optimized access history query for all objects in lineage results"""
     try:
         if lineage_df is None or lineage_df.empty:
             return None, None
         
         # Extract unique object names from lineage results
-        object_names = set()
-        
-        # Get objects from different columns in lineage results
-        for col in ['OBJECT_NAME', 'SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME']:
-            if col in lineage_df.columns:
-                object_names.update(lineage_df[col].dropna().unique())
+        object_names = lineage_object_names(lineage_df)
         
         if not object_names:
             return None, "No objects found in lineage results"
         
-        # Create optimized query with proper pruning
-        # Use date range filter first for clustering optimization
-        object_list = "', '".join(object_names)
+        # Create optimized query with proper pruning. Sorted objects and a window
+        # bucketed to fixed boundaries keep the SQL text identical across requests,
+        # so Snowflake's result cache can serve repeats
+        start, end = access_window(window_days)
+        if approximate:
+            return approximate_access_history(conn, object_names, start, end, sample_percent)
+        query = build_access_history_query(object_names, start, end)
         
-        query = f"""
+        df = fetch_frame(conn, query, 'access_history')
+        return df, query
+    except Exception as e:
+        st.error(f"Access history query execution failed: {str(e)}")
+        return None, None
+
+def approximate_access_history(conn, object_names, start, end, sample_percent=None):
+    """Whole window as one sketch partition; table-level rows are merged client-side"""
+    records, _ = fetch_access_partition(conn, object_names, start, end, approximate=True, sample_percent=sample_percent)
+    df = reduce_access_partitions(records, approximate=True, sample_percent=sample_percent,
+                                  estimate_users=lambda sketches: combine_hll_sketches(conn, sketches))
+    return df, build_access_partition_query(object_names, start, end, True, sample_percent)
+
+def build_access_history_query(object_names, start, end):
+    """Single-query ACCESS_HISTORY summary for a fixed [start, end) window"""
+    # Use date range filter first for clustering optimization
+    object_list = "', '".join(sorted(object_names))
+    time_filter = access_time_filter(start, end)
+    return f"""
         WITH flattened_access AS (
             SELECT 
                 query_start_time,
@@ -341,7 +1546,7 @@ def execute_access_history_query(conn, lineage_df):
             FROM SNOWFLAKE.ACCOUNT_USAGE.ACCESS_HISTORY,
                  LATERAL FLATTEN(input => direct_objects_accessed) obj,
                  LATERAL FLATTEN(input => obj.value:columns, OUTER => TRUE) col
-            WHERE query_start_time >= DATEADD(day, -7, CURRENT_TIMESTAMP())
+            WHERE {time_filter}
               AND obj.value:objectName::string IN ('{object_list}')
               AND obj.value:objectDomain::string = 'Table'
             
@@ -357,7 +1562,7 @@ def execute_access_history_query(conn, lineage_df):
             FROM SNOWFLAKE.ACCOUNT_USAGE.ACCESS_HISTORY,
                  LATERAL FLATTEN(input => base_objects_accessed) obj,
                  LATERAL FLATTEN(input => obj.value:columns, OUTER => TRUE) col
-            WHERE query_start_time >= DATEADD(day, -7, CURRENT_TIMESTAMP())
+            WHERE {time_filter}
               AND obj.value:objectName::string IN ('{object_list}')
               AND obj.value:objectDomain::string = 'Table'
         ),
@@ -404,34 +1609,1544 @@ def execute_access_history_query(conn, lineage_df):
         
         ORDER BY object_name, column_name
         """
-        
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(results, columns=columns)
-        return df, query
-    except Exception as e:
-        st.error(f"Access history query execution failed: {str(e)}")
-        return None, None
 
-def execute_query(conn, query):
-    """Execute SQL query and return results"""
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(results, columns=columns)
-        return df
-    except Exception as e:
-        st.error(f"Query execution failed: {str(e)}")
-        return None
+def build_access_partition_query(object_names, start, end, approximate=False, sample_percent=None):
+    """Partial ACCESS_HISTORY aggregates for one time partition.
 
-def main():
-    st.title("🔗 Snowflake Lineage Explorer")
-    st.markdown("Explore data lineage relationships in your Snowflake environment using the `GET_LINEAGE` function")
-    
+    Returns one row per (object, column) with mergeable aggregates: the latest
+    access, the row count and the distinct user names seen in the partition.
+    Rows with a NULL column name are table-level accesses without column detail.
+    In approximate mode users come back as an exported HLL sketch instead of a
+    name array, optionally over a SAMPLE ROW of the access history. Sampling
+    picks whole ACCESS_HISTORY rows, each of which flattens into several
+    counted rows, so the sums of squared per-row counts are returned as well
+    for the cluster-sampling variance: ACCESS_COUNT_SQUARES for the column and
+    OBJECT_COUNT_SQUARES, this column's share of the table-level sum.
+    """
+    object_list = "', '".join(sorted(object_names))
+    time_filter = access_time_filter(start, end)
+    sample_clause = f" SAMPLE ROW ({sample_percent:g})" if sample_percent else ""
+    flattened_access = f"""
+        access_rows AS (
+            SELECT query_id, query_start_time, user_name, direct_objects_accessed, base_objects_accessed
+            FROM SNOWFLAKE.ACCOUNT_USAGE.ACCESS_HISTORY{sample_clause}
+            WHERE {time_filter}
+        ),
+        flattened_access AS (
+            SELECT 
+                query_id,
+                query_start_time,
+                user_name,
+                obj.value:objectName::string AS object_name,
+                col.value:columnName::string AS column_name
+            FROM access_rows,
+                 LATERAL FLATTEN(input => direct_objects_accessed) obj,
+                 LATERAL FLATTEN(input => obj.value:columns, OUTER => TRUE) col
+            WHERE obj.value:objectName::string IN ('{object_list}')
+              AND obj.value:objectDomain::string = 'Table'
+            
+            UNION ALL
+            
+            SELECT 
+                query_id,
+                query_start_time,
+                user_name,
+                obj.value:objectName::string AS object_name,
+                col.value:columnName::string AS column_name
+            FROM access_rows,
+                 LATERAL FLATTEN(input => base_objects_accessed) obj,
+                 LATERAL FLATTEN(input => obj.value:columns, OUTER => TRUE) col
+            WHERE obj.value:objectName::string IN ('{object_list}')
+              AND obj.value:objectDomain::string = 'Table'
+        )"""
+    if not approximate:
+        return f"""
+        WITH{flattened_access}
+        SELECT 
+            object_name,
+            column_name,
+            MAX(query_start_time) AS last_accessed,
+            COUNT(*) AS access_count,
+            ARRAY_UNIQUE_AGG(user_name) AS users
+        FROM flattened_access
+        GROUP BY object_name, column_name
+        """
+    return f"""
+        WITH{flattened_access},
+        per_access_row AS (
+            -- One row per sampled ACCESS_HISTORY row (query) and column: the sampling clusters
+            SELECT 
+                object_name,
+                column_name,
+                MAX(query_start_time) AS query_start_time,
+                ANY_VALUE(user_name) AS user_name,
+                COUNT(*) AS row_count,
+                SUM(COUNT(*)) OVER (PARTITION BY query_id, object_name) AS object_row_count
+            FROM flattened_access
+            GROUP BY query_id, object_name, column_name
+        )
+        SELECT 
+            object_name,
+            column_name,
+            MAX(query_start_time) AS last_accessed,
+            SUM(row_count) AS access_count,
+            SUM(row_count * row_count) AS access_count_squares,
+            SUM(row_count * object_row_count) AS object_count_squares,
+            HLL_EXPORT(HLL_ACCUMULATE(user_name)) AS users
+        FROM per_access_row
+        GROUP BY object_name, column_name
+        """
+
+def access_partitions(window_days, now=None):
+    """Daily [start, end) UTC partitions of access_window(window_days, now).
+
+    The first and last days are clipped to the window, so partitioned and
+    single-query analyses cover exactly the same time range.
+    """
+    start, end = access_window(window_days, now)
+    partitions = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        next_day = day + timedelta(days=1)
+        partitions.append((max(day, start), min(next_day, end)))
+        day = next_day
+    return partitions
+
+def access_partition_cache_path(scope, start, approximate=False, sample_percent=None):
+    """Cache file for one closed day, isolated by role scope and aggregation mode"""
+    scope_hash = hashlib.sha256(repr(scope).encode()).hexdigest()[:16]
+    variant = (f"_sketch_sample{sample_percent:g}" if sample_percent else "_sketch") if approximate else ""
+    return os.path.join(ACCESS_PARTITION_CACHE_DIR, scope_hash, f"{start.strftime('%Y-%m-%d')}{variant}.pkl")
+
+def read_access_partition_cache(path):
+    """Cached per-object partial aggregates for a day ({object_name: [records]})"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+def write_access_partition_cache(path, cached_objects):
+    # The app loads these pickles back, so only its own user may write them
+    make_private_dirs(ACCESS_PARTITION_CACHE_DIR, os.path.dirname(path))
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(cached_objects, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def fetch_access_partition(conn, object_names, start, end, cache_path=None, approximate=False, sample_percent=None):
+    """Map step: partial aggregates for one partition, served from cache where possible.
+
+    Returns (records, number_of_objects_queried). Only objects missing from the
+    day's cache are queried, so widening the object set or the window reuses
+    every day that was already computed.
+    """
+    cached_objects = read_access_partition_cache(cache_path) if cache_path else {}
+    missing = sorted(name for name in object_names if name not in cached_objects)
+    if missing:
+        query = build_access_partition_query(missing, start, end, approximate, sample_percent)
+        df = fetch_frame(conn, query, 'access_history_partition')
+        fetched = {name: [] for name in missing}
+        for record in df.to_dict(orient='records'):
+            users = record.pop('USERS')
+            users = json.loads(users) if isinstance(users, str) else users
+            # Sketches stay in HLL_EXPORT form; they are merged by Snowflake in the reduce step
+            record['USERS'] = users if approximate else set(users or [])
+            fetched.setdefault(record['OBJECT_NAME'], []).append(record)
+        if cache_path:
+            cached_objects.update(fetched)
+            write_access_partition_cache(cache_path, cached_objects)
+        else:
+            cached_objects = {**cached_objects, **fetched}
+    records = [record for name in object_names for record in cached_objects.get(name, [])]
+    return records, len(missing)
+
+def reduce_access_partitions(records, approximate=False, sample_percent=None, estimate_users=None):
+    """Reduce step: merge partial aggregates into per-column and table-level summaries.
+
+    Approximate records carry exported HLL sketches; estimate_users maps
+    {key: [sketches]} to {key: estimated distinct users} (see
+    combine_hll_sketches). Their summaries add ~95% error bounds:
+    UNIQUE_USERS_ERROR from the sketch and ACCESS_COUNT_ERROR from the
+    sampling rate (counts are scaled up to the full population; with
+    sampling, unique users and last access are lower bounds).
+    """
+    columns = ['OBJECT_NAME', 'COLUMN_NAME', 'LAST_ACCESSED_DATE', 'LAST_ACCESSED', 'UNIQUE_USERS', 'ACCESS_COUNT']
+    merged = {}
+    for record in records:
+        keys = [(record['OBJECT_NAME'], 'TABLE_LEVEL')]
+        if record['COLUMN_NAME'] is not None:
+            keys.append((record['OBJECT_NAME'], record['COLUMN_NAME']))
+        for key in keys:
+            summary = merged.get(key)
+            if summary is None:
+                summary = merged[key] = {'last_accessed': None, 'count': 0, 'squares': 0,
+                                         'users': [] if approximate else set()}
+            if approximate:
+                if record['USERS']:
+                    summary['users'].append(record['USERS'])
+                summary['squares'] += record['OBJECT_COUNT_SQUARES' if key[1] == 'TABLE_LEVEL' else 'ACCESS_COUNT_SQUARES']
+            else:
+                summary['users'] |= record['USERS']
+            if summary['last_accessed'] is None or record['LAST_ACCESSED'] > summary['last_accessed']:
+                summary['last_accessed'] = record['LAST_ACCESSED']
+            summary['count'] += record['ACCESS_COUNT']
+    if not approximate:
+        rows = [
+            (object_name, column_name, summary['last_accessed'].date(), summary['last_accessed'],
+             len(summary['users']), summary['count'])
+            for (object_name, column_name), summary in sorted(merged.items())
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+    estimates = estimate_users({key: summary['users'] for key, summary in merged.items() if summary['users']}) if merged else {}
+    fraction = sample_percent / 100 if sample_percent else 1.0
+    rows = []
+    for key, summary in sorted(merged.items()):
+        users = estimates.get(key, 0)
+        count = summary['count'] / fraction
+        # Each sampled ACCESS_HISTORY row is a cluster of y_i counted rows:
+        # Var(sum(y_i) / p) is estimated by (1 - p) / p^2 * sum(y_i^2)
+        count_error = ERROR_BOUND_Z * (summary['squares'] * (1 - fraction)) ** 0.5 / fraction
+        rows.append((key[0], key[1], summary['last_accessed'].date(), summary['last_accessed'],
+                     int(round(users)), int(round(count)),
+                     int(round(ERROR_BOUND_Z * ACCESS_HLL_STANDARD_ERROR * users)), int(round(count_error))))
+    return pd.DataFrame(rows, columns=columns + ['UNIQUE_USERS_ERROR', 'ACCESS_COUNT_ERROR'])
+
+def combine_hll_sketches(conn, sketches, max_statement_bytes=HLL_COMBINE_BATCH_BYTES):
+    """Merge exported HLL sketches per key in Snowflake; returns {key: estimated cardinality}.
+
+    Sketches go back through HLL_IMPORT/HLL_COMBINE, so the merge and the
+    estimate use Snowflake's own sketch format and precision. Estimates are
+    per key, so keys are spread over as many statements as needed; only a
+    key whose own sketches don't fit one statement is first combined in
+    batches, in rounds, until they do.
+    """
+    keys = list(sketches)
+    pending = {position: [json.dumps(sketch, separators=(',', ':')) for sketch in sketches[key]]
+               for position, key in enumerate(keys) if sketches[key]}
+
+    def run(batch, final):
+        values = ",\n".join(
+            f"({position}, '{sketch.replace(chr(92), chr(92) * 2).replace(chr(39), chr(39) * 2)}')"
+            for position, sketch in batch
+        )
+        combined = "HLL_COMBINE(HLL_IMPORT(PARSE_JSON(column2)))"
+        result = f"HLL_ESTIMATE({combined}) AS estimate" if final else f"HLL_EXPORT({combined}) AS sketch"
+        df = fetch_frame(conn, f"SELECT column1 AS sketch_key, {result} FROM VALUES\n{values}\nGROUP BY column1",
+                         'access_history_hll')
+        return df.to_dict(orient='records')
+
+    def pack(groups):
+        """Batches of whole groups of (position, sketch) items, each within max_statement_bytes unless one group alone exceeds it"""
+        batch, size = [], 0
+        for group in groups:
+            group_size = sum(len(sketch) for _, sketch in group)
+            if batch and size + group_size > max_statement_bytes:
+                yield batch
+                batch, size = [], 0
+            batch.extend(group)
+            size += group_size
+        if batch:
+            yield batch
+
+    estimates = {}
+    while pending:
+        # A single sketch can't get any smaller, so it is estimated even when it is over the limit
+        ready = [position for position, group in pending.items()
+                 if len(group) == 1 or sum(len(sketch) for sketch in group) <= max_statement_bytes]
+        for batch in pack([[(position, sketch) for sketch in pending.pop(position)] for position in ready]):
+            for row in run(batch, final=True):
+                estimates[keys[int(row['SKETCH_KEY'])]] = float(row['ESTIMATE'])
+        for position, group in pending.items():
+            combined = []
+            for batch in pack([[(position, sketch)] for sketch in group]):
+                for row in run(batch, final=False):
+                    sketch = row['SKETCH']
+                    combined.append(sketch if isinstance(sketch, str) else json.dumps(sketch, separators=(',', ':')))
+            if len(combined) >= len(group):
+                raise ValueError("HLL sketches are too large to merge within HLL_COMBINE_BATCH_BYTES")
+            pending[position] = combined
+    return estimates
+
+def execute_partitioned_access_history(conn, lineage_df, window_days, max_workers=4, progress=None,
+                                      approximate=False, sample_percent=None):
+    """Access history over long windows as parallel daily map-reduce"""
+    try:
+        return partitioned_access_history(conn, lineage_df, window_days, st.session_state.get('cache_scope'),
+                                          max_workers, progress, approximate, sample_percent)
+    except Exception as e:
+        st.error(f"Access history query execution failed: {str(e)}")
+        return None, None
+
+def partitioned_access_history(conn, lineage_df, window_days, scope, max_workers=4, progress=None,
+                               approximate=False, sample_percent=None):
+    """Run the daily access-history partitions and merge them (raises on failure).
+
+    Each day runs as its own query on a thread pool; closed days are cached on
+    disk per role, so repeating or extending an analysis only queries new days.
+    """
+    if lineage_df is None or lineage_df.empty:
+        return None, None
+    object_names = lineage_object_names(lineage_df)
+    if not object_names:
+        return None, "No objects found in lineage results"
+
+    now = datetime.now(timezone.utc)
+    closed_before = now - timedelta(hours=ACCESS_HISTORY_LATENCY_HOURS)
+    # The window ends on a bucket boundary so today's SQL stays cacheable too
+    partitions = access_partitions(window_days, now)
+
+    def run_partition(partition):
+        start, end = partition
+        # Only whole days that can no longer change are cached; the clipped first day moves with the window
+        cache_path = (access_partition_cache_path(scope, start, approximate, sample_percent)
+                      if scope is not None and end - start == timedelta(days=1) and end <= closed_before else None)
+        return fetch_access_partition(conn, object_names, start, end, cache_path, approximate, sample_percent)
+
+    records, queried_partitions = [], 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_partition, partition) for partition in partitions]
+        for done, future in enumerate(futures, start=1):
+            partition_records, queried = future.result()
+            records.extend(partition_records)
+            queried_partitions += 1 if queried else 0
+            if progress:
+                progress(done, len(partitions))
+
+    df = reduce_access_partitions(records, approximate, sample_percent,
+                                  estimate_users=lambda sketches: combine_hll_sketches(conn, sketches))
+    start, end = partitions[-1]
+    summary = (f"-- {len(partitions)} daily partitions, {queried_partitions} queried, "
+               f"{len(partitions) - queried_partitions} served from cache\n"
+               f"-- Partition query template (today's partition):"
+               + build_access_partition_query(object_names, start, end, approximate, sample_percent))
+    return df, summary
+
+def execute_query(conn, query):
+    """Execute SQL query and return results"""
+    try:
+        return fetch_frame(conn, query, 'custom_query')
+    except Exception as e:
+        st.error(f"Query execution failed: {str(e)}")
+        return None
+
+def run_lineage_cached(object_name, object_type, direction, depth):
+    """GET_LINEAGE through the shared cache; returns (df, query, seconds).
+
+    seconds is None when the result came from the cache, since the time to
+    read it says nothing about how long the query takes.
+    """
+    started = time.perf_counter()
+    loaded = []
+    def load():
+        loaded.append(True)
+        return compact_lineage_result(execute_lineage_query(
+            st.session_state.connection,
+            object_name,
+            object_type,
+            direction,
+            depth
+        ))
+    # Identical requests from sessions with the same role share one result
+    df, query = load_cached(
+        'lineage', [object_name, object_type, direction, depth],
+        load,
+        should_store=is_successful_query
+    )
+    return df, query, (time.perf_counter() - started if loaded else None)
+
+def lineage_runner(conn, scope):
+    """run_lineage_cached for code running outside the script thread (raises on failure).
+
+    Uses the given connection and role scope instead of session state, and the
+    same shared cache keys, so background and interactive runs reuse each other's results.
+    """
+    def run_lineage(object_name, object_type, direction, depth):
+        started = time.perf_counter()
+        loaded = []
+        def load():
+            loaded.append(True)
+            query = build_lineage_query(object_name, object_type, direction, depth)
+            return compact_lineage_result((fetch_frame(conn, query, 'lineage'), query))
+        if scope is None:
+            df, query = load()
+        else:
+            df, query = get_shared_cache().get_or_load(
+                (scope, 'lineage', object_name, object_type, direction, depth), load, is_successful_query
+            )
+        return df, query, (time.perf_counter() - started if loaded else None)
+    return run_lineage
+
+def node_distances(df, root):
+    """Distance and direction of every node reached from root in a lineage result.
+
+    Returns {node: (distance, 'DOWNSTREAM' | 'UPSTREAM')}, working for
+    DOWNSTREAM, UPSTREAM and BOTH results alike.
+    """
+    sources = qualified_node_names(df, 'SOURCE')
+    targets = qualified_node_names(df, 'TARGET')
+    distances = {root: (0, None)}
+    if sources is None or targets is None or 'DISTANCE' not in df.columns:
+        return distances
+    order = np.argsort(df['DISTANCE'].to_numpy(), kind='stable')
+    source_values, target_values = sources.to_numpy(), targets.to_numpy()
+    distance_values = df['DISTANCE'].to_numpy()
+    for i in order:
+        source, target, distance = source_values[i], target_values[i], int(distance_values[i])
+        if source in distances and target not in distances:
+            distances[target] = (distance, 'DOWNSTREAM')
+        elif target in distances and source not in distances:
+            distances[source] = (distance, 'UPSTREAM')
+    return distances
+
+def truncated_branches(df, root, depth):
+    """Nodes at the depth limit whose lineage may continue ({node: direction})"""
+    if df is None or df.empty or 'DISTANCE' not in df.columns or df['DISTANCE'].max() < depth:
+        return {}
+    return {node: node_direction for node, (distance, node_direction) in node_distances(df, root).items()
+            if distance >= depth and node_direction}
+
+def project_lineage_size(level_edges, level_nodes, depth):
+    """Projected cumulative (edges, nodes) at a depth from per-level probe counts"""
+    probe_depth = len(level_edges)
+    edges, nodes = sum(level_edges[:depth]), sum(level_nodes[:depth])
+    if depth <= probe_depth or not level_edges[-1]:
+        return edges, nodes
+    # Extrapolate with the fan-out observed between the last two probed levels
+    edge_growth = level_edges[-1] / level_edges[-2] if probe_depth > 1 and level_edges[-2] else 1.0
+    node_growth = level_nodes[-1] / level_nodes[-2] if probe_depth > 1 and level_nodes[-2] else 1.0
+    next_edges, next_nodes = level_edges[-1], level_nodes[-1]
+    for _ in range(probe_depth, depth):
+        next_edges *= edge_growth
+        next_nodes *= node_growth
+        edges += next_edges
+        nodes += next_nodes
+    return int(edges), int(nodes)
+
+def explore_lineage_adaptive(object_name, object_type, direction, max_nodes, max_edges, max_seconds,
+                             run_lineage=run_lineage_cached):
+    """Probe shallow fan-out, then run GET_LINEAGE at the deepest level that fits the budget.
+
+    Returns (df, query, report) where report explains the chosen depth and lists
+    the branches that were cut off at that depth.
+    """
+    probe_df, probe_query, probe_seconds = run_lineage(object_name, object_type, direction, ADAPTIVE_PROBE_DEPTH)
+    if probe_df is None:
+        return None, None, None
+
+    distances = node_distances(probe_df, object_name)
+    level_edges = [int((probe_df['DISTANCE'] == d).sum()) if 'DISTANCE' in probe_df.columns else len(probe_df)
+                   for d in range(1, ADAPTIVE_PROBE_DEPTH + 1)]
+    level_nodes = [sum(1 for distance, _ in distances.values() if distance == d) for d in range(1, ADAPTIVE_PROBE_DEPTH + 1)]
+    # A probe served from the cache wasn't timed, so the time budget can't be projected
+    seconds_per_edge = probe_seconds / max(len(probe_df), 1) if probe_seconds is not None else None
+
+    report = {'level_edges': level_edges, 'probe_seconds': probe_seconds, 'limited_by': None}
+    if not truncated_branches(probe_df, object_name, ADAPTIVE_PROBE_DEPTH):
+        # The probe already reached the end of the lineage
+        chosen_depth = ADAPTIVE_PROBE_DEPTH
+        report['limited_by'] = 'end of lineage'
+    else:
+        chosen_depth = 1
+        for candidate in range(1, GET_LINEAGE_MAX_DEPTH + 1):
+            edges, nodes = project_lineage_size(level_edges, level_nodes, candidate)
+            limits = [
+                ('nodes', nodes > max_nodes),
+                ('edges', edges > max_edges),
+                ('seconds', seconds_per_edge is not None and edges * seconds_per_edge > max_seconds),
+            ]
+            exceeded = [name for name, over in limits if over]
+            if exceeded:
+                report['limited_by'] = ", ".join(exceeded)
+                break
+            chosen_depth = candidate
+        else:
+            report['limited_by'] = 'GET_LINEAGE maximum depth'
+    report['chosen_depth'] = chosen_depth
+    report['projected_edges'], report['projected_nodes'] = project_lineage_size(level_edges, level_nodes, chosen_depth)
+
+    if chosen_depth <= ADAPTIVE_PROBE_DEPTH:
+        df = probe_df[probe_df['DISTANCE'] <= chosen_depth] if 'DISTANCE' in probe_df.columns else probe_df
+        query = probe_query
+    else:
+        df, query, _ = run_lineage(object_name, object_type, direction, chosen_depth)
+        if df is None:
+            return None, None, None
+    report['truncated'] = truncated_branches(df, object_name, chosen_depth)
+    return df, query, report
+
+def expand_truncated_branches(results, nodes):
+    """Continue lineage from truncated branch nodes and merge it into the results"""
+    report = results['adaptive_report']
+    depth = report['chosen_depth']
+    frames = [results['df']]
+    distances = node_distances(results['df'], results['object_name'])
+    for node in nodes:
+        node_direction = report['truncated'].pop(node, None)
+        if node_direction is None:
+            continue
+        branch_df, _, _ = run_lineage_cached(node, lineage_object_type(node), node_direction, depth)
+        if branch_df is None or branch_df.empty:
+            continue
+        branch_distance = distances.get(node, (depth, None))[0]
+        branch_df = branch_df.copy()
+        if 'DISTANCE' in branch_df.columns:
+            # Re-base distances so they are measured from the analysed object
+            branch_df['DISTANCE'] = branch_df['DISTANCE'].astype('int64') + branch_distance
+        frames.append(branch_df)
+        for branch_node, branch_direction in truncated_branches(branch_df, node, depth + branch_distance).items():
+            report['truncated'][branch_node] = branch_direction
+    merged = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    results['df'] = compact_frame(merged)
+
+def fully_explored_nodes(df, depth):
+    """Nodes of a DOWNSTREAM result whose entire downstream closure is in the result.
+
+    A node is truncated if its subtree reaches the depth limit; everything else
+    was traversed to the end and never needs its own GET_LINEAGE call.
+    """
+    sources = qualified_node_names(df, 'SOURCE')
+    targets = qualified_node_names(df, 'TARGET')
+    if sources is None or targets is None or df.empty:
+        return set()
+    reached = set(sources) | set(targets)
+    if 'DISTANCE' not in df.columns or df['DISTANCE'].max() < depth:
+        return reached
+
+    parents = {}
+    for source, target in zip(sources, targets):
+        parents.setdefault(target, set()).add(source)
+    at_limit = df['DISTANCE'] >= depth
+    truncated = set(sources[at_limit]) | set(targets[at_limit])
+    frontier = list(truncated)
+    while frontier:
+        node = frontier.pop()
+        for parent in parents.get(node, ()):
+            if parent not in truncated:
+                truncated.add(parent)
+                frontier.append(parent)
+    return reached - truncated
+
+class WarehouseRateLimiter:
+    """Token-bucket limiter that backs off while the warehouse is queueing queries"""
+
+    def __init__(self, conn, queries_per_second, check_interval=10):
+        self.conn = conn
+        self.max_rate = queries_per_second
+        self.rate = queries_per_second
+        self.check_interval = check_interval
+        self._next_slot = time.monotonic()
+        self._last_check = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_check > self.check_interval:
+                self._last_check = now
+                self._adjust_rate()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + 1.0 / self.rate
+        time.sleep(max(0, slot - time.monotonic()))
+
+    def _adjust_rate(self):
+        """Halve the rate while queries queue on the warehouse, recover slowly otherwise"""
+        queued = warehouse_queued_queries(self.conn)
+        if queued:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+        else:
+            self.rate = min(self.max_rate, self.rate * 1.25)
+
+def warehouse_queued_queries(conn):
+    """Number of queries queued on the current warehouse (0 if unknown)"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT CURRENT_WAREHOUSE()")
+        warehouse = cursor.fetchone()[0]
+        if not warehouse:
+            return 0
+        cursor.execute(f"SHOW WAREHOUSES LIKE '{warehouse}'")
+        columns = [desc[0].lower() for desc in cursor.description]
+        row = cursor.fetchone()
+        if row and 'queued' in columns:
+            return int(row[columns.index('queued')] or 0)
+    except Exception:
+        pass  # Rate limiting still applies without warehouse load information
+    return 0
+
+def warehouse_concurrency_limit(conn, default=8):
+    """MAX_CONCURRENCY_LEVEL of the current warehouse, used to cap crawl workers"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT CURRENT_WAREHOUSE()")
+        warehouse = cursor.fetchone()[0]
+        cursor.execute(f"SHOW PARAMETERS LIKE 'MAX_CONCURRENCY_LEVEL' IN WAREHOUSE {warehouse}")
+        columns = [desc[0].lower() for desc in cursor.description]
+        row = cursor.fetchone()
+        return int(row[columns.index('value')])
+    except Exception:
+        return default
+
+CRAWL_LIST_FIELDS = ('enumerated_schemas', 'objects', 'completed', 'covered')
+CRAWL_DICT_FIELDS = ('failed', 'failed_listings')
+
+def apply_crawl_progress(state, record):
+    """Apply one progress record to a crawl state: list fields are extended, dict fields updated (None removes a key)"""
+    for field, value in record.items():
+        if field in CRAWL_LIST_FIELDS:
+            state.setdefault(field, []).extend(value)
+        elif field in CRAWL_DICT_FIELDS:
+            entries = state.setdefault(field, {})
+            for key, item in value.items():
+                if item is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = item
+        else:
+            state[field] = value
+
+def load_crawl_state(checkpoint_dir):
+    """A crawl's checkpoint: state.json plus the progress.jsonl records appended since it was written, or None"""
+    state_path = os.path.join(checkpoint_dir, 'state.json')
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    try:
+        with open(os.path.join(checkpoint_dir, 'progress.jsonl')) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Skip a line left half-written by an interrupted crawl
+                apply_crawl_progress(state, record)
+    except FileNotFoundError:
+        pass
+    # A crash between rewriting state.json and emptying the log replays some records twice
+    for field in CRAWL_LIST_FIELDS:
+        state[field] = list(dict.fromkeys(state.get(field, [])))
+    return state
+
+class LineageCrawler:
+    """Checkpointed, resumable DOWNSTREAM lineage crawl over every table and view.
+
+    Progress lives in <checkpoint_dir>/state.json and the collected edges in
+    edges.jsonl, so a restarted crawl only processes objects not completed yet.
+    Updates are appended to progress.jsonl and folded into state.json every
+    CRAWL_COMPACT_RECORDS records, so checkpointing costs the same per batch
+    however large the account is. Objects whose downstream lineage was fully
+    returned by an earlier call are skipped, since their edges are already
+    part of that result.
+    """
+
+    def __init__(self, conn, checkpoint_dir, scope, max_workers=4, queries_per_second=2.0):
+        self.conn = conn
+        self.checkpoint_dir = checkpoint_dir
+        self.state_path = os.path.join(checkpoint_dir, 'state.json')
+        self.progress_path = os.path.join(checkpoint_dir, 'progress.jsonl')
+        self.edges_path = os.path.join(checkpoint_dir, 'edges.jsonl')
+        self.max_workers = max(1, min(max_workers, warehouse_concurrency_limit(conn)))
+        self.rate_limiter = WarehouseRateLimiter(conn, queries_per_second)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.state = self._load_state(scope)
+        # Start from an empty log, so a line left half-written by a crash isn't appended to
+        self._save_state()
+
+    def _load_state(self, scope):
+        state = {
+            'scope': list(scope) if scope else None,
+            'enumerated_schemas': [],
+            'enumeration_complete': False,
+            'objects': [],
+            'completed': [],
+            'covered': [],
+            'failed': {},
+            'failed_listings': {},
+        }
+        saved = load_crawl_state(self.checkpoint_dir)
+        if saved is not None:
+            if saved.get('scope') != state['scope']:
+                raise ValueError("This checkpoint was created with a different role. Reset it or choose another crawl name.")
+            state.update(saved)
+        return state
+
+    def _save_state(self):
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+        # Its records are part of state.json now
+        open(self.progress_path, 'w').close()
+        self._progress_records = 0
+
+    def _record(self, record):
+        """Apply an update to the state and append it to the progress log"""
+        apply_crawl_progress(self.state, record)
+        with open(self.progress_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self._progress_records += 1
+        if self._progress_records >= CRAWL_COMPACT_RECORDS:
+            self._save_state()
+
+    def enumerate_objects(self, databases=None, progress=None):
+        """List every table/view, checkpointing after each schema.
+
+        A database or schema whose listing fails is recorded in
+        'failed_listings' and not checkpointed, so resuming lists it again.
+        """
+        if self.state['enumeration_complete']:
+            return
+        done_schemas = set(self.state['enumerated_schemas'])
+        known_objects = set(self.state['objects'])
+        failed_listings = self.state.setdefault('failed_listings', {})
+        all_databases = databases or show_database_names(self.conn)
+        for db_position, database in enumerate(all_databases):
+            try:
+                schemas = show_schema_names(self.conn, database)
+            except Exception as e:
+                self._record({'failed_listings': {database: str(e)}})
+                schemas = []
+            else:
+                if database in failed_listings:
+                    self._record({'failed_listings': {database: None}})
+            for schema in schemas:
+                schema_key = f"{database}.{schema}"
+                if schema_key in done_schemas:
+                    continue
+                listing = table_listing(database, schema)
+                try:
+                    while not listing.complete:
+                        listing.load_more(self.conn)
+                except Exception as e:
+                    self._record({'failed_listings': {schema_key: str(e)}})
+                    continue
+                new_objects = []
+                for table in listing.names:
+                    object_name = f"{database}.{schema}.{table}"
+                    if object_name not in known_objects:
+                        known_objects.add(object_name)
+                        new_objects.append(object_name)
+                self._record({
+                    'objects': new_objects,
+                    'enumerated_schemas': [schema_key],
+                    'failed_listings': {schema_key: None},
+                })
+                done_schemas.add(schema_key)
+            if progress:
+                progress(db_position + 1, len(all_databases))
+        self.state['enumeration_complete'] = not failed_listings
+        self._save_state()
+
+    def _crawl_object(self, object_name):
+        self.rate_limiter.acquire()
+        query = build_lineage_query(object_name, 'table', 'DOWNSTREAM', CRAWL_DEPTH)
+        return fetch_frame(self.conn, query, 'lineage_crawl')
+
+    def run(self, progress=None, should_stop=None):
+        """Crawl pending objects with bounded concurrency; returns crawl statistics"""
+        completed = set(self.state['completed'])
+        covered = set(self.state['covered'])
+        pending = [name for name in self.state['objects'] if name not in completed]
+        total = len(self.state['objects'])
+        skipped = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {}
+            while pending or in_flight:
+                update = {'completed': [], 'covered': [], 'failed': {}}
+                while pending and len(in_flight) < self.max_workers:
+                    if should_stop and should_stop():
+                        pending = []
+                        break
+                    object_name = pending.pop(0)
+                    if object_name in covered:
+                        # Already reached through an earlier, fully explored result
+                        completed.add(object_name)
+                        update['completed'].append(object_name)
+                        skipped += 1
+                        continue
+                    in_flight[executor.submit(self._crawl_object, object_name)] = object_name
+                if not in_flight:
+                    if update['completed']:
+                        self._record(update)
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    object_name = in_flight.pop(future)
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        # Leave it out of 'completed' so a resumed crawl retries it
+                        update['failed'][object_name] = str(e)
+                        continue
+                    if not df.empty:
+                        with open(self.edges_path, 'a') as f:
+                            for record in df.to_dict(orient='records'):
+                                f.write(json.dumps(record, default=str) + '\n')
+                    newly_covered = fully_explored_nodes(df, CRAWL_DEPTH) - covered
+                    covered.update(newly_covered)
+                    update['covered'].extend(newly_covered)
+                    completed.add(object_name)
+                    update['completed'].append(object_name)
+                    if object_name in self.state['failed']:
+                        update['failed'][object_name] = None
+                self._record(update)
+                if progress:
+                    progress(len(completed), total)
+
+        self._save_state()
+        return {
+            'objects': total,
+            'completed': len(completed),
+            'skipped': skipped,
+            'failed': len(self.state['failed']),
+            'failed_listings': len(self.state['failed_listings']),
+        }
+
+def lineage_object_type(object_name):
+    """GET_LINEAGE object type for a fully qualified name (DB.SCHEMA.TABLE[.COLUMN])"""
+    return 'column' if object_name.count('.') >= 3 else 'table'
+
+def fetch_neighbours(conn, nodes, direction, known_forward=None, batch_size=50):
+    """Direct (distance 1) neighbours of each node in one lineage direction.
+
+    Neighbour lists are taken from known_forward (complete crawl adjacency) or
+    the shared cache when possible; the rest are fetched with batched
+    GET_LINEAGE calls and cached for other sessions with the same role.
+    Returns (neighbours, number_of_nodes_fetched_from_snowflake).
+    """
+    neighbours = {}
+    scope = st.session_state.get('cache_scope')
+    cache = get_shared_cache() if scope is not None else None
+    missing = []
+    for node in sorted(nodes):
+        if direction == 'DOWNSTREAM' and known_forward is not None and node in known_forward:
+            neighbours[node] = known_forward[node]
+            continue
+        cached = cache.get((scope, 'neighbours', node, direction)) if cache else None
+        if cached is not None:
+            neighbours[node] = cached
+        else:
+            missing.append(node)
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        query = "\nUNION ALL\n".join(
+            f"SELECT '{node}' AS LINEAGE_ORIGIN, * FROM TABLE (SNOWFLAKE.CORE.GET_LINEAGE('{node}', '{lineage_object_type(node)}', '{direction}', 1))"
+            for node in batch
+        )
+        df = fetch_frame(conn, query, 'lineage_neighbours')
+        found = {node: set() for node in batch}
+        if not df.empty:
+            other_side = qualified_node_names(df, 'TARGET' if direction == 'DOWNSTREAM' else 'SOURCE')
+            for origin, neighbour in zip(df['LINEAGE_ORIGIN'], other_side):
+                if neighbour != origin:
+                    found[origin].add(neighbour)
+        for node, node_neighbours in found.items():
+            neighbours[node] = frozenset(node_neighbours)
+            if cache:
+                cache.put((scope, 'neighbours', node, direction), neighbours[node])
+    return neighbours, len(missing)
+
+def find_shortest_paths(conn, source, target, max_length=10, known_forward=None):
+    """All shortest downstream lineage paths from source to target.
+
+    Runs a bidirectional breadth-first search: the smaller frontier is expanded
+    one level at a time (DOWNSTREAM from the source side, UPSTREAM from the
+    target side) and the search stops as soon as the two frontiers meet.
+    """
+    stats = {'nodes_fetched': 0, 'nodes_visited': 2, 'levels': 0}
+    if source == target:
+        return [[source]], stats
+
+    forward_dist, backward_dist = {source: 0}, {target: 0}
+    forward_parents, backward_parents = {source: set()}, {target: set()}
+    forward_frontier, backward_frontier = [source], [target]
+
+    while forward_frontier and backward_frontier and stats['levels'] < max_length:
+        stats['levels'] += 1
+        expand_forward = len(forward_frontier) <= len(backward_frontier)
+        if expand_forward:
+            frontier, dist, parents = forward_frontier, forward_dist, forward_parents
+            direction = 'DOWNSTREAM'
+        else:
+            frontier, dist, parents = backward_frontier, backward_dist, backward_parents
+            direction = 'UPSTREAM'
+
+        neighbours, fetched = fetch_neighbours(conn, frontier, direction, known_forward)
+        stats['nodes_fetched'] += fetched
+        next_frontier = []
+        for node in frontier:
+            for neighbour in neighbours.get(node, ()):
+                if neighbour not in dist:
+                    dist[neighbour] = dist[node] + 1
+                    parents[neighbour] = set()
+                    next_frontier.append(neighbour)
+                if dist[neighbour] == dist[node] + 1:
+                    parents[neighbour].add(node)
+        stats['nodes_visited'] += len(next_frontier)
+        if expand_forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+        meeting = set(forward_dist) & set(backward_dist)
+        if meeting:
+            length = min(forward_dist[m] + backward_dist[m] for m in meeting)
+            meeting = [m for m in meeting if forward_dist[m] + backward_dist[m] == length]
+            paths = set()
+            for m in meeting:
+                for head in _expand_paths(m, forward_parents):
+                    for tail in _expand_paths(m, backward_parents):
+                        paths.add(tuple(head[::-1] + tail[1:]))
+            return sorted(list(path) for path in paths), stats
+
+    return [], stats
+
+def _expand_paths(node, parents):
+    """Every chain from node back to the search origin, following parent links"""
+    if not parents.get(node):
+        return [[node]]
+    return [[node] + rest for parent in parents[node] for rest in _expand_paths(parent, parents)]
+
+def crawl_forward_adjacency(checkpoint_dir):
+    """Complete downstream adjacency for nodes a crawl fully explored"""
+    edges = load_crawl_edges(checkpoint_dir)
+    state = load_crawl_state(checkpoint_dir) if not edges.empty else None
+    if state is None:
+        return None
+    complete = set(state.get('completed', [])) | set(state.get('covered', []))
+    adjacency = {node: set() for node in complete}
+    sources = qualified_node_names(edges, 'SOURCE')
+    targets = qualified_node_names(edges, 'TARGET')
+    if sources is None or targets is None:
+        return None
+    for source, target in zip(sources, targets):
+        if source in adjacency:
+            adjacency[source].add(target)
+    return {node: frozenset(children) for node, children in adjacency.items()}
+
+def render_path_finder(default_source):
+    """Path query UI: all shortest lineage paths between two objects"""
+    st.markdown("**🧭 Path Between Two Objects**")
+    col_path1, col_path2 = st.columns(2)
+    with col_path1:
+        path_source = st.text_input("Source Object *", value=default_source,
+                                    help="Fully qualified name, e.g. RAW.SALES.ORDERS (or DB.SCHEMA.TABLE.COLUMN)")
+    with col_path2:
+        path_target = st.text_input("Target Object *", placeholder="MART.REPORTING.DAILY_SALES",
+                                    help="Fully qualified name of the downstream object")
+    col_path3, col_path4 = st.columns(2)
+    with col_path3:
+        max_length = st.slider("Max Path Length", min_value=1, max_value=20, value=10)
+    with col_path4:
+        crawl_name = st.text_input("Use Crawl Data (optional)", value="",
+                                   help="Name of an account crawl whose edges can replace GET_LINEAGE calls")
+
+    # The reachability index answers instantly for lineage that is already known
+    reachability = session_reachability_index()
+    if path_source and path_target and path_source.strip() in reachability and path_target.strip() in reachability:
+        if reachability.reaches(path_source.strip(), path_target.strip()):
+            st.caption(f"⚡ Known lineage: `{path_target.strip()}` is downstream of `{path_source.strip()}`")
+        else:
+            st.caption(f"⚡ Known lineage has no path from `{path_source.strip()}` to `{path_target.strip()}` (lineage not yet crawled or explored may still connect them)")
+
+    if st.button("🧭 Find Paths", type="primary"):
+        if not (path_source and path_target):
+            st.error("Please enter both a source and a target object")
+            return
+        known_forward = crawl_forward_adjacency(crawl_checkpoint_path(crawl_name)) if crawl_name else None
+        with st.spinner(f"Searching paths from {path_source} to {path_target}..."):
+            try:
+                paths, stats = find_shortest_paths(
+                    st.session_state.connection,
+                    path_source.strip(),
+                    path_target.strip(),
+                    max_length=max_length,
+                    known_forward=known_forward
+                )
+            except Exception as e:
+                st.error(f"Path search failed: {str(e)}")
+                return
+        st.session_state.path_results = {'source': path_source, 'target': path_target, 'paths': paths, 'stats': stats}
+
+    path_results = st.session_state.get('path_results')
+    if path_results:
+        stats = path_results['stats']
+        if path_results['paths']:
+            st.success(f"✅ Found {len(path_results['paths'])} shortest path(s) of length {len(path_results['paths'][0]) - 1}")
+        else:
+            st.info(f"No downstream path from `{path_results['source']}` to `{path_results['target']}` within the search limit.")
+        st.caption(f"Searched {stats['levels']} level(s) • {stats['nodes_visited']:,} nodes visited • {stats['nodes_fetched']:,} fetched from Snowflake")
+        for path in path_results['paths']:
+            st.code(" → ".join(path))
+
+def crawl_checkpoint_path(crawl_name):
+    """Checkpoint directory for a named crawl"""
+    safe_name = re.sub(r'[^A-Za-z0-9_-]', '_', crawl_name) or 'account'
+    return os.path.join(CRAWL_CHECKPOINT_DIR, safe_name)
+
+def load_crawl_edges(checkpoint_dir):
+    """All lineage edges collected by a crawl, de-duplicated"""
+    edges_path = os.path.join(checkpoint_dir, 'edges.jsonl')
+    if not os.path.exists(edges_path):
+        return pd.DataFrame()
+    # Re-read the file only when the crawl has appended to it
+    signature = (edges_path, os.path.getmtime(edges_path))
+    cached = st.session_state.get('crawl_edges_cache')
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(edges_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    # A crash between writing edges and checkpointing can repeat an object's rows
+    edges = compact_frame(pd.DataFrame(records).drop_duplicates(ignore_index=True))
+    st.session_state.crawl_edges_cache = (signature, edges)
+    return edges
+
+def set_bits(bits):
+    """Positions of the set bits of a Python int"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def bit_count(bits):
+    return bin(bits).count('1')
+
+class ReachabilityIndex:
+    """Transitive closure of object-level lineage edges as per-node bitsets.
+
+    Every node gets an integer id; descendants[id] and ancestors[id] are Python
+    ints with one bit per reachable node, so reachability is a single bit test
+    and descendant/ancestor counts are a popcount (memoised until the next
+    change). Adding an edge u -> v only touches the ancestors of u and the
+    descendants of v. Counts cover the lineage that has been crawled or
+    explored so far. The bitsets grow with the square of the node count, so
+    nodes beyond max_nodes are left out and the index is marked truncated.
+    """
+
+    def __init__(self, max_nodes=None):
+        self.max_nodes = REACHABILITY_MAX_NODES if max_nodes is None else max_nodes
+        self.truncated = False
+        self._explored_edges = set()  # Edges from explored results, kept for rebuilds
+        self._crawl_files = {}  # edges.jsonl path -> (inode, bytes already ingested)
+        self._crawl_scopes = {}  # state.json path -> ((inode, mtime, size), scope it was crawled with)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        with self._lock:
+            self.ids = {}
+            self.names = []
+            self.descendants = []
+            self.ancestors = []
+            self._counts = {}
+            self.truncated = False
+
+    def __contains__(self, node):
+        return node in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def _node_id(self, node):
+        node_id = self.ids.get(node)
+        if node_id is None:
+            if len(self.names) >= self.max_nodes:
+                self.truncated = True
+                return None
+            node_id = self.ids[node] = len(self.names)
+            self.names.append(node)
+            self.descendants.append(0)
+            self.ancestors.append(0)
+        return node_id
+
+    def add_edges(self, edges):
+        """Merge (source, target) edges into the closure; returns the edges that were new"""
+        added = []
+        with self._lock:
+            for source, target in edges:
+                if source == target:
+                    continue
+                u, v = self._node_id(source), self._node_id(target)
+                if u is None or v is None:
+                    continue  # Over the node limit
+                if self.descendants[u] >> v & 1:
+                    continue  # Already implied by the closure
+                reach = self.descendants[v] | (1 << v)
+                feeders = self.ancestors[u] | (1 << u)
+                for a in set_bits(feeders):
+                    self.descendants[a] |= reach
+                for d in set_bits(reach):
+                    self.ancestors[d] |= feeders
+                added.append((source, target))
+            if added:
+                self._counts.clear()
+        return added
+
+    def add_frame(self, df, explored=True):
+        """Merge the edges of a GET_LINEAGE result between objects (columns count as their object)"""
+        if df is None or df.empty:
+            return 0
+        objects = df.drop(columns=['SOURCE_COLUMN_NAME', 'TARGET_COLUMN_NAME'], errors='ignore')
+        sources = qualified_node_names(objects, 'SOURCE')
+        targets = qualified_node_names(objects, 'TARGET')
+        if sources is None or targets is None:
+            return 0
+        edges = list(zip(sources, targets))
+        added = self.add_edges(edges)
+        if explored:
+            # Keep edges the closure already implied too: crawl edges implying them may be reset later
+            with self._lock:
+                self._explored_edges.update(edge for edge in edges if edge[0] != edge[1])
+        return len(added)
+
+    def _checkpoint_scope(self, state_path):
+        """Role scope recorded in a crawl's state.json, re-read only when the file changed"""
+        stat = os.stat(state_path)
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._crawl_scopes.get(state_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(state_path) as f:
+            scope = json.load(f).get('scope')
+        self._crawl_scopes[state_path] = (version, scope)
+        return scope
+
+    def sync_crawls(self, crawl_dir, scope):
+        """Ingest edges appended to crawl checkpoints of the same role since the last sync.
+
+        A checkpoint that was reset, replaced or truncated since it was read
+        invalidates edges already in the closure, which can't be removed one
+        by one, so the index is rebuilt from the explored edges and the
+        current checkpoint files.
+        """
+        with self._sync_lock:
+            files = {}
+            if os.path.isdir(crawl_dir):
+                for crawl_name in os.listdir(crawl_dir):
+                    state_path = os.path.join(crawl_dir, crawl_name, 'state.json')
+                    edges_path = os.path.join(crawl_dir, crawl_name, 'edges.jsonl')
+                    try:
+                        if self._checkpoint_scope(state_path) != (list(scope) if scope else None):
+                            continue  # Crawled under another role
+                        stat = os.stat(edges_path)
+                    except (OSError, ValueError):
+                        continue
+                    files[edges_path] = (stat.st_ino, stat.st_size)
+
+            changed = any(
+                path not in files or files[path][0] != inode or files[path][1] < offset
+                for path, (inode, offset) in self._crawl_files.items()
+            )
+            if changed:
+                self._clear()
+                self._crawl_files = {}
+                with self._lock:
+                    explored = list(self._explored_edges)
+                self.add_edges(explored)
+
+            added = 0
+            for edges_path, (inode, size) in files.items():
+                offset = self._crawl_files.get(edges_path, (inode, 0))[1]
+                if size <= offset:
+                    continue
+                try:
+                    with open(edges_path, 'rb') as f:
+                        f.seek(offset)
+                        chunk = f.read(size - offset)
+                except OSError:
+                    continue
+                # Only consume complete lines; a crawl may be appending right now
+                complete = chunk[:chunk.rfind(b'\n') + 1]
+                records = []
+                for line in complete.decode('utf-8', errors='replace').splitlines():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # Skip a line left half-written by an interrupted crawl
+                if records:
+                    added += self.add_frame(pd.DataFrame(records), explored=False)
+                self._crawl_files[edges_path] = (inode, offset + len(complete))
+            return added
+
+    def reaches(self, source, target):
+        """True if target is downstream of source in the known lineage"""
+        u, v = self.ids.get(source), self.ids.get(target)
+        return u is not None and v is not None and bool(self.descendants[u] >> v & 1)
+
+    def descendant_count(self, node):
+        return self._count(node, 'descendants')
+
+    def ancestor_count(self, node):
+        return self._count(node, 'ancestors')
+
+    def _count(self, node, kind):
+        node_id = self.ids.get(node)
+        if node_id is None:
+            return None
+        key = (kind, node_id)
+        count = self._counts.get(key)
+        if count is None:
+            # A cycle can make a node its own descendant; it is not counted
+            count = self._counts[key] = bit_count(getattr(self, kind)[node_id] & ~(1 << node_id))
+        return count
+
+@st.cache_resource
+def get_reachability_index(scope):
+    """Process-wide reachability index for one role scope"""
+    return ReachabilityIndex()
+
+def session_reachability_index():
+    """Reachability index for the session's role, kept up to date with crawl checkpoints"""
+    scope = st.session_state.get('cache_scope')
+    if scope is None:
+        # Unknown privileges: keep the index private to this session
+        index = st.session_state.setdefault('reachability_index', ReachabilityIndex())
+    else:
+        index = get_reachability_index(scope)
+    index.sync_crawls(CRAWL_CHECKPOINT_DIR, scope)
+    return index
+
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+class JobCancelled(Exception):
+    """Raised inside a background job once it has been cancelled"""
+
+class JobHandle:
+    """Passed to a running job for progress reporting and cancellation checks"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.scope = None  # Role scope of the job's own connection, set once it is connected
+
+    def progress(self, done, total, text=None):
+        self.check_cancelled()
+        self.queue._update(self.job_id, progress=done / max(total, 1), message=text or f"{done:,}/{total:,}")
+
+    def step(self, text):
+        self.check_cancelled()
+        self.queue._update(self.job_id, message=text)
+
+    def cancelled(self):
+        return self.queue._cancel_events[self.job_id].is_set()
+
+    def check_cancelled(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+class JobQueue:
+    """Process-wide worker pool for long-running analyses and uploads.
+
+    Job state is written to <job_dir>/<id>.json and results to <id>.pkl, so a
+    reloaded page can reattach to them. Every job opens its own Snowflake
+    connection, so it keeps running when the browser session that submitted
+    it goes away, and cancelling it only aborts that job's queries. With
+    browser (SSO) authentication a server thread can't log in, so those jobs
+    borrow the submitting session's connection instead; cancelling them stops
+    the job before its next statement without aborting the session's queries.
+    Runners key shared caches on handle.scope, the role scope of the job's
+    connection, which need not match the submitting session's.
+    """
+
+    def __init__(self, job_dir, max_workers, max_per_user):
+        self.job_dir = job_dir
+        self.max_per_user = max_per_user
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lineage-job')
+        self._jobs = {}
+        self._cancel_events = {}
+        self._connections = {}  # job_id -> connection while the job is running
+        self._lock = threading.Lock()
+        # Results are pickles loaded back by open_job_result, so only the app's own user may write them
+        make_private_dirs(job_dir)
+        self._load_jobs()
+
+    def _load_jobs(self):
+        cutoff = time.time() - JOB_MAX_AGE_HOURS * 3600
+        for name in os.listdir(self.job_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name)) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job['submitted_at'] < cutoff:
+                self._remove_files(job['id'])
+                continue
+            if job['status'] in ACTIVE_JOB_STATUSES:
+                # The process that was running it has gone away
+                job.update(status='interrupted', finished_at=job['finished_at'] or time.time())
+                self._save(job)
+            self._jobs[job['id']] = job
+            self._cancel_events[job['id']] = threading.Event()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _result_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.pkl")
+
+    def _save(self, job):
+        # Write then rename so readers never see a half-written state file
+        tmp_path = self._state_path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._state_path(job['id']))
+
+    def _remove_files(self, job_id):
+        for path in (self._state_path(job_id), self._result_path(job_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            self._save(job)
+
+    def submit(self, kind, label, owner, scope, runner, *args, connection=None):
+        """Queue runner(conn, handle, *args); raises ValueError when the owner is at their limit.
+
+        A given connection is used instead of opening one, and is left open afterwards.
+        """
+        with self._lock:
+            active = [job for job in self._jobs.values() if job['owner'] == owner and job['status'] in ACTIVE_JOB_STATUSES]
+            if len(active) >= self.max_per_user:
+                raise ValueError(f"You already have {len(active)} background jobs running or queued (limit {self.max_per_user}). Wait for one to finish or cancel it.")
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'label': label,
+                'owner': owner,
+                'scope': list(scope) if scope else None,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'progress': 0.0,
+                'message': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._cancel_events[job['id']] = threading.Event()
+            self._save(job)
+        self._executor.submit(self._run, job['id'], runner, args, connection)
+        return job['id']
+
+    def _run(self, job_id, runner, args, borrowed_connection=None):
+        handle = JobHandle(self, job_id)
+        conn = None
+        try:
+            handle.check_cancelled()
+            self._update(job_id, status='running', started_at=time.time())
+            if borrowed_connection is not None:
+                conn = borrowed_connection
+            else:
+                conn = connect_snowflake()
+                with self._lock:
+                    self._connections[job_id] = conn
+            # A new connection has the configured role, and a borrowed one may have switched
+            # roles since submission, so shared caches are keyed on what this connection can see
+            handle.scope = get_cache_scope(conn)
+            result = runner(conn, handle, *args)
+            handle.check_cancelled()
+            with open(self._result_path(job_id), 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._update(job_id, status='done', finished_at=time.time(), progress=1.0, message=None)
+        except JobCancelled:
+            self._update(job_id, status='cancelled', finished_at=time.time())
+        except Exception as e:
+            # A query aborted by cancel() surfaces as an error from the connector
+            status = 'cancelled' if self._cancel_events[job_id].is_set() else 'failed'
+            self._update(job_id, status=status, finished_at=time.time(), error=str(e))
+        finally:
+            with self._lock:
+                self._connections.pop(job_id, None)
+            if conn is not None and conn is not borrowed_connection:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def cancel(self, job_id):
+        """Stop a queued job, or abort the statement a running job is executing"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] not in ACTIVE_JOB_STATUSES:
+                return False
+            self._cancel_events[job_id].set()
+            if job['status'] == 'queued':
+                job.update(status='cancelled', finished_at=time.time())
+                self._save(job)
+            conn = self._connections.get(job_id)
+        if conn is not None:
+            try:
+                # The job has a session of its own, so this only aborts the job's queries
+                conn.cursor().execute(f"SELECT SYSTEM$CANCEL_ALL_QUERIES({conn.session_id})")
+            except Exception:
+                pass  # The job notices the cancel flag before its next query
+        return True
+
+    def jobs_for(self, owner, scope):
+        """Jobs submitted by owner under the given role scope, newest first"""
+        scope = list(scope) if scope else None
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job['owner'] == owner and job['scope'] == scope]
+        return sorted(jobs, key=lambda job: job['submitted_at'], reverse=True)
+
+    def load_result(self, job_id):
+        with open(self._result_path(job_id), 'rb') as f:
+            return pickle.load(f)
+
+@st.cache_resource
+def get_job_queue():
+    """Single background job queue for the whole server process"""
+    return JobQueue(JOB_DIR, JOB_WORKERS, JOB_MAX_PER_USER)
+
+def job_owner():
+    """Owner of this browser's jobs (the unit for job limits and job lists).
+
+    Snowflake users are shared when everyone connects with the app's
+    configuration, so ownership is keyed on a random client id kept in the
+    URL: reloading the page keeps it, other browsers get their own.
+    """
+    client_id = st.query_params.get('client')
+    if not client_id or not re.fullmatch(r'[0-9a-f]{32}', client_id):
+        client_id = st.session_state.setdefault('client_id', uuid.uuid4().hex)
+        st.query_params['client'] = client_id
+    return client_id
+
+def uses_browser_login():
+    """Whether connections authenticate through an interactive browser (SSO) login"""
+    return not REPLAY_DIR and load_snowflake_config().get('authenticator') == 'externalbrowser'
+
+def job_elapsed(job):
+    """Seconds a job has been queued or running (or took, once finished)"""
+    started = job['started_at'] or job['submitted_at']
+    return (job['finished_at'] or time.time()) - started
+
+def lineage_analysis_job(conn, job, request):
+    """Background version of the Explore Lineage button; returns a results dict"""
+    run_lineage = lineage_runner(conn, job.scope)
+    depth_display = request['depth_display']
+    adaptive_report = None
+    job.step("Exploring lineage...")
+    if request['depth'] is None:
+        df, query, adaptive_report = explore_lineage_adaptive(
+            request['object_name'], request['object_type'], request['direction'],
+            request['budget_nodes'], request['budget_edges'], request['budget_seconds'],
+            run_lineage=run_lineage
+        )
+        if adaptive_report:
+            depth_display = f"adaptive ({adaptive_report['chosen_depth']} levels)"
+    else:
+        df, query, _ = run_lineage(request['object_name'], request['object_type'], request['direction'], request['depth'])
+
+    access_df, access_query = None, None
+    if request['include_access_history'] and df is not None:
+        job.step("Analyzing access history for all lineage objects...")
+        if request['partitioned_access']:
+            access_df, access_query = partitioned_access_history(
+                conn, df, request['access_window_days'], job.scope, progress=job.progress,
+                approximate=request['approximate_access'], sample_percent=request['access_sample_percent']
+            )
+        elif not df.empty:
+            object_names = lineage_object_names(df)
+            if object_names:
+                start, end = access_window(request['access_window_days'])
+                if request['approximate_access']:
+                    access_df, access_query = approximate_access_history(conn, object_names, start, end, request['access_sample_percent'])
+                else:
+                    access_query = build_access_history_query(object_names, start, end)
+                    access_df = fetch_frame(conn, access_query, 'access_history')
+        access_df = compact_frame(access_df)
+
+    return {
+        'df': df,
+        'query': query,
+        'object_name': request['object_name'],
+        'object_type': request['object_type'],
+        'direction': request['direction'],
+        'depth_display': depth_display,
+        'access_df': access_df,
+        'access_query': access_query,
+        'include_access_history': request['include_access_history'],
+        'access_window_days': request['access_window_days'],
+        'access_approximation': {'sample_percent': request['access_sample_percent']} if request['approximate_access'] else None,
+        'adaptive_report': adaptive_report
+    }
+
+def save_table_job(conn, job, df, database, schema, table_name, incremental):
+    """Background version of Save to Snowflake; returns the success message and follow-up query"""
+    job.step(f"Saving {len(df):,} rows...")
+    save_function = save_results_incrementally if incremental else save_results_to_snowflake
+    success, result = save_function(conn, df, database, schema, table_name)
+    if not success:
+        raise RuntimeError(result)
+    full_table_name = f"{database}.{schema}.{table_name}"
+    if incremental:
+        return {
+            'summary': f"Merged into `{full_table_name}`: {result['inserted']} inserted, {result['expired']} expired, {result['unchanged']} unchanged",
+            'select_query': f"SELECT * FROM {full_table_name} WHERE VALID_TO IS NULL;",
+        }
+    return {
+        'summary': f"Created table `{full_table_name}` with {result} rows",
+        'select_query': f"SELECT * FROM {full_table_name};",
+    }
+
+def crawl_job(conn, job, checkpoint_dir, databases, max_workers, queries_per_second):
+    """Background account crawl; cancelling stops it after the in-flight objects"""
+    crawler = LineageCrawler(conn, checkpoint_dir, job.scope, max_workers=max_workers, queries_per_second=queries_per_second)
+    job.step("Enumerating tables and views...")
+    crawler.enumerate_objects(
+        databases,
+        progress=lambda done, total: job.progress(done, total, f"Enumerated {done}/{total} databases")
+    )
+    stats = crawler.run(
+        progress=lambda done, total: job.progress(done, total, f"Crawled {done:,}/{total:,} objects"),
+        should_stop=job.cancelled
+    )
+    job.check_cancelled()
+    summary = f"Crawled {stats['completed']:,}/{stats['objects']:,} objects • {stats['skipped']:,} skipped (already covered) • {stats['failed']:,} failed"
+    if stats['failed_listings']:
+        summary += f" • {stats['failed_listings']:,} databases/schemas could not be listed"
+    if stats['failed'] or stats['failed_listings']:
+        summary += ". Failures are retried the next time you resume this crawl."
+    return {'summary': summary}
+
+def submit_background_job(kind, label, runner, *args):
+    """Queue a job for this browser and remember it in the URL for reattaching"""
+    try:
+        # A browser login can't be repeated from a server thread, so reuse this session's connection
+        connection = st.session_state.connection if uses_browser_login() else None
+        job_id = get_job_queue().submit(kind, label, job_owner(), st.session_state.get('cache_scope'), runner, *args,
+                                        connection=connection)
+    except ValueError as e:
+        st.warning(str(e))
+        return None
+    st.query_params['job'] = job_id
+    st.success("🕒 Queued as a background job. Follow it in the Background Jobs panel - it keeps running if you close or reload this page.")
+    return job_id
+
+def open_job_result(queue, job_id):
+    """Load a finished lineage job into the results view"""
+    try:
+        results = queue.load_result(job_id)
+    except (OSError, pickle.UnpicklingError) as e:
+        st.error(f"Could not load job results: {str(e)}")
+        return
+    remember_results(results)
+    st.rerun()
+
+@fragment
+def render_connection_panel():
+    """Connection panel: configuration status and connect button"""
     # Connection status
     if 'connection' not in st.session_state:
         st.session_state.connection = None
@@ -440,8 +3155,13 @@ def main():
     st.header("Connection")
     
     # Show configuration status
+    show_config_source()
     config_params = load_snowflake_config()
-    if config_params.get('user') and config_params.get('account'):
+    if REPLAY_DIR:
+        st.info(f"🎞️ Replay mode: serving recorded responses from `{REPLAY_DIR}` instead of Snowflake")
+    elif config_params.get('user') and config_params.get('account'):
+        if RECORD_DIR:
+            st.info(f"⏺️ Recording every query result to `{RECORD_DIR}`")
         st.success(f"✅ Configuration loaded for user: **{config_params.get('user')}**")
         if config_params.get('authenticator') == 'externalbrowser':
             st.info("🌐 Browser authentication configured - no password needed!")
@@ -459,130 +3179,154 @@ def main():
             if st.session_state.connection:
                 st.success("✅ Connected to Snowflake successfully!")
                 
-                # Show connection details
-                try:
-                    cursor = st.session_state.connection.cursor()
-                    cursor.execute("SELECT CURRENT_USER(), CURRENT_ROLE(), CURRENT_WAREHOUSE(), CURRENT_DATABASE()")
-                    result = cursor.fetchone()
-                    if result:
-                        st.info(f"**Connected as:** {result[0]} | **Role:** {result[1]} | **Warehouse:** {result[2]} | **Database:** {result[3]}")
-                except:
-                    pass  # Don't fail if we can't get connection details
+                # Role scope partitions the shared cache so nothing leaks across roles;
+                # connection details are remembered so they survive the rerun below
+                st.session_state.pop('cache_scope', None)
+                refresh_session_identity(st.session_state.connection)
+                st.session_state.databases = []
+                
+                # The rest of the app depends on the connection, so rerun all of it
+                st.rerun()
             else:
                 st.error("❌ Failed to connect to Snowflake")
                 if config_params.get('authenticator') == 'externalbrowser':
                     st.info("💡 **Tip:** Make sure you completed the browser login and didn't close the authentication window.")
     
-    # Lineage Explorer section
-    if st.session_state.connection:
-        st.header("🔍 Lineage Explorer")
+    # Show connection details
+    result = st.session_state.get('connection_details')
+    if st.session_state.connection and result:
+        st.info(f"**Connected as:** {result[0]} | **Role:** {result[1]} | **Warehouse:** {result[2]} | **Database:** {result[3]}")
+
+@fragment
+def render_object_picker():
+    """Object picker and lineage parameters; submitting stores new results"""
+    # Object selection section outside form for dynamic updates
+    st.subheader("GET_LINEAGE Parameters")
+    st.markdown("**📍 Object Selection**")
+    
+    # Database dropdown
+    database_options = [""] + st.session_state.databases
+    
+    database = st.selectbox(
+        "Database *",
+        options=database_options,
+        index=0,  # Always start with empty selection
+        help="Select a Snowflake database (required)"
+    )
+    
+    # Schema dropdown (only populate if database is selected)
+    if database:
+        # Schemas are shared between sessions with the same role
+        with st.spinner(f"Loading schemas for {database}..."):
+            available_schemas = load_cached(
+                'schemas', [database],
+                lambda: fetch_schemas(st.session_state.connection, database),
+                should_store=is_non_empty
+            )
         
-        # Initialize session state for dropdowns
-        if 'databases' not in st.session_state:
-            st.session_state.databases = []
+        schema_options = [""] + available_schemas
         
-        # Load databases only when first connected (lazy loading)
-        if not st.session_state.databases:
-            with st.spinner("Loading databases..."):
-                st.session_state.databases = fetch_databases(st.session_state.connection)
+        schema = st.selectbox(
+            "Schema *",
+            options=schema_options,
+            index=0,  # Always start with empty selection
+            help="Select a schema within the database (required)"
+        )
+    else:
+        schema = st.selectbox(
+            "Schema *",
+            options=[""],
+            disabled=True,
+            help="Select a database first (required)"
+        )
+    
+    # Table dropdown (only populate if database and schema are selected)
+    if database and schema:
+        # Tables arrive in sorted pages; complete lists are shared between sessions with the same role
+        with st.spinner(f"Loading tables for {database}.{schema}..."):
+            available_tables, table_pages = paged_options(
+                'tables', [database, schema],
+                lambda: table_listing(database, schema)
+            )
         
-        # Show connection status
-        if st.session_state.databases:
-            st.success(f"📊 Connected to Snowflake • {len(st.session_state.databases)} databases available")
+        table_options = [""] + available_tables
         
-        # Object selection section outside form for dynamic updates
-        st.subheader("GET_LINEAGE Parameters")
-        st.markdown("**📍 Object Selection**")
+        # Downstream counts from crawled and explored lineage (one popcount per table)
+        reachability = session_reachability_index()
+        def table_label(name):
+            count = reachability.descendant_count(f"{database}.{schema}.{name}") if name else None
+            if count is None:
+                return name
+            # Past the node limit some downstream objects are missing from the index
+            return f"{name}  ·  ↓ {'≥' if reachability.truncated else ''}{count:,} downstream"
         
-        # Database dropdown
-        database_options = [""] + st.session_state.databases
+        # The widget id includes the option labels, so labels that change between reruns
+        # (e.g. after another session explores) would reset the selection; counts are
+        # refreshed when the schema or its listing changes
+        labels_key = (database, schema, len(table_options))
+        previous_key, labels = st.session_state.get('picker_table_labels', (None, None))
+        if previous_key != labels_key:
+            labels = {name: table_label(name) for name in table_options}
         
-        database = st.selectbox(
-            "Database *",
-            options=database_options,
+        table = st.selectbox(
+            "Table/View *",
+            options=table_options,
             index=0,  # Always start with empty selection
-            help="Select a Snowflake database (required)"
+            format_func=lambda name: labels.get(name, name),
+            help="Select a table or view within the schema (required). Downstream counts come from crawled and previously explored lineage."
         )
-        
-        # Schema dropdown (only populate if database is selected)
-        if database:
-            # Check if we need to load schemas for the selected database
-            schemas_key = f'schemas_{database}'
-            if schemas_key not in st.session_state:
-                with st.spinner(f"Loading schemas for {database}..."):
-                    st.session_state[schemas_key] = fetch_schemas(st.session_state.connection, database)
-            
-            available_schemas = st.session_state[schemas_key]
-            schema_options = [""] + available_schemas
-            
-            schema = st.selectbox(
-                "Schema *",
-                options=schema_options,
-                index=0,  # Always start with empty selection
-                help="Select a schema within the database (required)"
-            )
-        else:
-            schema = st.selectbox(
-                "Schema *",
-                options=[""],
-                disabled=True,
-                help="Select a database first (required)"
-            )
-        
-        # Table dropdown (only populate if database and schema are selected)
-        if database and schema:
-            # Check if we need to load tables for the selected database.schema
-            tables_key = f'tables_{database}_{schema}'
-            if tables_key not in st.session_state:
-                with st.spinner(f"Loading tables for {database}.{schema}..."):
-                    st.session_state[tables_key] = fetch_tables(st.session_state.connection, database, schema)
-            
-            available_tables = st.session_state[tables_key]
-            table_options = [""] + available_tables
-            
-            table = st.selectbox(
-                "Table/View *",
-                options=table_options,
-                index=0,  # Always start with empty selection
-                help="Select a table or view within the schema (required)"
-            )
-        else:
-            table = st.selectbox(
-                "Table/View *",
-                options=[""],
-                disabled=True,
-                help="Select database and schema first (required)"
+        st.session_state.picker_table_labels = (labels_key, labels)
+        render_load_more(table_pages, "tables and views")
+    else:
+        table = st.selectbox(
+            "Table/View *",
+            options=[""],
+            disabled=True,
+            help="Select database and schema first (required)"
+        )
+    
+    # Column dropdown (always show, but optional)
+    if database and schema and table:
+        # Columns arrive in sorted pages; complete lists are shared between sessions with the same role
+        with st.spinner(f"Loading columns for {database}.{schema}.{table}..."):
+            available_columns, column_pages = paged_options(
+                'columns', [database, schema, table],
+                lambda: column_listing(database, schema, table)
             )
         
-        # Column dropdown (always show, but optional)
-        if database and schema and table:
-            # Check if we need to load columns for the selected table
-            columns_key = f'columns_{database}_{schema}_{table}'
-            if columns_key not in st.session_state:
-                with st.spinner(f"Loading columns for {database}.{schema}.{table}..."):
-                    st.session_state[columns_key] = fetch_columns(st.session_state.connection, database, schema, table)
-            
-            available_columns = st.session_state[columns_key]
-            column_options = [""] + available_columns
-            
-            column = st.selectbox(
-                "Column",
-                options=column_options,
-                index=0,  # Always start with empty selection
-                help="Select a column for column-level lineage (optional - leave blank for table-level lineage)"
-            )
-        else:
-            column = st.selectbox(
-                "Column",
-                options=[""],
-                disabled=True,
-                help="Select database, schema, and table first (optional)"
-            )
+        column_options = [""] + available_columns
         
+        column = st.selectbox(
+            "Column",
+            options=column_options,
+            index=0,  # Always start with empty selection
+            help="Select a column for column-level lineage (optional - leave blank for table-level lineage)"
+        )
+        render_load_more(column_pages, "columns")
+    else:
+        column = st.selectbox(
+            "Column",
+            options=[""],
+            disabled=True,
+            help="Select database, schema, and table first (optional)"
+        )
+    
+    # Path queries reuse the object picker for the source object
+    explorer_mode = st.radio(
+        "Mode",
+        options=["Explore Lineage", "Find Path"],
+        horizontal=True,
+        help="'Find Path' returns every shortest lineage path between two objects"
+    )
+    
+    if explorer_mode == "Find Path":
+        picked_object = ".".join(part for part in [database, schema, table, column] if part) if (database and schema and table) else ""
+        render_path_finder(picked_object)
+    else:
         # Lineage parameters section
         st.markdown("**🔍 Lineage Parameters**")
         col3, col4 = st.columns(2)
-        
+    
         with col3:
             direction = st.selectbox(
                 "Direction *",
@@ -590,15 +3334,15 @@ def main():
                 index=0,
                 help="Direction of lineage to explore (required)"
             )
-        
+    
         with col4:
             depth_option = st.selectbox(
                 "Depth *",
-                options=["Until End", "Custom"],
+                options=["Until End", "Custom", "Adaptive"],
                 index=0,
-                help="Choose depth strategy: 'Until End' to traverse all the way to the end, 'Custom' for specific number of levels"
+                help="Choose depth strategy: 'Until End' to traverse all the way to the end, 'Custom' for specific number of levels, 'Adaptive' to pick the deepest level that fits a budget"
             )
-        
+    
         # Conditional depth input - only show for Custom (now outside form so it works)
         if depth_option == "Custom":
             depth = st.number_input(
@@ -608,20 +3352,67 @@ def main():
                 value=4,
                 help="Number of levels to traverse"
             )
+        elif depth_option == "Adaptive":
+            depth = None  # Chosen after probing the fan-out
+            col_budget1, col_budget2, col_budget3 = st.columns(3)
+            with col_budget1:
+                budget_nodes = st.number_input("Max Nodes", min_value=10, max_value=1000000, value=2000, step=100)
+            with col_budget2:
+                budget_edges = st.number_input("Max Edges", min_value=10, max_value=1000000, value=5000, step=100)
+            with col_budget3:
+                budget_seconds = st.number_input("Max Seconds", min_value=1, max_value=600, value=30)
+            st.info(f"📐 Will probe {ADAPTIVE_PROBE_DEPTH} levels, estimate the full size and use the deepest level that fits the budget")
         else:  # Until End
             depth = 999  # Use a very large number to represent "until end"
             st.info("📡 Will traverse lineage until it reaches the end")
-        
+    
         # Additional analysis options
         st.markdown("**📊 Additional Analysis**")
         include_access_history = st.checkbox(
-            "Include Access History (Last 7 Days)",
+            "Include Access History",
             help="Analyze access history to see when and how this object/column was last accessed (requires ACCOUNTADMIN role or access to ACCOUNT_USAGE)"
         )
-        
+        access_window_days, partitioned_access = 7, False
+        approximate_access, access_sample_percent = False, None
+        if include_access_history:
+            col_access1, col_access2 = st.columns(2)
+            with col_access1:
+                access_window_days = st.selectbox(
+                    "Access History Window (Days)",
+                    options=[7, 14, 30, 90],
+                    index=0,
+                    help="Longer windows are slower; use daily partitions for 30+ days"
+                )
+            with col_access2:
+                partitioned_access = st.checkbox(
+                    "Run as parallel daily partitions",
+                    value=access_window_days > 7,
+                    help="Query each day separately in parallel and merge the results. Completed days are cached, so only new days are queried next time."
+                )
+            col_access3, col_access4 = st.columns(2)
+            with col_access3:
+                approximate_access = st.checkbox(
+                    "Approximate (faster)",
+                    help=f"Estimate unique users with HyperLogLog sketches (±{ERROR_BOUND_Z * ACCESS_HLL_STANDARD_ERROR:.1%} at ~95%) instead of exact distinct counts. Sketches merge across days and objects."
+                )
+            with col_access4:
+                sample_option = st.selectbox(
+                    "Sample",
+                    options=["All rows", "50%", "10%", "1%"],
+                    disabled=not approximate_access,
+                    help="Aggregate a random SAMPLE ROW of the access history. Counts are scaled up and reported with error bounds; unique users and last access become lower bounds."
+                )
+                if approximate_access and sample_option != "All rows":
+                    access_sample_percent = float(sample_option.rstrip('%'))
+    
+        run_in_background = st.checkbox(
+            "Run in background",
+            help="Queue the analysis as a background job. It keeps running if you close or reload the page; open the result from the Background Jobs panel."
+        )
+    
         # Submit button
         submitted = st.button("🔍 Explore Lineage", type="primary")
-        
+    
         # Execute lineage query when form is submitted
         if submitted:
             # Check if required fields are selected
@@ -639,33 +3430,91 @@ def main():
                     # Table-level lineage
                     object_name = f"{database}.{schema}.{table}"
                     object_type = "table"
-            
+        
             if object_name:
                 # Show the constructed object name and depth strategy
-                depth_display = "until end" if depth == 999 else f"{depth} levels"
+                if depth is None:
+                    depth_display = "adaptive"
+                else:
+                    depth_display = "until end" if depth == 999 else f"{depth} levels"
                 st.info(f"🎯 **Analyzing object:** `{object_name}` (type: {object_type}) • **Depth:** {depth_display}")
-                
+            
+            if object_name and run_in_background:
+                submit_background_job(
+                    'lineage', f"{object_name} • {direction} • {depth_display}", lineage_analysis_job,
+                    {
+                        'object_name': object_name,
+                        'object_type': object_type,
+                        'direction': direction,
+                        'depth': depth,
+                        'depth_display': depth_display,
+                        'budget_nodes': budget_nodes if depth is None else None,
+                        'budget_edges': budget_edges if depth is None else None,
+                        'budget_seconds': budget_seconds if depth is None else None,
+                        'include_access_history': include_access_history,
+                        'access_window_days': access_window_days,
+                        'partitioned_access': partitioned_access,
+                        'approximate_access': approximate_access,
+                        'access_sample_percent': access_sample_percent,
+                    }
+                )
+            elif object_name:
+                record_explored_path({
+                    'database': database,
+                    'schema': schema,
+                    'table': table,
+                    'column': column,
+                    'direction': direction,
+                    'depth_option': depth_option,
+                    'depth': depth if depth_option == "Custom" else None,
+                    'budget_nodes': budget_nodes if depth is None else None,
+                    'budget_edges': budget_edges if depth is None else None,
+                    'budget_seconds': budget_seconds if depth is None else None,
+                    'include_access_history': include_access_history,
+                    'access_window_days': access_window_days,
+                    'partitioned_access': partitioned_access,
+                    'approximate_access': approximate_access,
+                    'sample_option': sample_option if include_access_history else "All rows",
+                })
                 with st.spinner("Exploring lineage..."):
-                    df, query = execute_lineage_query(
-                        st.session_state.connection, 
-                        object_name, 
-                        object_type, 
-                        direction, 
-                        depth
-                    )
-                    
+                    adaptive_report = None
+                    if depth is None:
+                        df, query, adaptive_report = explore_lineage_adaptive(
+                            object_name, object_type, direction,
+                            budget_nodes, budget_edges, budget_seconds
+                        )
+                        if adaptive_report:
+                            depth_display = f"adaptive ({adaptive_report['chosen_depth']} levels)"
+                    else:
+                        df, query, _ = run_lineage_cached(object_name, object_type, direction, depth)
+                
                     # Also get access history if requested
                     access_df, access_query = None, None
                     if include_access_history and df is not None:
                         with st.spinner("Analyzing access history for all lineage objects..."):
-                            access_df, access_query = execute_access_history_query(
-                                st.session_state.connection,
-                                df
-                            )
-                    
+                            if partitioned_access:
+                                partition_progress = st.progress(0.0, text="Querying daily partitions...")
+                                access_df, access_query = execute_partitioned_access_history(
+                                    st.session_state.connection,
+                                    df,
+                                    access_window_days,
+                                    progress=lambda done, total: partition_progress.progress(done / total, text=f"Merged {done}/{total} daily partitions"),
+                                    approximate=approximate_access,
+                                    sample_percent=access_sample_percent
+                                )
+                            else:
+                                access_df, access_query = execute_access_history_query(
+                                    st.session_state.connection,
+                                    df,
+                                    access_window_days,
+                                    approximate_access,
+                                    access_sample_percent
+                                )
+                            access_df = compact_frame(access_df)
+                
                     # Store results in session state to prevent loss on rerun
                     if df is not None:
-                        st.session_state.lineage_results = {
+                        remember_results({
                             'df': df,
                             'query': query,
                             'object_name': object_name,
@@ -674,320 +3523,607 @@ def main():
                             'depth_display': depth_display,
                             'access_df': access_df,
                             'access_query': access_query,
-                            'include_access_history': include_access_history
-                        }
+                            'include_access_history': include_access_history,
+                            'access_window_days': access_window_days,
+                            'access_approximation': {'sample_percent': access_sample_percent} if approximate_access else None,
+                            'adaptive_report': adaptive_report
+                        })
+                        # Results are rendered by another fragment
+                        st.rerun()
+
+@fragment
+def render_export_panel(results_data):
+    """CSV download and Save to Snowflake form for the active results.
+
+    A fragment of its own, so typing in the save form doesn't rerun the results tabs.
+    """
+    df = results_data['df']
+    object_name = results_data['object_name']
+    direction = results_data['direction']
+    
+    # Export options
+    st.subheader("📤 Export Results")
+    col_export1, col_export2 = st.columns(2)
+    
+    with col_export1:
+        # Download CSV button
+        csv = csv_data(df, 'lineage_export')
+        st.download_button(
+            label="📥 Download as CSV",
+            data=csv,
+            file_name=f"lineage_{object_name.replace('.', '_')}_{direction.lower()}.csv",
+            mime="text/csv"
+        )
+    
+    with col_export2:
+        # Save to Snowflake button
+        if st.button("🏔️ Save to Snowflake Table", help="Create or replace a table in Snowflake with these results"):
+            st.session_state.show_snowflake_save = True
+            rerun_fragment()
+    
+    # Snowflake save options (show if button clicked)
+    if st.session_state.get('show_snowflake_save', False):
+        st.markdown("---")
+        st.subheader("🏔️ Save to Snowflake Table")
         
-        # Display results (either from current query or from session state)
-        results_data = st.session_state.get('lineage_results')
-        if results_data:
-            df = results_data['df']
-            query = results_data['query']
-            object_name = results_data['object_name']
-            object_type = results_data['object_type']
-            direction = results_data['direction']
-            depth_display = results_data['depth_display']
-            access_df = results_data.get('access_df')
-            access_query = results_data.get('access_query')
-            include_access_history = results_data.get('include_access_history', False)
-            
-            
-            st.header("📊 Analysis Results")
+        save_mode = st.radio(
+            "Write Mode",
+            options=["Replace table", "Incremental (merge changes)"],
+            horizontal=True,
+            help="Incremental keeps a history table with VALID_FROM/VALID_TO and only writes edges that changed since the last save"
+        )
+        incremental_save = save_mode.startswith("Incremental")
+        
+        # Warning
+        if incremental_save:
+            st.info("ℹ️ New edges are inserted and edges no longer in the lineage are expired (VALID_TO set). Unchanged rows are not rewritten.")
+        else:
+            st.warning("⚠️ **Warning**: This will CREATE OR REPLACE the specified table. Any existing table with the same name will be completely overwritten!")
+        
+        
+        # Database and Schema selection outside form for dynamic updates
+        col_save1, col_save2, col_save3 = st.columns(3)
+        
+        with col_save1:
+            save_database = st.selectbox(
+                "Target Database",
+                options=st.session_state.databases,
+                help="Database where the table will be created"
+            )
+        
+        with col_save2:
+            # Load schemas for selected database (dynamic filtering)
+            if save_database:
+                # Reuse the same shared schema list as the object picker
+                with st.spinner(f"Loading schemas for {save_database}..."):
+                    available_schemas = load_cached(
+                        'schemas', [save_database],
+                        lambda: fetch_schemas(st.session_state.connection, save_database, include_system_schemas=False),
+                        should_store=is_non_empty
+                    )
+                schema_options = [""] + available_schemas
+                
+                save_schema = st.selectbox(
+                    "Target Schema",
+                    options=schema_options,
+                    help="Schema where the table will be created"
+                )
+            else:
+                save_schema = st.selectbox(
+                    "Target Schema",
+                    options=[""],
+                    disabled=True,
+                    help="Select a database first"
+                )
+        
+        with col_save3:
+            default_table_name = f"LINEAGE_RESULTS_{object_name.replace('.', '_').upper()}_{direction}"
+            save_table_name = st.text_input(
+                "Table Name",
+                value=default_table_name,
+                help="Name of the table to create (will be created or replaced)"
+            )
+        
+        save_in_background = st.checkbox(
+            "Upload in background",
+            help="Run the upload as a background job, so large results don't block the page"
+        )
+        
+        # Form for the action buttons only
+        with st.form("save_to_snowflake_form"):
+            # Action buttons
+            col_action1, col_action2 = st.columns(2)
+            with col_action1:
+                save_submitted = st.form_submit_button("💾 Save Table", type="primary")
+            with col_action2:
+                if st.form_submit_button("❌ Cancel"):
+                    st.session_state.show_snowflake_save = False
+                    rerun_fragment()
+        
+        # Execute save operation
+        if save_submitted:
+            if save_database and save_schema and save_table_name and save_in_background:
+                if submit_background_job(
+                    'save', f"Save {len(df):,} rows to {save_database}.{save_schema}.{save_table_name}", save_table_job,
+                    df, save_database, save_schema, save_table_name, incremental_save
+                ):
+                    st.session_state.show_snowflake_save = False
+            elif save_database and save_schema and save_table_name:
+                save_function = save_results_incrementally if incremental_save else save_results_to_snowflake
+                with st.spinner(f"Saving to table {save_database}.{save_schema}.{save_table_name}..."):
+                    success, result = save_function(
+                        st.session_state.connection,
+                        df,
+                        save_database,
+                        save_schema,
+                        save_table_name
+                    )
+                
+                if success:
+                    full_table_name = f"{save_database}.{save_schema}.{save_table_name}"
+                    if incremental_save:
+                        st.success(f"✅ Merged into `{full_table_name}`: {result['inserted']} inserted, {result['expired']} expired, {result['unchanged']} unchanged")
+                        select_query = f"SELECT * FROM {full_table_name} WHERE VALID_TO IS NULL;"
+                    else:
+                        st.success(f"✅ Successfully created table `{full_table_name}` with {result} rows!")
+                        select_query = f"SELECT * FROM {full_table_name};"
+                    
+                    # Show the SELECT query for easy copy-paste
+                    st.code(select_query, language="sql")
+                    st.info("📋 **Copy the query above to use in Snowflake or any SQL client**")
+                    
+                    # Hide the save form but don't rerun immediately
+                    st.session_state.show_snowflake_save = False
+                else:
+                    st.error(f"❌ Failed to create table: {result}")
+            else:
+                st.error("Please fill in all required fields: Database, Schema, and Table Name")
+    else:
+        st.info("No lineage relationships found for the specified object.")
+
+@fragment(run_every=JOB_POLL_SECONDS)
+def render_jobs_panel():
+    """Background jobs of this browser, polled while the page is open"""
+    queue = get_job_queue()
+    jobs = queue.jobs_for(job_owner(), st.session_state.get('cache_scope'))
+    
+    # Reattach to the job named in the URL once it has finished
+    attach_id = st.query_params.get('job')
+    attached = st.session_state.setdefault('attached_jobs', set())
+    attach_job = next((job for job in jobs if job['id'] == attach_id), None)
+    if attach_job and attach_id not in attached and attach_job['status'] not in ACTIVE_JOB_STATUSES:
+        attached.add(attach_id)
+        if attach_job['status'] == 'done' and attach_job['kind'] == 'lineage':
+            open_job_result(queue, attach_id)
+    
+    if not jobs:
+        return
+    
+    active_count = sum(1 for job in jobs if job['status'] in ACTIVE_JOB_STATUSES)
+    status_icons = {'queued': '🕒', 'running': '⏳', 'done': '✅', 'failed': '❌', 'cancelled': '⏹️', 'interrupted': '⚠️'}
+    with st.expander(f"🕒 Background Jobs ({active_count} active)", expanded=active_count > 0):
+        st.caption(f"Up to {queue.max_per_user} jobs per browser run at a time. Jobs are kept for {JOB_MAX_AGE_HOURS} hours.")
+        for job in jobs:
+            col_job1, col_job2, col_job3 = st.columns([5, 2, 1])
+            with col_job1:
+                st.write(f"{status_icons.get(job['status'], '')} **{job['label']}**")
+                if job['status'] == 'running':
+                    st.progress(min(job['progress'], 1.0), text=job['message'] or "Running...")
+                elif job['error']:
+                    st.caption(f"{job['status'].capitalize()}: {job['error']}")
+                elif job['status'] == 'interrupted':
+                    st.caption("Interrupted by a server restart. Submit it again to rerun.")
+            with col_job2:
+                st.write(f"{job['status'].capitalize()} • {job_elapsed(job):,.0f}s")
+            with col_job3:
+                if job['status'] in ACTIVE_JOB_STATUSES:
+                    if st.button("⏹️ Cancel", key=f"cancel_job_{job['id']}"):
+                        queue.cancel(job['id'])
+                        rerun_fragment()
+                elif job['status'] == 'done' and job['kind'] == 'lineage':
+                    if st.button("📂 Open", key=f"open_job_{job['id']}"):
+                        attached.add(job['id'])
+                        open_job_result(queue, job['id'])
+            if job['status'] == 'done' and job['kind'] in ('save', 'crawl'):
+                try:
+                    saved = queue.load_result(job['id'])
+                    st.caption(saved['summary'])
+                    if 'select_query' in saved:
+                        st.code(saved['select_query'], language="sql")
+                except (OSError, pickle.UnpicklingError):
+                    pass
+        if not hasattr(st, 'fragment') and not hasattr(st, 'experimental_fragment'):
+            # Without fragments there is no polling; refresh on demand
+            if st.button("🔄 Refresh Jobs"):
+                st.rerun()
+
+@fragment
+def render_results():
+    """Results tabs for the active analysis"""
+    # Switch between recent analyses (older ones are reloaded from disk if spilled)
+    history = st.session_state.get('result_history', [])
+    if len(history) > 1:
+        history_labels = {entry['id']: entry['label'] + (" 💾" if entry['results'] is None else "") for entry in history}
+        selected_entry = st.selectbox(
+            "🕘 Recent Analyses",
+            options=list(history_labels.keys()),
+            format_func=lambda entry_id: history_labels[entry_id],
+            help="Previous results in this session. 💾 marks results spilled to disk to save memory."
+        )
+        if selected_entry != history[0]['id']:
+            restore_results(selected_entry)
+            st.rerun()
+    
+    # Display results (either from current query or from session state)
+    results_data = st.session_state.get('lineage_results')
+    if results_data:
+        df = results_data['df']
+        query = results_data['query']
+        object_name = results_data['object_name']
+        access_df = results_data.get('access_df')
+        access_query = results_data.get('access_query')
+        include_access_history = results_data.get('include_access_history', False)
+        access_window_days = results_data.get('access_window_days', 7)
+        
+        
+        st.header("📊 Analysis Results")
+        
+        # Show the executed queries
+        with st.expander("🔍 View Generated Queries"):
+            st.markdown("**Lineage Query:**")
+            st.code(query, language="sql")
+            if access_query:
+                st.markdown("**Access History Query:**")
+                st.code(access_query, language="sql")
+        
+        # Create tabs for different result types
+        if include_access_history and access_df is not None:
+            tab1, tab2 = st.tabs(["🔗 Lineage Results", f"📈 Access History (Last {access_window_days} Days)"])
+        else:
+            tab1 = st.container()
+            tab2 = None
+        
+        with tab1:
+            st.subheader("🔗 Lineage Relationships")
+            st.write(f"**Lineage relationships found:** {len(df)}")
             
-            # Show the executed queries
-            with st.expander("🔍 View Generated Queries"):
-                st.markdown("**Lineage Query:**")
-                st.code(query, language="sql")
-                if access_query:
-                    st.markdown("**Access History Query:**")
-                    st.code(access_query, language="sql")
+            # Explain how adaptive depth was chosen and what it cut off
+            adaptive_report = results_data.get('adaptive_report')
+            if adaptive_report:
+                st.info(
+                    f"📐 **Adaptive depth:** {adaptive_report['chosen_depth']} levels "
+                    f"(limited by {adaptive_report['limited_by']}) • "
+                    f"probe fan-out per level: {', '.join(str(n) for n in adaptive_report['level_edges'])} edges • "
+                    f"projected {adaptive_report['projected_nodes']:,} nodes / {adaptive_report['projected_edges']:,} edges"
+                    + (" • time budget not applied (probe served from cache)" if adaptive_report['probe_seconds'] is None else "")
+                )
+                truncated = adaptive_report.get('truncated', {})
+                if truncated:
+                    with st.expander(f"✂️ {len(truncated):,} truncated branches"):
+                        branch_nodes = sorted(truncated)
+                        selected_branches = st.multiselect(
+                            "Branches to expand",
+                            options=branch_nodes,
+                            default=branch_nodes[:20],
+                            format_func=lambda node: f"{node} ({truncated[node].lower()})"
+                        )
+                        if st.button("➕ Expand Selected Branches", disabled=not selected_branches):
+                            with st.spinner(f"Expanding {len(selected_branches)} branches..."):
+                                expand_truncated_branches(results_data, selected_branches)
+                            session_reachability_index().add_frame(results_data['df'])
+                            st.rerun()
             
-            # Create tabs for different result types
-            if include_access_history and access_df is not None:
-                tab1, tab2 = st.tabs(["🔗 Lineage Results", "📈 Access History (Last 7 Days)"])
-            else:
-                tab1 = st.container()
-                tab2 = None
+            if not df.empty:
+                # Filter-as-you-type over an index built once per result
+                col_search1, col_search2, col_search3 = st.columns([3, 1, 1])
+                with col_search1:
+                    search_query = st.text_input(
+                        "🔎 Search Results",
+                        placeholder="e.g. RAW.ORDERS, *_STG_*, ^MART\\.",
+                        help="Search source/target object names, domains and columns"
+                    )
+                with col_search2:
+                    search_mode = st.selectbox("Match", options=["Contains", "Prefix", "Glob", "Regex"])
+                with col_search3:
+                    paths_only = st.checkbox(
+                        "Only paths through match",
+                        help="Show every lineage edge upstream or downstream of the matching objects"
+                    )
+                
+                matched_rows = None
+                if search_query:
+                    search_index = get_search_index(df)
+                    search_start = time.perf_counter()
+                    try:
+                        if paths_only:
+                            matched_rows = search_index.paths_through(search_query, search_mode)
+                        else:
+                            matched_rows = search_index.search(search_query, search_mode)
+                        st.caption(f"{len(matched_rows):,} of {len(df):,} rows match • {(time.perf_counter() - search_start) * 1000:.0f} ms")
+                    except ValueError as e:
+                        st.error(str(e))
+                
+                # Only the visible page is sent to the browser
+                render_paged_dataframe(df, 'lineage_table', row_positions=matched_rows, filterable=False)
             
-            with tab1:
-                st.subheader("🔗 Lineage Relationships")
-                st.write(f"**Lineage relationships found:** {len(df)}")
+            # Key insights
+            if len(df) > 0:
+                st.subheader("📈 Key Insights")
                 
-                if not df.empty:
-                    # Display results in a nice format
-                    st.dataframe(df, use_container_width=True)
+                col1, col2, col3 = st.columns(3)
                 
-                # Key insights
-                if len(df) > 0:
-                    st.subheader("📈 Key Insights")
-                    
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.metric("Total Objects", len(df))
-                    
-                    with col2:
-                        if 'OBJECT_TYPE' in df.columns:
-                            unique_types = df['OBJECT_TYPE'].nunique()
-                            st.metric("Object Types", unique_types)
-                    
-                    with col3:
-                        if 'OBJECT_DOMAIN' in df.columns:
-                            unique_domains = df['OBJECT_DOMAIN'].nunique()
-                            st.metric("Domains", unique_domains)
-                    
-                    # Show object type breakdown
+                with col1:
+                    st.metric("Total Objects", len(df))
+                
+                with col2:
                     if 'OBJECT_TYPE' in df.columns:
-                        st.subheader("Object Type Distribution")
-                        type_counts = df['OBJECT_TYPE'].value_counts()
-                        st.bar_chart(type_counts)
+                        unique_types = df['OBJECT_TYPE'].nunique()
+                        st.metric("Object Types", unique_types)
                 
-                # Export options
-                st.subheader("📤 Export Results")
-                col_export1, col_export2 = st.columns(2)
+                with col3:
+                    if 'OBJECT_DOMAIN' in df.columns:
+                        unique_domains = df['OBJECT_DOMAIN'].nunique()
+                        st.metric("Domains", unique_domains)
                 
-                with col_export1:
-                    # Download CSV button
-                    csv = df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download as CSV",
-                        data=csv,
-                        file_name=f"lineage_{object_name.replace('.', '_')}_{direction.lower()}.csv",
-                        mime="text/csv"
-                    )
+                # Show object type breakdown
+                if 'OBJECT_TYPE' in df.columns:
+                    st.subheader("Object Type Distribution")
+                    type_counts = df['OBJECT_TYPE'].value_counts()
+                    type_counts = type_counts[type_counts > 0]  # Drop unused categories
+                    st.bar_chart(type_counts)
                 
-                with col_export2:
-                    # Save to Snowflake button
-                    if st.button("🏔️ Save to Snowflake Table", help="Create or replace a table in Snowflake with these results"):
-                        st.session_state.show_snowflake_save = True
-                        st.rerun()
+                render_export_panel(results_data)
+            
+        # Access History Tab
+        if tab2 is not None:
+            with tab2:
+                st.subheader(f"📈 Column Access History (Last {access_window_days} Days)")
                 
-                # Snowflake save options (show if button clicked)
-                if st.session_state.get('show_snowflake_save', False):
-                    st.markdown("---")
-                    st.subheader("🏔️ Save to Snowflake Table")
-                    
-                    # Warning
-                    st.warning("⚠️ **Warning**: This will CREATE OR REPLACE the specified table. Any existing table with the same name will be completely overwritten!")
-                    
-                    
-                    # Database and Schema selection outside form for dynamic updates
-                    col_save1, col_save2, col_save3 = st.columns(3)
-                    
-                    with col_save1:
-                        save_database = st.selectbox(
-                            "Target Database",
-                            options=st.session_state.databases,
-                            help="Database where the table will be created"
-                        )
-                    
-                    with col_save2:
-                        # Load schemas for selected database (dynamic filtering)
-                        if save_database:
-                            # Check if we need to reload schemas for the selected database
-                            current_save_db_key = f'save_schemas_{save_database}'
-                            
-                            # Clear cached schemas if database selection changed
-                            if 'current_save_database' not in st.session_state:
-                                st.session_state.current_save_database = None
-                            
-                            if st.session_state.current_save_database != save_database:
-                                # Database changed, clear old schema cache and update
-                                st.session_state.current_save_database = save_database
-                                # Clear any old cached schemas
-                                keys_to_remove = [key for key in st.session_state.keys() if key.startswith('save_schemas_')]
-                                for key in keys_to_remove:
-                                    del st.session_state[key]
-                            
-                            # Create cache key for the selected database
-                            current_save_db_key = f'save_schemas_{save_database}'
-                            
-                            if current_save_db_key not in st.session_state:
-                                # Fetch schemas for this database and cache them
-                                with st.spinner(f"Loading schemas for {save_database}..."):
-                                    st.session_state[current_save_db_key] = fetch_schemas(st.session_state.connection, save_database, include_system_schemas=False)
-                            
-                            available_schemas = st.session_state.get(current_save_db_key, [])
-                            schema_options = [""] + available_schemas
-                            
-                            save_schema = st.selectbox(
-                                "Target Schema",
-                                options=schema_options,
-                                help="Schema where the table will be created"
-                            )
-                        else:
-                            save_schema = st.selectbox(
-                                "Target Schema",
-                                options=[""],
-                                disabled=True,
-                                help="Select a database first"
-                            )
-                    
-                    with col_save3:
-                        default_table_name = f"LINEAGE_RESULTS_{object_name.replace('.', '_').upper()}_{direction}"
-                        save_table_name = st.text_input(
-                            "Table Name",
-                            value=default_table_name,
-                            help="Name of the table to create (will be created or replaced)"
-                        )
+                if access_df is not None and not access_df.empty:
+                    approximation = results_data.get('access_approximation')
+                    if approximation:
+                        note = f"≈ **Approximate:** unique users from HyperLogLog sketches (±{ERROR_BOUND_Z * ACCESS_HLL_STANDARD_ERROR:.1%} at ~95%, see UNIQUE_USERS_ERROR)"
+                        if approximation['sample_percent']:
+                            note += (f"; counts scaled from a {approximation['sample_percent']:g}% row sample (see ACCESS_COUNT_ERROR)."
+                                     " Unique users and last access are lower bounds.")
+                        st.caption(note)
+                    st.write(f"**Objects/Columns with access data:** {len(access_df)}")
                     
-                    # Form for the action buttons only
-                    with st.form("save_to_snowflake_form"):
-                        # Action buttons
-                        col_action1, col_action2 = st.columns(2)
-                        with col_action1:
-                            save_submitted = st.form_submit_button("💾 Create Table", type="primary")
-                        with col_action2:
-                            if st.form_submit_button("❌ Cancel"):
-                                st.session_state.show_snowflake_save = False
-                                st.rerun()
+                    # Display access history summary
+                    render_paged_dataframe(access_df, 'access_table')
                     
-                    # Execute save operation
-                    if save_submitted:
-                        if save_database and save_schema and save_table_name:
-                            with st.spinner(f"Creating table {save_database}.{save_schema}.{save_table_name}..."):
-                                success, result = save_results_to_snowflake(
-                                    st.session_state.connection,
-                                    df,
-                                    save_database,
-                                    save_schema,
-                                    save_table_name
-                                )
-                            
-                            if success:
-                                full_table_name = f"{save_database}.{save_schema}.{save_table_name}"
-                                st.success(f"✅ Successfully created table `{full_table_name}` with {result} rows!")
-                                
-                                # Show the SELECT query for easy copy-paste
-                                select_query = f"SELECT * FROM {full_table_name};"
-                                st.code(select_query, language="sql")
-                                st.info("📋 **Copy the query above to use in Snowflake or any SQL client**")
-                                
-                                # Hide the save form but don't rerun immediately
-                                st.session_state.show_snowflake_save = False
-                            else:
-                                st.error(f"❌ Failed to create table: {result}")
-                        else:
-                            st.error("Please fill in all required fields: Database, Schema, and Table Name")
-                else:
-                    st.info("No lineage relationships found for the specified object.")
-            
-            # Access History Tab
-            if tab2 is not None:
-                with tab2:
-                    st.subheader("📈 Column Access History (Last 7 Days)")
-                    
-                    if access_df is not None and not access_df.empty:
-                        st.write(f"**Objects/Columns with access data:** {len(access_df)}")
+                    # Access insights
+                    if len(access_df) > 0:
+                        st.subheader("📊 Access Summary")
                         
-                        # Display access history summary
-                        st.dataframe(access_df, use_container_width=True)
+                        col1, col2, col3 = st.columns(3)
                         
-                        # Access insights
-                        if len(access_df) > 0:
-                            st.subheader("📊 Access Summary")
-                            
-                            col1, col2, col3 = st.columns(3)
-                            
-                            with col1:
-                                unique_objects = access_df['OBJECT_NAME'].nunique()
-                                st.metric("Objects Accessed", unique_objects)
-                            
-                            with col2:
-                                column_access_count = len(access_df[access_df['COLUMN_NAME'] != 'TABLE_LEVEL'])
-                                st.metric("Columns Accessed", column_access_count)
-                            
-                            with col3:
-                                if 'LAST_ACCESSED' in access_df.columns:
-                                    latest_access = access_df['LAST_ACCESSED'].max()
-                                    st.metric("Most Recent Access", latest_access.strftime('%Y-%m-%d %H:%M') if latest_access else 'N/A')
+                        with col1:
+                            unique_objects = access_df['OBJECT_NAME'].nunique()
+                            st.metric("Objects Accessed", unique_objects)
+                        
+                        with col2:
+                            column_access_count = len(access_df[access_df['COLUMN_NAME'] != 'TABLE_LEVEL'])
+                            st.metric("Columns Accessed", column_access_count)
+                        
+                        with col3:
+                            if 'LAST_ACCESSED' in access_df.columns:
+                                latest_access = access_df['LAST_ACCESSED'].max()
+                                st.metric("Most Recent Access", latest_access.strftime('%Y-%m-%d %H:%M') if latest_access else 'N/A')
+                        
+                        # Show objects by access recency
+                        st.subheader("Objects by Access Recency")
+                        object_latest = access_df.groupby('OBJECT_NAME', observed=True)['LAST_ACCESSED'].max().sort_values(ascending=False)
+                        st.bar_chart(object_latest.head(10))
+                        
+                        # Show column access summary
+                        column_data = access_df[access_df['COLUMN_NAME'] != 'TABLE_LEVEL']
+                        if not column_data.empty:
+                            st.subheader("Column Access Summary")
                             
-                            # Show objects by access recency
-                            st.subheader("Objects by Access Recency")
-                            object_latest = access_df.groupby('OBJECT_NAME')['LAST_ACCESSED'].max().sort_values(ascending=False)
-                            st.bar_chart(object_latest.head(10))
+                            # Most accessed columns
+                            top_columns = column_data.nlargest(10, 'ACCESS_COUNT')[['OBJECT_NAME', 'COLUMN_NAME', 'ACCESS_COUNT', 'LAST_ACCESSED_DATE']]
+                            st.write("**Most Accessed Columns:**")
+                            st.dataframe(top_columns, use_container_width=True)
                             
-                            # Show column access summary
-                            column_data = access_df[access_df['COLUMN_NAME'] != 'TABLE_LEVEL']
-                            if not column_data.empty:
-                                st.subheader("Column Access Summary")
-                                
-                                # Most accessed columns
-                                top_columns = column_data.nlargest(10, 'ACCESS_COUNT')[['OBJECT_NAME', 'COLUMN_NAME', 'ACCESS_COUNT', 'LAST_ACCESSED_DATE']]
-                                st.write("**Most Accessed Columns:**")
-                                st.dataframe(top_columns, use_container_width=True)
-                                
-                                # Recently accessed columns
-                                recent_columns = column_data.nlargest(10, 'LAST_ACCESSED')[['OBJECT_NAME', 'COLUMN_NAME', 'LAST_ACCESSED_DATE', 'ACCESS_COUNT']]
-                                st.write("**Recently Accessed Columns:**")
-                                st.dataframe(recent_columns, use_container_width=True)
-                        
-                        # Export access history
-                        st.subheader("📤 Export Access History")
-                        access_csv = access_df.to_csv(index=False)
-                        st.download_button(
-                            label="📥 Download Column Access History as CSV",
-                            data=access_csv,
-                            file_name=f"column_access_history_{object_name.replace('.', '_')}_7days.csv",
-                            mime="text/csv"
-                        )
+                            # Recently accessed columns
+                            recent_columns = column_data.nlargest(10, 'LAST_ACCESSED')[['OBJECT_NAME', 'COLUMN_NAME', 'LAST_ACCESSED_DATE', 'ACCESS_COUNT']]
+                            st.write("**Recently Accessed Columns:**")
+                            st.dataframe(recent_columns, use_container_width=True)
                     
-                    elif include_access_history:
-                        st.info("No access history found for objects in the lineage in the last 7 days.")
-                        st.markdown("""
-                        **Note:** Column access history analysis requires:
-                        - ACCOUNTADMIN role or access to SNOWFLAKE.ACCOUNT_USAGE views
-                        - Objects must have been accessed within the last 7 days
-                        - Optimized query using proper pruning on ACCESS_HISTORY clustered columns
-                        """)
+                    # Export access history
+                    st.subheader("📤 Export Access History")
+                    access_csv = csv_data(access_df, 'access_export')
+                    st.download_button(
+                        label="📥 Download Column Access History as CSV",
+                        data=access_csv,
+                        file_name=f"column_access_history_{object_name.replace('.', '_')}_{access_window_days}days.csv",
+                        mime="text/csv"
+                    )
+                
+                elif include_access_history:
+                    st.info(f"No access history found for objects in the lineage in the last {access_window_days} days.")
+                    st.markdown(f"""
+                    **Note:** Column access history analysis requires:
+                    - ACCOUNTADMIN role or access to SNOWFLAKE.ACCOUNT_USAGE views
+                    - Objects must have been accessed within the last {access_window_days} days
+                    - Optimized query using proper pruning on ACCESS_HISTORY clustered columns
+                    """)
+                    
+                    # Show what objects were analyzed
+                    if df is not None and not df.empty:
+                        analyzed_objects = set()
+                        for col in ['OBJECT_NAME', 'SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME']:
+                            if col in df.columns:
+                                analyzed_objects.update(df[col].dropna().unique())
                         
-                        # Show what objects were analyzed
-                        if df is not None and not df.empty:
-                            analyzed_objects = set()
-                            for col in ['OBJECT_NAME', 'SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME']:
-                                if col in df.columns:
-                                    analyzed_objects.update(df[col].dropna().unique())
-                            
-                            if analyzed_objects:
-                                st.write(f"**Objects analyzed:** {len(analyzed_objects)}")
-                                st.code("\n".join(sorted(analyzed_objects)))
-            else:
-                st.info("No lineage relationships found for the specified object.")
+                        if analyzed_objects:
+                            st.write(f"**Objects analyzed:** {len(analyzed_objects)}")
+                            st.code("\n".join(sorted(analyzed_objects)))
+        else:
+            st.info("No lineage relationships found for the specified object.")
+    
+    # Add a button to clear results
+    if st.session_state.get('lineage_results'):
+        if st.button("🗑️ Clear Results", help="Clear current results and start a new analysis"):
+            del st.session_state.lineage_results
+            if 'show_snowflake_save' in st.session_state:
+                del st.session_state.show_snowflake_save
+            st.rerun()
+
+@fragment
+def render_custom_query():
+    """Custom SQL runner"""
+    # Custom query section (collapsed by default)
+    with st.expander("🛠️ Advanced: Custom Query"):
+        st.markdown("For advanced users who want to run custom queries")
         
-        # Add a button to clear results
-        if st.session_state.get('lineage_results'):
-            if st.button("🗑️ Clear Results", help="Clear current results and start a new analysis"):
-                del st.session_state.lineage_results
-                if 'show_snowflake_save' in st.session_state:
-                    del st.session_state.show_snowflake_save
-                st.rerun()
+        custom_query = st.text_area(
+            "Enter your SQL query:",
+            height=150,
+            placeholder="SELECT * FROM your_table_name LIMIT 10;"
+        )
         
-        # Custom query section (collapsed by default)
-        with st.expander("🛠️ Advanced: Custom Query"):
-            st.markdown("For advanced users who want to run custom queries")
+        if st.button("Execute Custom Query"):
+            if custom_query.strip():
+                with st.spinner("Executing query..."):
+                    # Keep results across reruns so paging doesn't re-execute the query
+                    st.session_state.custom_query_df = compact_frame(execute_query(st.session_state.connection, custom_query))
+                # The query may have switched roles; cached listings must follow the new scope
+                if refresh_session_identity(st.session_state.connection):
+                    st.rerun()
+            else:
+                st.warning("Please enter a query before executing.")
+        
+        custom_df = st.session_state.get('custom_query_df')
+        if custom_df is not None and not custom_df.empty:
+            render_paged_dataframe(custom_df, 'custom_query_table')
             
-            custom_query = st.text_area(
-                "Enter your SQL query:",
-                height=150,
-                placeholder="SELECT * FROM your_table_name LIMIT 10;"
+            csv = csv_data(custom_df, 'custom_query_export')
+            st.download_button(
+                label="Download as CSV",
+                data=csv,
+                file_name="custom_query_results.csv",
+                mime="text/csv"
             )
-            
-            if st.button("Execute Custom Query"):
-                if custom_query.strip():
-                    with st.spinner("Executing query..."):
-                        df = execute_query(st.session_state.connection, custom_query)
-                        
-                        if df is not None and not df.empty:
-                            st.dataframe(df, use_container_width=True)
-                            
-                            csv = df.to_csv(index=False)
-                            st.download_button(
-                                label="Download as CSV",
-                                data=csv,
-                                file_name="custom_query_results.csv",
-                                mime="text/csv"
-                            )
-                else:
-                    st.warning("Please enter a query before executing.")
+
+@fragment
+def render_crawl_panel():
+    """Whole-account lineage crawl"""
+    # Whole-account crawl (collapsed by default)
+    with st.expander("🗺️ Advanced: Account Lineage Crawl"):
+        st.markdown("Build a complete downstream lineage map of the account. Progress is checkpointed, so an interrupted crawl resumes where it stopped.")
+        
+        crawl_name = st.text_input("Crawl Name", value="account", help="Checkpoints are stored per crawl name")
+        crawl_databases = st.multiselect(
+            "Databases",
+            options=st.session_state.databases,
+            help="Leave empty to crawl every database"
+        )
+        col_crawl1, col_crawl2 = st.columns(2)
+        with col_crawl1:
+            crawl_workers = st.slider("Concurrent Queries", min_value=1, max_value=8, value=4,
+                                      help="Capped by the warehouse MAX_CONCURRENCY_LEVEL")
+        with col_crawl2:
+            crawl_rate = st.number_input("Max Queries per Second", min_value=0.1, max_value=20.0, value=2.0,
+                                         help="Automatically reduced while the warehouse is queueing queries")
+        
+        checkpoint_dir = crawl_checkpoint_path(crawl_name)
+        # Runs as a background job, so it can be followed and cancelled in the Background Jobs panel
+        job_label = f"Lineage crawl '{crawl_name}'"
+        crawl_running = any(
+            job['kind'] == 'crawl' and job['label'] == job_label and job['status'] in ACTIVE_JOB_STATUSES
+            for job in get_job_queue().jobs_for(job_owner(), st.session_state.get('cache_scope'))
+        )
+        col_crawl3, col_crawl4 = st.columns(2)
+        with col_crawl3:
+            start_crawl = st.button("▶️ Start / Resume Crawl", type="primary", disabled=crawl_running)
+        with col_crawl4:
+            if st.button("🗑️ Reset Checkpoint", help="Discard progress and edges collected by this crawl", disabled=crawl_running):
+                for name in ('state.json', 'progress.jsonl', 'edges.jsonl'):
+                    path = os.path.join(checkpoint_dir, name)
+                    if os.path.exists(path):
+                        os.remove(path)
+                st.success(f"Checkpoint for '{crawl_name}' reset")
+        if crawl_running:
+            st.info("⏳ This crawl is running in the background. Cancel it from the Background Jobs panel; progress so far is kept.")
+        
+        if start_crawl:
+            submit_background_job(
+                'crawl', job_label, crawl_job, checkpoint_dir,
+                crawl_databases or None, crawl_workers, crawl_rate
+            )
+        
+        crawl_edges = load_crawl_edges(checkpoint_dir)
+        if not crawl_edges.empty:
+            st.write(f"**Edges collected so far:** {len(crawl_edges):,}")
+            st.download_button(
+                label="📥 Download Crawl Edges as CSV",
+                data=crawl_edges.to_csv(index=False),
+                file_name=f"lineage_crawl_{os.path.basename(checkpoint_dir)}.csv",
+                mime="text/csv"
+            )
+
+@fragment
+def render_cache_stats():
+    """Result cache statistics per query type"""
+    # Result cache effectiveness of the generated SQL
+    with st.expander("📈 Result Cache Statistics"):
+        st.markdown("Every generated statement carries a `QUERY_TAG` with its query type. Check how often repeats were served from Snowflake's result cache.")
+        if st.button("🔄 Check Recent Queries"):
+            try:
+                checked = refresh_result_cache_stats(
+                    st.session_state.connection,
+                    st.session_state.databases[0] if st.session_state.databases else None
+                )
+                st.caption(f"Classified {checked} queries from this session")
+            except Exception as e:
+                st.error(f"Could not read query history: {str(e)}")
+        st.dataframe(get_query_stats().summary(), use_container_width=True)
+
+def main():
+    st.title("🔗 Snowflake Lineage Explorer")
+    st.markdown("Explore data lineage relationships in your Snowflake environment using the `GET_LINEAGE` function")
+    
+    render_connection_panel()
+    
+    # Lineage Explorer section
+    if st.session_state.connection:
+        st.header("🔍 Lineage Explorer")
+        
+        # Initialize session state for dropdowns
+        if 'databases' not in st.session_state:
+            st.session_state.databases = []
+        
+        # Load databases only when first connected (lazy loading)
+        if not st.session_state.databases:
+            with st.spinner("Loading databases..."):
+                st.session_state.databases = load_cached(
+                    'databases', [],
+                    lambda: fetch_databases(st.session_state.connection),
+                    should_store=is_non_empty
+                )
+        
+        # Show connection status
+        if st.session_state.databases:
+            st.success(f"📊 Connected to Snowflake • {len(st.session_state.databases)} databases available")
+        
+        if st.button("🔄 Refresh Metadata", help="Reload databases, schemas, tables and lineage instead of using cached results"):
+            if st.session_state.get('cache_scope') is not None:
+                get_shared_cache().invalidate(st.session_state.cache_scope)
+            cached_keys = [key for key in st.session_state.keys() if key.startswith('cached_')]
+            for key in cached_keys:
+                del st.session_state[key]
+            st.session_state.databases = []
+            st.rerun()
+        
+        # Each panel reruns on its own when its widgets change
+        render_object_picker()
+        render_jobs_panel()
+        render_results()
+        render_custom_query()
+        render_crawl_panel()
+        render_cache_stats()
     
     else:
         st.info("Please connect to Snowflake first to explore lineage.")
@@ -1027,5 +4163,6 @@ def main():
         - **Until End**: Traverse lineage completely until no more relationships are found
         """)
 
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,443 @@
+"""Load test: many simulated analysts against one `streamlit run` server.
+
+Starts app.py with `streamlit run` in replay mode, so Snowflake is replaced by
+recorded fixtures (see "Recording and Replay" in the README), and drives
+concurrent sessions over Streamlit's websocket protocol the way browsers do.
+The sessions share the server's process-wide caches, job pool, threads and
+GIL, as real analysts would:
+
+    LINEAGE_RECORD_DIR=fixtures uv run streamlit run app.py    # explore a few objects once
+    uv run python load_harness.py --fixtures fixtures --sessions 30 --latency-ms 200
+
+Every analysis explored while recording is appended to fixtures/paths.jsonl;
+sessions replay randomly chosen entries of it, so each statement they run has
+a fixture.
+
+Reports per-interaction latency, and the CPU time and memory of the server
+process. The client speaks the protocol of the Streamlit version in uv.lock:
+widget values travel as WidgetStates in a rerun_script BackMsg, selectbox
+values as the displayed option text.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024  # Lineage results and data frames arrive as single messages
+
+
+def parse_ps_time(text):
+    """Seconds from ps's [[dd-]hh:]mm:ss[.ss] CPU time"""
+    days, _, clock = text.rpartition('-')
+    seconds = 0.0
+    for part in clock.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds + int(days or 0) * 86400
+
+
+def process_usage(pid):
+    """(CPU seconds, resident MB, peak resident MB or None) of a running process"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        # No /proc (macOS): ps reports CPU time and resident KB, but no peak
+        rss, cpu_time = subprocess.run(['ps', '-o', 'rss=', '-o', 'time=', '-p', str(pid)],
+                                       capture_output=True, text=True, check=True).stdout.split()
+        return parse_ps_time(cpu_time), int(rss) / 1024, None
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, int(status['VmRSS'].split()[0]) / 1024, int(status['VmHWM'].split()[0]) / 1024
+
+
+def load_paths(fixture_dir):
+    """Analyses explored while recording, as written by app.record_explored_path"""
+    path = os.path.join(fixture_dir, 'paths.jsonl')
+    try:
+        with open(path) as f:
+            paths = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        paths = []
+    if not paths:
+        raise SystemExit(f"No recorded analyses in {path}. Record some with LINEAGE_RECORD_DIR and Explore Lineage first.")
+    return paths
+
+
+def displayed_option(options, value):
+    """The option text a browser shows (and sends back) for a recorded value"""
+    text = '' if value is None else str(value)
+    for option in options:
+        # Table/View options carry downstream counts after the name (table_label in app.py)
+        if option == text or option.startswith(f"{text}  ·  "):
+            return option
+    return None
+
+
+class StreamlitServer:
+    """app.py under `streamlit run` in replay mode, on a local port"""
+
+    def __init__(self, args):
+        self.port = args.port
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, LINEAGE_REPLAY_DIR=os.path.abspath(args.fixtures),
+                   LINEAGE_REPLAY_LATENCY_MS=str(args.latency_ms))
+        env.pop('LINEAGE_RECORD_DIR', None)
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+             '--server.headless', 'true', '--server.address', '127.0.0.1', '--server.port', str(self.port),
+             '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+            env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self.pid = self.process.pid
+
+    def wait_until_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f"{self.url}/_stcore/health", timeout=1) as response:
+                    if response.read().strip() == b'ok':
+                        return
+            except OSError:
+                time.sleep(0.2)
+        self.log.seek(0)
+        output = self.log.read().decode(errors='replace')[-2000:]
+        self.stop()
+        raise SystemExit(f"streamlit run did not become healthy on port {self.port}:\n{output}")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+class Results:
+    """Latency samples and errors per interaction"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, seconds):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def record_error(self, name, message):
+        self.errors.setdefault(name, []).append(message)
+
+
+class SimulatedSession:
+    """One analyst's browser tab: renders nothing, but keeps the page state a browser would.
+
+    Elements are kept by delta path and replaced as runs send new ones;
+    elements a finished run didn't send again are dropped, as the frontend
+    does. Widget changes inside a fragment rerun only that fragment, and
+    fragments with run_every are polled on their interval.
+    """
+
+    def __init__(self, number, args, paths, results, server_url):
+        self.number = number
+        self.args = args
+        self.paths = paths
+        self.results = results
+        self.random = random.Random(args.seed + number)
+        self.stream_url = server_url.replace('http', 'ws', 1) + '/_stcore/stream'
+        self.elements = {}  # delta path -> (fragment id, Element)
+        self.widget_states = {}  # widget id -> WidgetState sent with every rerun
+        self.query_string = ''
+        self.page_script_hash = ''
+        self.ws = None
+        self._run_lock = asyncio.Lock()
+        self._finished = asyncio.Queue()
+        self._touched = set()
+        self._run_fragments = set()
+        self._run_errors = []
+        self._pollers = {}
+
+    async def interact(self, name, action):
+        """Time one interaction; an action returning False did nothing and is not counted"""
+        started = time.perf_counter()
+        try:
+            if await action() is False:
+                return True
+        except Exception as e:
+            self.results.record_error(name, f"session {self.number}: {e}")
+            return False
+        self.results.record(name, time.perf_counter() - started)
+        return True
+
+    async def open_page(self):
+        self.ws = await websocket_connect(self.stream_url, subprotocols=['streamlit'],
+                                          max_message_size=MAX_MESSAGE_BYTES)
+        self._reader = asyncio.ensure_future(self._read())
+        await self.run_script()
+
+    async def close(self):
+        for poller in self._pollers.values():
+            poller.cancel()
+        if self.ws is not None:
+            self.ws.close()
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def run_script(self, fragment_id='', trigger=None, auto_rerun=False):
+        """Send a rerun the way the browser does and wait until the run has finished"""
+        async with self._run_lock:
+            msg = BackMsg()
+            client_state = msg.rerun_script
+            client_state.query_string = self.query_string
+            client_state.page_script_hash = self.page_script_hash
+            client_state.widget_states.widgets.extend(self.widget_states.values())
+            if trigger is not None:
+                client_state.widget_states.widgets.append(trigger)
+            if fragment_id:
+                client_state.fragment_id = fragment_id
+            client_state.is_auto_rerun = auto_rerun
+            self._touched, self._run_errors = set(), []
+            await self.ws.write_message(msg.SerializeToString(), binary=True)
+            outcome = await asyncio.wait_for(self._finished.get(), self.args.timeout)
+            if isinstance(outcome, Exception):
+                raise outcome
+
+    async def _read(self):
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                self._finished.put_nowait(ConnectionError("The server closed the connection"))
+                return
+            self._handle(ForwardMsg.FromString(raw))
+
+    def _handle(self, msg):
+        kind = msg.WhichOneof('type')
+        if kind == 'new_session':
+            # Every run starts with one; a fragment run lists the fragments it reruns
+            self.page_script_hash = msg.new_session.page_script_hash
+            self._run_fragments = set(msg.new_session.fragment_ids_this_run)
+        elif kind == 'page_info_changed':
+            self.query_string = msg.page_info_changed.query_string
+        elif kind == 'auto_rerun':
+            fragment_id = msg.auto_rerun.fragment_id
+            if fragment_id not in self._pollers:
+                self._pollers[fragment_id] = asyncio.ensure_future(self._poll(fragment_id, msg.auto_rerun.interval))
+        elif kind == 'delta':
+            path = tuple(msg.metadata.delta_path)
+            self._touched.add(path)
+            if msg.delta.WhichOneof('type') == 'new_element':
+                element = msg.delta.new_element
+                self.elements[path] = (msg.delta.fragment_id, element)
+                if element.WhichOneof('type') == 'exception':
+                    self._run_errors.append(RuntimeError(element.exception.message))
+        elif kind == 'script_finished':
+            if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                self._touched = set()  # Another run follows and sends the page again
+                return
+            self._drop_stale()
+            if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                self._finished.put_nowait(RuntimeError("app.py failed to compile"))
+            else:
+                self._finished.put_nowait(self._run_errors[0] if self._run_errors else None)
+
+    def _drop_stale(self):
+        """Forget elements the finished run didn't send again (only its fragments' elements for a fragment run)"""
+        for path, (fragment_id, _) in list(self.elements.items()):
+            if path not in self._touched and (not self._run_fragments or fragment_id in self._run_fragments):
+                del self.elements[path]
+        shown = {getattr(element, element.WhichOneof('type')).id for _, element in self.elements.values()
+                 if element.WhichOneof('type') in ('selectbox', 'checkbox', 'number_input', 'button')}
+        self.widget_states = {widget_id: state for widget_id, state in self.widget_states.items() if widget_id in shown}
+
+    async def _poll(self, fragment_id, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if not self._run_lock.locked():
+                await self.interact('poll jobs panel', lambda: self.run_script(fragment_id, auto_rerun=True))
+
+    def find_widget(self, kind, label):
+        for fragment_id, element in self.elements.values():
+            if element.WhichOneof('type') == kind and getattr(element, kind).label == label:
+                return getattr(element, kind), fragment_id
+        raise LookupError(f"No {kind} labelled {label!r} on the page")
+
+    def page_errors(self):
+        return [element.alert.body for _, element in self.elements.values()
+                if element.WhichOneof('type') == 'alert' and element.alert.format == Alert.ERROR]
+
+    def shown_value(self, kind, widget):
+        state = self.widget_states.get(widget.id)
+        if kind == 'selectbox':
+            if state is not None:
+                return state.string_value
+            return widget.options[widget.default] if widget.options else None
+        if kind == 'checkbox':
+            return state.bool_value if state is not None else widget.default
+        return state.double_value if state is not None else widget.default
+
+    async def set_widget(self, kind, label, value):
+        """Set a widget to its recorded value; returns False when it already shows it"""
+        widget, fragment_id = self.find_widget(kind, label)
+        if kind == 'selectbox':
+            option = displayed_option(widget.options, value)
+            if option is None:
+                # A missing fixture shows up as an st.error above the empty dropdown
+                errors = self.page_errors()
+                shown = f": {errors[0]}" if errors else "; was it recorded with the same role?"
+                raise LookupError(f"{value!r} is not offered in {label!r}{shown}")
+            value = option
+        if self.shown_value(kind, widget) == value:
+            return False
+        state = WidgetState(id=widget.id)
+        if kind == 'selectbox':
+            state.string_value = value
+        elif kind == 'checkbox':
+            state.bool_value = value
+        else:
+            state.double_value = value
+        self.widget_states[widget.id] = state
+        await self.run_script(fragment_id)
+        return True
+
+    async def click(self, label):
+        widget, fragment_id = self.find_widget('button', label)
+        await self.run_script(fragment_id, trigger=WidgetState(id=widget.id, trigger_value=True))
+
+    def replay_steps(self, path):
+        """(interaction, widget kind, label, value) that reproduce one recorded analysis, in page order"""
+        steps = [
+            ('select database', 'selectbox', "Database *", path['database']),
+            ('select schema', 'selectbox', "Schema *", path['schema']),
+            ('select table', 'selectbox', "Table/View *", path['table']),
+            ('select column', 'selectbox', "Column", path['column'] or ""),
+            ('set direction', 'selectbox', "Direction *", path['direction']),
+            ('set depth', 'selectbox', "Depth *", path['depth_option']),
+        ]
+        if path['depth_option'] == "Custom":
+            steps.append(('set depth', 'number_input', "Number of Levels", path['depth']))
+        elif path['depth_option'] == "Adaptive":
+            steps += [
+                ('set depth', 'number_input', "Max Nodes", path['budget_nodes']),
+                ('set depth', 'number_input', "Max Edges", path['budget_edges']),
+                ('set depth', 'number_input', "Max Seconds", path['budget_seconds']),
+            ]
+        steps.append(('set access history', 'checkbox', "Include Access History", path['include_access_history']))
+        if path['include_access_history']:
+            steps += [
+                ('set access history', 'selectbox', "Access History Window (Days)", path['access_window_days']),
+                ('set access history', 'checkbox', "Run as parallel daily partitions", path['partitioned_access']),
+                ('set access history', 'checkbox', "Approximate (faster)", path['approximate_access']),
+                ('set access history', 'selectbox', "Sample", path['sample_option']),
+            ]
+        return steps
+
+    async def run(self):
+        try:
+            if not await self.interact('load page', self.open_page):
+                return
+            if not await self.interact('connect', lambda: self.click("Connect to Snowflake")):
+                return
+            for _ in range(self.args.iterations):
+                path = self.random.choice(self.paths)
+                for name, kind, label, value in self.replay_steps(path):
+                    if not await self.interact(name, lambda: self.set_widget(kind, label, value)):
+                        break
+                else:
+                    await self.interact('explore lineage', lambda: self.click("🔍 Explore Lineage"))
+                if self.args.think_ms:
+                    await asyncio.sleep(self.random.uniform(0, self.args.think_ms) / 1000)
+        finally:
+            await self.close()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def print_report(results, wall_seconds, usage):
+    print(f"\n{'Interaction':<24}{'OK':>6}{'Errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    names = list(results.latencies) + [name for name in results.errors if name not in results.latencies]
+    for name in names:
+        samples = results.latencies.get(name, [])
+        errors = len(results.errors.get(name, []))
+        if samples:
+            print(f"{name:<24}{len(samples):>6}{errors:>8}{statistics.median(samples) * 1000:>10.0f}"
+                  f"{percentile(samples, 0.95) * 1000:>10.0f}{max(samples) * 1000:>10.0f}")
+        else:
+            print(f"{name:<24}{0:>6}{errors:>8}{'-':>10}{'-':>10}{'-':>10}")
+
+    cpu_used = usage[-1][0] - usage[0][0]
+    rss = [sample[1] for sample in usage]
+    peak = usage[-1][2]
+    print(f"\nWall time:        {wall_seconds:,.1f} s")
+    print(f"Server CPU:       {cpu_used:,.1f} s ({cpu_used / max(wall_seconds, 1e-9):.0%} of one core)")
+    print(f"Server RSS:       {rss[0]:,.0f} MB before, {rss[-1]:,.0f} MB after (+{rss[-1] - rss[0]:,.0f} MB)"
+          + (f", peak {peak:,.0f} MB" if peak is not None else ""))
+    if len(rss) > 2:
+        print("RSS after rounds: " + ", ".join(f"{value:,.0f}" for value in rss[1:]) + " MB")
+
+    for name, messages in results.errors.items():
+        print(f"\nFirst errors in '{name}':")
+        for message in messages[:3]:
+            print(f"  {message}")
+
+
+async def run_rounds(args, paths, server):
+    results = Results()
+    usage = [process_usage(server.pid)]
+    for round_number in range(args.rounds):
+        print(f"Round {round_number + 1}/{args.rounds}: {args.sessions} sessions × {args.iterations} analyses "
+              f"from {len(paths)} recorded paths...")
+        sessions = [SimulatedSession(round_number * args.sessions + n, args, paths, results, server.url)
+                    for n in range(args.sessions)]
+        await asyncio.gather(*(session.run() for session in sessions))
+        usage.append(process_usage(server.pid))
+    return results, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent analysts on one `streamlit run` server, replaying analyses recorded with LINEAGE_RECORD_DIR")
+    parser.add_argument('--fixtures', required=True, help="Directory recorded with LINEAGE_RECORD_DIR")
+    parser.add_argument('--sessions', type=int, default=30, help="Concurrent simulated sessions")
+    parser.add_argument('--iterations', type=int, default=3, help="Analyses per session")
+    parser.add_argument('--rounds', type=int, default=1, help="Repeat the whole run to watch the server's memory growth")
+    parser.add_argument('--latency-ms', type=int, default=200, help="Simulated Snowflake latency per statement")
+    parser.add_argument('--think-ms', type=int, default=0, help="Maximum random pause between analyses")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds one interaction may take")
+    parser.add_argument('--port', type=int, default=8599, help="Local port for the server under test")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = load_paths(args.fixtures)
+    server = StreamlitServer(args)
+    try:
+        server.wait_until_healthy(timeout=60)
+        started = time.perf_counter()
+        results, usage = asyncio.run(run_rounds(args, paths, server))
+        wall_seconds = time.perf_counter() - started
+    finally:
+        server.stop()
+
+    print_report(results, wall_seconds, usage)
+    return 1 if results.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import sys
+import warnings
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """app.py imported outside `streamlit run` (bare mode warnings silenced)"""
+    import logging
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        import app as module
+    return module
+
+
+class FakeCursor:
+    def __init__(self, respond):
+        self._respond = respond
+        self._rows = []
+        self.description = None
+        self.rowcount = None
+        self.sfqid = None
+
+    def execute(self, query, *args, **kwargs):
+        columns, self._rows = self._respond(' '.join(query.split()))
+        self.description = [(name,) for name in columns]
+        self.rowcount = len(self._rows)
+        return self
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+
+class FakeConnection:
+    """Connection answering each (whitespace-normalized) statement with respond(query) -> (columns, rows)"""
+
+    session_id = 1
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.queries = []
+
+    def _record(self, query):
+        self.queries.append(query)
+        return self.respond(query)
+
+    def cursor(self):
+        return FakeCursor(self._record)
+
+
+@pytest.fixture
+def fake_connection():
+    return FakeConnection
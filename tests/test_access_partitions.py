@@ -0,0 +1,152 @@
+import json
+import os
+import re
+import stat
+from datetime import datetime, timedelta, timezone
+
+
+def record(object_name, column_name, last_accessed, users, count):
+    return {
+        'OBJECT_NAME': object_name, 'COLUMN_NAME': column_name,
+        'LAST_ACCESSED': datetime.fromisoformat(last_accessed),
+        'USERS': set(users), 'ACCESS_COUNT': count,
+    }
+
+
+def test_partials_merge_into_column_and_table_summaries(app):
+    records = [
+        # Same column seen in two daily partitions
+        record('DB.S.T', 'ID', '2024-05-01 10:00', {'ANN', 'BOB'}, 3),
+        record('DB.S.T', 'ID', '2024-05-02 09:00', {'BOB', 'CAT'}, 2),
+        record('DB.S.T', 'NAME', '2024-05-01 12:00', {'ANN'}, 1),
+        # Object-level access without a column only counts toward the table
+        record('DB.S.T', None, '2024-05-03 08:00', {'DAN'}, 4),
+        record('DB.S.U', 'ID', '2024-04-30 23:59', {'ANN'}, 5),
+    ]
+    df = app.reduce_access_partitions(records)
+    rows = {(row.OBJECT_NAME, row.COLUMN_NAME): row for row in df.itertuples()}
+
+    assert list(rows) == [('DB.S.T', 'ID'), ('DB.S.T', 'NAME'), ('DB.S.T', 'TABLE_LEVEL'),
+                          ('DB.S.U', 'ID'), ('DB.S.U', 'TABLE_LEVEL')]
+    assert (rows['DB.S.T', 'ID'].UNIQUE_USERS, rows['DB.S.T', 'ID'].ACCESS_COUNT) == (3, 5)
+    assert rows['DB.S.T', 'ID'].LAST_ACCESSED == datetime(2024, 5, 2, 9)
+    table = rows['DB.S.T', 'TABLE_LEVEL']
+    assert (table.UNIQUE_USERS, table.ACCESS_COUNT) == (4, 10)
+    assert table.LAST_ACCESSED_DATE == datetime(2024, 5, 3).date()
+    assert (rows['DB.S.U', 'TABLE_LEVEL'].UNIQUE_USERS, rows['DB.S.U', 'TABLE_LEVEL'].ACCESS_COUNT) == (1, 5)
+
+
+def test_merging_does_not_modify_partial_records(app):
+    records = [record('DB.S.T', 'ID', '2024-05-01 10:00', {'ANN'}, 1),
+               record('DB.S.T', 'ID', '2024-05-02 10:00', {'BOB'}, 1)]
+    app.reduce_access_partitions(records)
+    assert records[0]['USERS'] == {'ANN'}
+
+
+def test_no_records(app):
+    assert app.reduce_access_partitions([]).empty
+
+
+def sketch_record(object_name, column_name, users, count, squares, object_squares):
+    return {
+        'OBJECT_NAME': object_name, 'COLUMN_NAME': column_name,
+        'LAST_ACCESSED': datetime(2024, 5, 1), 'USERS': {'users': sorted(users)},
+        'ACCESS_COUNT': count, 'ACCESS_COUNT_SQUARES': squares, 'OBJECT_COUNT_SQUARES': object_squares,
+    }
+
+
+def union_estimate(sketches):
+    return {key: len({user for sketch in key_sketches for user in sketch['users']})
+            for key, key_sketches in sketches.items()}
+
+
+def test_approximate_reduce_uses_cluster_sampling_variance(app):
+    records = [
+        # Per sampled ACCESS_HISTORY row: ID counted 3 times, NAME once, so the table counts 4
+        sketch_record('DB.S.T', 'ID', {'ANN'}, 3, 9, 12),
+        sketch_record('DB.S.T', 'NAME', {'BOB'}, 1, 1, 4),
+    ]
+    df = app.reduce_access_partitions(records, approximate=True, sample_percent=10, estimate_users=union_estimate)
+    rows = df.set_index('COLUMN_NAME')
+
+    assert rows.loc['ID', 'ACCESS_COUNT'] == 30
+    assert rows.loc['TABLE_LEVEL', 'ACCESS_COUNT'] == 40
+    assert rows.loc['TABLE_LEVEL', 'UNIQUE_USERS'] == 2
+    z = app.ERROR_BOUND_Z
+    assert rows.loc['ID', 'ACCESS_COUNT_ERROR'] == round(z * (9 * 0.9) ** 0.5 / 0.1)
+    # Counts within one sampled row are correlated: the table bound uses sum(y^2) = 16, not 4
+    assert rows.loc['TABLE_LEVEL', 'ACCESS_COUNT_ERROR'] == round(z * (16 * 0.9) ** 0.5 / 0.1)
+
+
+def test_unsampled_approximate_counts_have_no_error(app):
+    df = app.reduce_access_partitions([sketch_record('DB.S.T', None, {'ANN'}, 5, 25, 25)], approximate=True,
+                                      estimate_users=union_estimate)
+    assert df[['ACCESS_COUNT', 'ACCESS_COUNT_ERROR']].values.tolist() == [[5, 0]]
+
+
+def hll_connection(fake_connection, statements):
+    """Fake Snowflake merging {"users": [...]} sketches by set union"""
+    row_pattern = re.compile(r"\((\d+), '((?:[^']|'')*)'\)")
+
+    def respond(query):
+        statements.append(query)
+        groups = {}
+        for key, sketch in row_pattern.findall(query):
+            groups.setdefault(int(key), set()).update(json.loads(sketch.replace("''", "'"))['users'])
+        if 'HLL_ESTIMATE' in query:
+            return ['SKETCH_KEY', 'ESTIMATE'], [(key, float(len(users))) for key, users in groups.items()]
+        return ['SKETCH_KEY', 'SKETCH'], [(key, json.dumps({'users': sorted(users)})) for key, users in groups.items()]
+    return fake_connection(respond)
+
+
+def test_combine_hll_sketches_merges_on_the_server(app, fake_connection):
+    statements = []
+    sketches = {
+        ('DB.S.T', 'ID'): [{'users': ['ANN', "O'NEIL"]}, {'users': ['ANN', 'BOB']}],
+        ('DB.S.T', 'TABLE_LEVEL'): [{'users': [f'U{n}']} for n in range(20)],
+    }
+    estimates = app.combine_hll_sketches(hll_connection(fake_connection, statements), sketches, max_statement_bytes=300)
+    assert estimates == {('DB.S.T', 'ID'): 3.0, ('DB.S.T', 'TABLE_LEVEL'): 20.0}
+    # TABLE_LEVEL is too large for one statement: combined in rounds, then each key estimated once
+    exports = [query for query in statements if 'HLL_EXPORT' in query]
+    assert len(exports) > 1 and all('DB.S.T' not in query for query in statements)
+    assert len(statements) == len(exports) + 2
+
+
+def test_combine_hll_sketches_spreads_single_sketch_keys_over_statements(app, fake_connection):
+    statements = []
+    sketches = {('DB.S.T', f'C{n}'): [{'users': [f'U{n}', 'ANN']}] for n in range(50)}
+    estimates = app.combine_hll_sketches(hll_connection(fake_connection, statements), sketches, max_statement_bytes=500)
+    assert estimates == {key: 2.0 for key in sketches}
+    # Nothing to merge: every statement estimates a batch of keys within the limit
+    sketch_bytes = sum(len(json.dumps(sketch, separators=(',', ':'))) for [sketch] in sketches.values())
+    assert len(statements) >= sketch_bytes // 500
+    assert all('HLL_ESTIMATE' in query for query in statements)
+
+
+def test_combine_hll_sketches_in_one_statement(app, fake_connection):
+    statements = []
+    estimates = app.combine_hll_sketches(hll_connection(fake_connection, statements), {'k': [{'users': ['A']}]})
+    assert estimates == {'k': 1.0}
+    assert len(statements) == 1
+    assert app.combine_hll_sketches(hll_connection(fake_connection, statements), {}) == {}
+
+
+def test_partitions_cover_exactly_the_access_window(app):
+    now = datetime(2024, 5, 10, 14, 37, tzinfo=timezone.utc)
+    partitions = app.access_partitions(7, now)
+    assert (partitions[0][0], partitions[-1][1]) == app.access_window(7, now)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(partitions, partitions[1:]))
+    # Seven days starting mid-day touch eight calendar days; only the middle six are whole
+    assert len(partitions) == 8
+    assert [end - start == timedelta(days=1) for start, end in partitions] == [False] + [True] * 6 + [False]
+
+
+def test_partition_cache_is_private(app, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'access_history')
+    monkeypatch.setattr(app, 'ACCESS_PARTITION_CACHE_DIR', cache_dir)
+    path = app.access_partition_cache_path(('ACCT', 'ROLE', '[]'), datetime(2024, 5, 1))
+    app.write_access_partition_cache(path, {'DB.S.T': []})
+    for directory in (cache_dir, os.path.dirname(path)):
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert app.read_access_partition_cache(path) == {'DB.S.T': []}
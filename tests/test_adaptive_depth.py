@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+
+def chain(depth):
+    """DOWNSTREAM lineage of DB.S.N0 along the chain N0 -> N1 -> ... -> N<depth>"""
+    return pd.DataFrame({
+        'SOURCE_OBJECT_DATABASE': 'DB', 'SOURCE_OBJECT_SCHEMA': 'S',
+        'SOURCE_OBJECT_NAME': [f'N{d}' for d in range(depth)],
+        'TARGET_OBJECT_DATABASE': 'DB', 'TARGET_OBJECT_SCHEMA': 'S',
+        'TARGET_OBJECT_NAME': [f'N{d + 1}' for d in range(depth)],
+        'DISTANCE': list(range(1, depth + 1)),
+    })
+
+
+def runner(probe_seconds):
+    def run_lineage(object_name, object_type, direction, depth):
+        return chain(depth), f'depth {depth}', probe_seconds
+    return run_lineage
+
+
+@pytest.mark.parametrize('probe_seconds, limited_by', [(10.0, 'seconds'), (None, 'GET_LINEAGE maximum depth')])
+def test_time_budget_only_applies_to_timed_probes(app, probe_seconds, limited_by):
+    _, _, report = app.explore_lineage_adaptive('DB.S.N0', 'table', 'DOWNSTREAM', 10_000, 10_000, 1,
+                                                run_lineage=runner(probe_seconds))
+    assert report['limited_by'] == limited_by
+    if probe_seconds is not None:
+        assert report['chosen_depth'] < app.ADAPTIVE_PROBE_DEPTH
@@ -0,0 +1,35 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+def test_hashes_are_stable_md5_of_row_values(app):
+    df = pd.DataFrame({'SOURCE': ['A', 'B'], 'TARGET': ['C', 'D'], 'DISTANCE': [1, 2]})
+    hashes = app.edge_hashes(df)
+    assert hashes.tolist() == [hashlib.md5('A\x1fC\x1f1'.encode()).hexdigest(),
+                               hashlib.md5('B\x1fD\x1f2'.encode()).hexdigest()]
+    assert hashes.index.equals(df.index)
+
+
+def test_null_differs_from_empty_and_from_the_string_none(app):
+    df = pd.DataFrame({'SOURCE': ['A', 'A', 'A', 'A'], 'COLUMN': [None, '', 'None', np.nan]})
+    hashes = app.edge_hashes(df).tolist()
+    assert len(set(hashes[:3])) == 3
+    assert hashes[0] == hashes[3]
+
+
+def test_column_boundaries_matter(app):
+    df = pd.DataFrame({'A': ['XY', 'X'], 'B': ['Z', 'YZ']})
+    hashes = app.edge_hashes(df)
+    assert hashes[0] != hashes[1]
+
+
+def test_categorical_and_plain_columns_hash_alike(app):
+    plain = pd.DataFrame({'SOURCE': ['A', 'B', None], 'TARGET': ['C', 'C', 'D']})
+    categorical = plain.astype('category')
+    assert app.edge_hashes(plain).tolist() == app.edge_hashes(categorical).tolist()
+
+
+def test_empty_frame(app):
+    assert app.edge_hashes(pd.DataFrame()).empty
@@ -0,0 +1,76 @@
+import os
+import stat
+import time
+
+import pytest
+
+
+def wait_for(queue, job_id, scope=None, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = next(job for job in queue.jobs_for('owner', scope) if job['id'] == job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+class BorrowedConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_borrowed_connection_is_used_and_left_open(app, tmp_path, monkeypatch):
+    def no_login():
+        raise AssertionError('a job with a borrowed connection must not log in')
+    monkeypatch.setattr(app, 'connect_snowflake', no_login)
+    queue = app.JobQueue(str(tmp_path), max_workers=1, max_per_user=2)
+    conn = BorrowedConnection()
+
+    job_id = queue.submit('save', 'label', 'owner', None, lambda c, job: {'summary': c is conn}, connection=conn)
+    assert wait_for(queue, job_id)['status'] == 'done'
+    assert queue.load_result(job_id) == {'summary': True}
+    assert not conn.closed
+
+
+def test_limit_is_per_owner(app, tmp_path):
+    queue = app.JobQueue(str(tmp_path), max_workers=1, max_per_user=1)
+    job_id = queue.submit('save', 'slow', 'owner', None, lambda c, job: time.sleep(0.2), connection=BorrowedConnection())
+    with pytest.raises(ValueError):
+        queue.submit('save', 'second', 'owner', None, lambda c, job: None, connection=BorrowedConnection())
+    queue.submit('save', 'other browser', 'someone else', None, lambda c, job: None, connection=BorrowedConnection())
+    wait_for(queue, job_id)
+
+
+def test_job_caches_under_its_own_connection_scope(app, tmp_path, monkeypatch, fake_connection):
+    submitter_scope = ('ACCOUNT', 'ADMIN', '[]')
+    job_scope = ('ACCOUNT', 'CONFIGURED_ROLE', '[]')
+
+    def respond(query):
+        if query.startswith('SELECT CURRENT_ACCOUNT()'):
+            return ['ACCOUNT', 'ROLE', 'SECONDARY_ROLES'], [job_scope]
+        return ['SOURCE_OBJECT_NAME', 'TARGET_OBJECT_NAME', 'DISTANCE'], [('DB.S.A', 'DB.S.B', 1)]
+    # A new job connection has the configured role, not the one the session switched to
+    monkeypatch.setattr(app, 'connect_snowflake', lambda: fake_connection(respond))
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(app, 'get_shared_cache', lambda: cache)
+    queue = app.JobQueue(str(tmp_path), max_workers=1, max_per_user=2)
+    request = {
+        'object_name': 'DB.S.A', 'object_type': 'table', 'direction': 'DOWNSTREAM', 'depth': 1,
+        'depth_display': '1 levels', 'include_access_history': False, 'access_window_days': 7,
+        'partitioned_access': False, 'approximate_access': False, 'access_sample_percent': None,
+    }
+
+    job_id = queue.submit('lineage', 'label', 'owner', submitter_scope, app.lineage_analysis_job, request)
+    job = wait_for(queue, job_id, submitter_scope)
+    assert job['status'] == 'done', job['error']
+    scopes = {key[0] for key in cache._entries}
+    assert scopes == {job_scope}
+
+
+def test_job_directory_is_private(app, tmp_path):
+    job_dir = tmp_path / 'jobs'
+    app.JobQueue(str(job_dir), max_workers=1, max_per_user=1)
+    assert stat.S_IMODE(os.stat(job_dir).st_mode) == 0o700
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+
+
+def show_rows(names):
+    return ['created_on', 'name'], [(None, name) for name in names]
+
+
+def respond_with(failing_schema):
+    def respond(query):
+        if query == 'SHOW DATABASES':
+            return show_rows(['DB'])
+        if query == 'SHOW SCHEMAS IN DATABASE DB':
+            return show_rows(['GOOD', 'BAD', 'INFORMATION_SCHEMA'])
+        if query.startswith('SHOW TABLES IN SCHEMA "DB".'):
+            if failing_schema and f'"DB"."{failing_schema}" ' in query:
+                raise RuntimeError('insufficient privileges')
+            return show_rows(['ORDERS'] if 'FROM' not in query else [])
+        if query.startswith('SHOW VIEWS'):
+            return show_rows([])
+        raise RuntimeError(f'unexpected statement {query}')
+    return respond
+
+
+def test_failed_schema_listing_is_not_checkpointed(app, fake_connection, tmp_path):
+    checkpoint_dir = str(tmp_path / 'crawl')
+    crawler = app.LineageCrawler(fake_connection(respond_with('BAD')), checkpoint_dir, ('ACCT', 'ROLE', '[]'))
+    crawler.enumerate_objects()
+
+    with open(os.path.join(checkpoint_dir, 'state.json')) as f:
+        state = json.load(f)
+    assert state['enumerated_schemas'] == ['DB.GOOD']
+    assert list(state['failed_listings']) == ['DB.BAD']
+    assert state['objects'] == ['DB.GOOD.ORDERS']
+    assert not state['enumeration_complete']
+
+    # Resuming lists the failed schema again and finishes enumeration
+    crawler = app.LineageCrawler(fake_connection(respond_with(None)), checkpoint_dir, ('ACCT', 'ROLE', '[]'))
+    crawler.enumerate_objects()
+    assert sorted(crawler.state['objects']) == ['DB.BAD.ORDERS', 'DB.GOOD.ORDERS']
+    assert crawler.state['failed_listings'] == {}
+    assert crawler.state['enumeration_complete']
+
+
+def test_run_stops_when_asked(app, fake_connection, tmp_path):
+    crawler = app.LineageCrawler(fake_connection(respond_with(None)), str(tmp_path), None)
+    crawler.state['objects'] = ['DB.S.A', 'DB.S.B']
+    stats = crawler.run(should_stop=lambda: True)
+    assert stats['completed'] == 0
+    assert stats['objects'] == 2
+
+
+def lineage_respond(failing_object):
+    def respond(query):
+        match = re.search(r"GET_LINEAGE\('([^']+)'", query)
+        if not match:
+            raise RuntimeError(f'unexpected statement {query}')
+        database, schema, name = match.group(1).split('.')
+        if name == failing_object:
+            raise RuntimeError('lineage unavailable')
+        columns = ['SOURCE_OBJECT_DATABASE', 'SOURCE_OBJECT_SCHEMA', 'SOURCE_OBJECT_NAME',
+                   'TARGET_OBJECT_DATABASE', 'TARGET_OBJECT_SCHEMA', 'TARGET_OBJECT_NAME', 'DISTANCE']
+        return columns, [(database, schema, name, database, schema, f'{name}_COPY', 1)]
+    return respond
+
+
+def test_progress_is_appended_and_replayed_on_resume(app, fake_connection, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'CRAWL_COMPACT_RECORDS', 1000)
+    checkpoint_dir = str(tmp_path)
+    crawler = app.LineageCrawler(fake_connection(lineage_respond('B')), checkpoint_dir, None, max_workers=1,
+                                 queries_per_second=1000)
+    crawler.state['objects'] = ['DB.S.A', 'DB.S.B', 'DB.S.C']
+    crawler._save_state()
+    saves = []
+    monkeypatch.setattr(crawler, '_save_state', lambda: saves.append(True))
+    stats = crawler.run()
+    assert stats == {'objects': 3, 'completed': 2, 'skipped': 0, 'failed': 1, 'failed_listings': 0}
+    # Batches went to the progress log only; state.json was never rewritten
+    assert len(saves) == 1
+
+    state = app.load_crawl_state(checkpoint_dir)
+    assert state['completed'] == ['DB.S.A', 'DB.S.C']
+    assert list(state['failed']) == ['DB.S.B']
+    assert 'DB.S.A_COPY' in state['covered']
+
+    # The retry succeeds; resuming folds the log into state.json first
+    crawler = app.LineageCrawler(fake_connection(lineage_respond(None)), checkpoint_dir, None, max_workers=1,
+                                 queries_per_second=1000)
+    with open(os.path.join(checkpoint_dir, 'progress.jsonl')) as f:
+        assert f.read() == ''
+    crawler.run()
+    state = app.load_crawl_state(checkpoint_dir)
+    assert sorted(state['completed']) == ['DB.S.A', 'DB.S.B', 'DB.S.C']
+    assert state['failed'] == {}
+
+
+def test_half_written_and_replayed_progress_records_are_harmless(app, tmp_path):
+    with open(tmp_path / 'state.json', 'w') as f:
+        json.dump({'scope': None, 'objects': ['DB.S.A'], 'completed': ['DB.S.A'], 'failed': {}}, f)
+    with open(tmp_path / 'progress.jsonl', 'w') as f:
+        f.write(json.dumps({'completed': ['DB.S.A'], 'failed': {'DB.S.B': 'boom'}}) + '\n')
+        f.write('{"completed": ["DB.S')
+    state = app.load_crawl_state(str(tmp_path))
+    assert state['completed'] == ['DB.S.A']
+    assert state['failed'] == {'DB.S.B': 'boom'}
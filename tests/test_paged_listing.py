@@ -0,0 +1,65 @@
+import bisect
+import random
+
+
+def keyset_source(names, calls=None):
+    """Page source over a sorted name list, like SHOW ... LIMIT n FROM 'after'"""
+    names = sorted(names)
+
+    def fetch(conn, after, limit):
+        if calls is not None:
+            calls.append(after)
+        start = 0 if after is None else bisect.bisect_right(names, after)
+        page = names[start:start + limit]
+        return page, len(page)
+    return fetch
+
+
+def test_pages_of_two_sources_merge_into_a_sorted_prefix(app):
+    tables = ['A', 'C', 'E', 'G', 'I', 'K']
+    views = ['B', 'D', 'Z']
+    listing = app.PagedListing({'TABLES': keyset_source(tables), 'VIEWS': keyset_source(views)}, page_size=2)
+
+    listing.load_more(None)
+    # D could still be followed by a table before it, so only A-C are final
+    assert listing.names == ['A', 'B', 'C']
+    assert not listing.complete
+    while not listing.complete:
+        before = list(listing.names)
+        listing.load_more(None)
+        assert listing.names[:len(before)] == before
+    assert listing.names == sorted(tables + views)
+
+
+def test_finished_source_is_not_queried_again(app):
+    calls = []
+    listing = app.PagedListing({'VIEWS': keyset_source(['V1'], calls), 'TABLES': keyset_source([f'T{n:02}' for n in range(9)])}, page_size=3)
+    while not listing.complete:
+        listing.load_more(None)
+    assert calls == [None]
+    assert listing.names[0] == 'T00' and listing.names[-1] == 'V1'
+
+
+def test_random_sources_produce_the_full_sorted_listing(app):
+    rng = random.Random(3)
+    for _ in range(20):
+        sources = {key: rng.sample(range(1000), rng.randrange(0, 40)) for key in ('A', 'B', 'C')}
+        names = {key: [f'{value:04}' for value in values] for key, values in sources.items()}
+        listing = app.PagedListing({key: keyset_source(values) for key, values in names.items()}, page_size=rng.randrange(1, 8))
+        while not listing.complete:
+            listing.load_more(None)
+        assert listing.names == sorted(name for values in names.values() for name in values)
+
+
+def test_column_listing_reads_show_columns_once_and_quotes_names(app, fake_connection):
+    columns = [f'COL_{n:04}' for n in range(2500)]
+    conn = fake_connection(lambda query: (['table_name', 'schema_name', 'column_name'],
+                                          [('T', 'S', name) for name in reversed(columns)]))
+    listing = app.column_listing('DB', 'My "Schema"', 'T')
+    pages = 0
+    while not listing.complete:
+        listing.load_more(conn)
+        pages += 1
+    assert listing.names == columns
+    assert pages > 1
+    assert conn.queries == ['SHOW COLUMNS IN "DB"."My ""Schema"""."T"']
@@ -0,0 +1,19 @@
+def test_pending_queries_are_bounded_per_session(app):
+    stats = app.QueryCacheStats(max_pending=3)
+    for n in range(5):
+        stats.record('lineage', f'q{n}', 'session-1')
+    stats.record('lineage', 'other', 'session-2')
+    assert stats.take_pending('session-1') == [('lineage', 'q2'), ('lineage', 'q3'), ('lineage', 'q4')]
+    assert stats.take_pending('session-1') == []
+    assert stats.summary().set_index('QUERY_TYPE').loc['lineage', 'EXECUTED'] == 6
+
+
+def test_old_pending_queries_expire(app, monkeypatch):
+    stats = app.QueryCacheStats(max_age_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'time', lambda: now[0])
+    stats.record('lineage', 'old', 'abandoned-session')
+    now[0] += 61
+    stats.record('lineage', 'new', 'active-session')
+    assert 'abandoned-session' not in stats._pending
+    assert stats.take_pending('active-session') == [('lineage', 'new')]
@@ -0,0 +1,162 @@
+import json
+import os
+import random
+
+import pandas as pd
+import pytest
+
+
+def lineage_frame(edges, columns=False):
+    df = pd.DataFrame({
+        'SOURCE_OBJECT_DATABASE': 'DB', 'SOURCE_OBJECT_SCHEMA': 'S',
+        'SOURCE_OBJECT_NAME': [source for source, _ in edges],
+        'TARGET_OBJECT_DATABASE': 'DB', 'TARGET_OBJECT_SCHEMA': 'S',
+        'TARGET_OBJECT_NAME': [target for _, target in edges],
+    })
+    if columns:
+        df['SOURCE_COLUMN_NAME'] = 'ID'
+        df['TARGET_COLUMN_NAME'] = 'ID'
+    return df
+
+
+def test_closure_matches_graph_search(app):
+    rng = random.Random(11)
+    edges = [(f'T{rng.randrange(30)}', f'T{rng.randrange(30)}') for _ in range(60)]
+    edges = [(source, target) for source, target in edges if source != target]  # Self-edges are ignored
+    index = app.ReachabilityIndex()
+    for start in range(0, len(edges), 7):
+        index.add_frame(lineage_frame(edges[start:start + 7]))
+
+    successors = {}
+    for source, target in edges:
+        successors.setdefault(source, set()).add(target)
+    for node in sorted(successors):
+        seen, stack = set(), [node]
+        while stack:
+            for nxt in successors.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        assert index.descendant_count(f'DB.S.{node}') == len(seen - {node})
+        for other in successors:
+            assert index.reaches(f'DB.S.{node}', f'DB.S.{other}') == (other in seen)
+
+
+def test_columns_count_as_their_object(app):
+    index = app.ReachabilityIndex()
+    index.add_frame(lineage_frame([('A', 'B'), ('B', 'C')], columns=True))
+    assert index.descendant_count('DB.S.A') == 2
+    assert 'DB.S.A.ID' not in index
+    assert len(index) == 3
+
+
+def test_node_limit_marks_the_index_truncated(app):
+    index = app.ReachabilityIndex(max_nodes=3)
+    index.add_frame(lineage_frame([('A', 'B'), ('B', 'C'), ('C', 'D')]))
+    assert len(index) == 3
+    assert index.truncated
+    assert index.descendant_count('DB.S.A') == 2
+
+
+def write_crawl(crawl_dir, name, scope, edges, mode='w'):
+    os.makedirs(os.path.join(crawl_dir, name), exist_ok=True)
+    with open(os.path.join(crawl_dir, name, 'state.json'), 'w') as f:
+        json.dump({'scope': scope}, f)
+    with open(os.path.join(crawl_dir, name, 'edges.jsonl'), mode) as f:
+        for record in lineage_frame(edges).to_dict(orient='records'):
+            f.write(json.dumps(record) + '\n')
+
+
+@pytest.fixture
+def crawl_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_sync_reads_appended_edges_once(app, crawl_dir):
+    index = app.ReachabilityIndex()
+    write_crawl(crawl_dir, 'account', ['ACCT', 'ROLE'], [('A', 'B')])
+    write_crawl(crawl_dir, 'other_role', ['ACCT', 'ADMIN'], [('X', 'Y')])
+    assert index.sync_crawls(crawl_dir, ('ACCT', 'ROLE')) == 1
+    write_crawl(crawl_dir, 'account', ['ACCT', 'ROLE'], [('B', 'C')], mode='a')
+    assert index.sync_crawls(crawl_dir, ('ACCT', 'ROLE')) == 1
+    assert index.sync_crawls(crawl_dir, ('ACCT', 'ROLE')) == 0
+    assert index.descendant_count('DB.S.A') == 2
+    assert 'DB.S.X' not in index
+
+
+def test_sync_skips_partial_and_corrupt_lines(app, crawl_dir):
+    index = app.ReachabilityIndex()
+    write_crawl(crawl_dir, 'account', None, [('A', 'B')])
+    edges_path = os.path.join(crawl_dir, 'account', 'edges.jsonl')
+    with open(edges_path, 'a') as f:
+        f.write('{"broken\n{"SOURCE_OBJECT_NAME": "half')
+    assert index.sync_crawls(crawl_dir, None) == 1
+    # The half-written line is read once it is complete
+    with open(edges_path, 'a') as f:
+        f.write('"}\n')
+    index.sync_crawls(crawl_dir, None)
+    assert index.descendant_count('DB.S.A') == 1
+
+
+def test_reset_checkpoint_rebuilds_the_index(app, crawl_dir):
+    index = app.ReachabilityIndex()
+    index.add_frame(lineage_frame([('E', 'F')]))
+    write_crawl(crawl_dir, 'account', None, [('A', 'B'), ('B', 'C'), ('C', 'D')])
+    index.sync_crawls(crawl_dir, None)
+    assert index.descendant_count('DB.S.A') == 3
+
+    # Reset Checkpoint deletes the files; a new crawl starts a shorter file
+    for name in ('state.json', 'edges.jsonl'):
+        os.remove(os.path.join(crawl_dir, 'account', name))
+    index.sync_crawls(crawl_dir, None)
+    assert 'DB.S.A' not in index
+    write_crawl(crawl_dir, 'account', None, [('A', 'Z')])
+    index.sync_crawls(crawl_dir, None)
+    assert index.descendant_count('DB.S.A') == 1
+    # Explored lineage survives the rebuild
+    assert index.reaches('DB.S.E', 'DB.S.F')
+
+
+def test_replaced_file_of_the_same_size_is_reread(app, crawl_dir):
+    index = app.ReachabilityIndex()
+    write_crawl(crawl_dir, 'account', None, [('A', 'B')])
+    index.sync_crawls(crawl_dir, None)
+    edges_path = os.path.join(crawl_dir, 'account', 'edges.jsonl')
+    tmp_path = edges_path + '.new'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(lineage_frame([('C', 'B')]).to_dict(orient='records')[0]) + '\n')
+    os.replace(tmp_path, edges_path)
+    index.sync_crawls(crawl_dir, None)
+    assert 'DB.S.A' not in index
+    assert index.reaches('DB.S.C', 'DB.S.B')
+
+
+def test_explored_edges_implied_by_a_crawl_survive_its_reset(app, crawl_dir):
+    index = app.ReachabilityIndex()
+    write_crawl(crawl_dir, 'account', None, [('A', 'B')])
+    index.sync_crawls(crawl_dir, None)
+    index.add_frame(lineage_frame([('A', 'B')]))
+
+    for name in ('state.json', 'edges.jsonl'):
+        os.remove(os.path.join(crawl_dir, 'account', name))
+    index.sync_crawls(crawl_dir, None)
+    assert index.reaches('DB.S.A', 'DB.S.B')
+
+
+def test_checkpoint_scope_is_read_once_per_change(app, crawl_dir, monkeypatch):
+    index = app.ReachabilityIndex()
+    write_crawl(crawl_dir, 'account', ['ACCT', 'ROLE'], [('A', 'B')])
+    index.sync_crawls(crawl_dir, ('ACCT', 'ROLE'))
+    loads = []
+    real_load = json.load
+    monkeypatch.setattr(app.json, 'load', lambda f: loads.append(f.name) or real_load(f))
+    index.sync_crawls(crawl_dir, ('ACCT', 'ROLE'))
+    assert loads == []
+
+    # A checkpoint rewritten under another role is read again
+    state_path = os.path.join(crawl_dir, 'account', 'state.json')
+    with open(state_path, 'w') as f:
+        json.dump({'scope': ['ACCT', 'ADMIN']}, f)
+    index.sync_crawls(crawl_dir, ('ACCT', 'ROLE'))
+    assert loads == [state_path]
+    assert 'DB.S.A' not in index
@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+def test_fixture_key_ignores_whitespace_and_staging_suffixes(app):
+    assert app.fixture_key("SELECT *\n    FROM  T") == app.fixture_key("SELECT * FROM T")
+    assert (app.fixture_key("CREATE TABLE LINEAGE_STAGE_1A2B3C4D AS SELECT 1")
+            == app.fixture_key("CREATE TABLE LINEAGE_STAGE_DEADBEEF AS SELECT 1"))
+    assert app.fixture_key("SELECT 1") != app.fixture_key("SELECT 2")
+
+
+def test_fixture_key_matches_the_same_window_recorded_on_another_day(app):
+    def window_query(days_ago):
+        end = datetime.now(timezone.utc).replace(hour=6, minute=0, second=0, microsecond=0) - timedelta(days=days_ago)
+        return "SELECT * FROM ACCESS_HISTORY WHERE " + app.access_time_filter(end - timedelta(days=7), end)
+    # Timestamps become day offsets from today, so yesterday's recording of "last 7 days" is not today's
+    assert app.fixture_key(window_query(0)) == app.fixture_key(window_query(0).replace('06:00:00', '09:30:00'))
+    assert app.fixture_key(window_query(0)) != app.fixture_key(window_query(1))
+
+
+def test_recorded_results_replay_offline(app, fake_connection, tmp_path):
+    def respond(query):
+        return ['NAME', 'ROWS'], [('ORDERS', 10), ('CUSTOMERS', 5)]
+    recording = app.RecordingConnection(fake_connection(respond), str(tmp_path))
+    cursor = recording.cursor().execute("SHOW TABLES IN SCHEMA DB.S")
+    assert cursor.fetchone() == ('ORDERS', 10)
+    assert cursor.fetchall() == [('CUSTOMERS', 5)]
+
+    replay = app.ReplayConnection(str(tmp_path)).cursor().execute("SHOW  TABLES IN SCHEMA DB.S")
+    assert [desc[0] for desc in replay.description] == ['NAME', 'ROWS']
+    assert replay.rowcount == 2
+    assert replay.fetchall() == [('ORDERS', 10), ('CUSTOMERS', 5)]
+    assert replay.fetchone() is None
+    assert replay.sfqid
+
+
+def test_replay_without_a_fixture_fails_clearly(app, tmp_path):
+    with pytest.raises(LookupError, match="No recorded response"):
+        app.ReplayConnection(str(tmp_path)).cursor().execute("SELECT 1")
+    with pytest.raises(ValueError):
+        app.ReplayConnection(str(tmp_path / 'missing'))
+
+
+def test_explored_paths_are_recorded_only_in_record_mode(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'RECORD_DIR', None)
+    app.record_explored_path({'table': 'IGNORED'})
+    monkeypatch.setattr(app, 'RECORD_DIR', str(tmp_path / 'fixtures'))
+    app.record_explored_path({'table': 'ORDERS'})
+    app.record_explored_path({'table': 'CUSTOMERS'})
+    with open(tmp_path / 'fixtures' / 'paths.jsonl') as f:
+        assert [json.loads(line)['table'] for line in f] == ['ORDERS', 'CUSTOMERS']
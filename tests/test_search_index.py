@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def lineage_frame(edges):
+    """Object-level lineage rows for (source, target) table names in DB.S"""
+    return pd.DataFrame({
+        'SOURCE_OBJECT_DATABASE': 'DB', 'SOURCE_OBJECT_SCHEMA': 'S',
+        'SOURCE_OBJECT_NAME': [source for source, _ in edges], 'SOURCE_OBJECT_DOMAIN': 'TABLE',
+        'TARGET_OBJECT_DATABASE': 'DB', 'TARGET_OBJECT_SCHEMA': 'S',
+        'TARGET_OBJECT_NAME': [target for _, target in edges], 'TARGET_OBJECT_DOMAIN': 'VIEW',
+    })
+
+
+@pytest.fixture
+def index(app):
+    df = lineage_frame([('RAW', 'STAGE'), ('STAGE', 'MART'), ('MART', 'REPORT'),
+                        ('OTHER', 'SIDE'), ('LOOKUP', 'MART')])
+    return app.LineageSearchIndex(df)
+
+
+@pytest.mark.parametrize('query, mode, expected', [
+    ('stage', 'Contains', [0, 1]),
+    ('DB.S.MA', 'Prefix', [1, 2, 4]),
+    ('*.S.?AW', 'Glob', [0]),
+    ('^DB\\.S\\.(RAW|SIDE)$', 'Regex', [0, 3]),
+    ('view', 'Contains', [0, 1, 2, 3, 4]),
+    ('missing', 'Contains', []),
+])
+def test_search_modes(index, query, mode, expected):
+    assert index.search(query, mode).tolist() == expected
+
+
+def test_search_matches_columns_and_ignores_nulls(app):
+    df = lineage_frame([('A', 'B'), ('B', 'C')])
+    df['SOURCE_COLUMN_NAME'] = ['ORDER_ID', None]
+    df['TARGET_COLUMN_NAME'] = [None, 'CUSTOMER_ID']
+    index = app.LineageSearchIndex(df)
+    assert index.search('customer', 'Contains').tolist() == [1]
+    assert index.search('none', 'Contains').tolist() == []
+
+
+def test_invalid_regex_raises_value_error(index):
+    with pytest.raises(ValueError):
+        index.search('(unclosed', 'Regex')
+
+
+def test_regex_without_re2_support_falls_back(index):
+    # Backreferences are rejected by the vectorized engine but valid for re
+    assert index.search('(R)\\w*\\1', 'Regex').tolist() == [2]
+
+
+def test_paths_through_keeps_upstream_and_downstream_edges(index):
+    # RAW -> STAGE -> MART -> REPORT with LOOKUP feeding MART; OTHER -> SIDE is unrelated
+    assert index.paths_through('DB.S.STAGE', 'Contains').tolist() == [0, 1, 2]
+    assert index.paths_through('DB.S.MART', 'Contains').tolist() == [0, 1, 2, 4]
+    assert index.paths_through('DB.S.SIDE', 'Contains').tolist() == [3]
+    assert index.paths_through('nothing', 'Contains').tolist() == []
+
+
+def test_paths_through_handles_cycles(app):
+    index = app.LineageSearchIndex(lineage_frame([('A', 'B'), ('B', 'A'), ('B', 'C'), ('D', 'E')]))
+    assert index.paths_through('DB.S.C', 'Contains').tolist() == [0, 1, 2]
+
+
+def test_paths_through_matches_brute_force_on_random_graph(app):
+    rng = np.random.default_rng(7)
+    edges = list({(f"T{a}", f"T{b}") for a, b in rng.integers(0, 40, size=(120, 2))})
+    index = app.LineageSearchIndex(lineage_frame(edges))
+
+    def reach(start, adjacency):
+        seen, stack = {start}, [start]
+        while stack:
+            for nxt in adjacency.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    forward, backward = {}, {}
+    for source, target in edges:
+        forward.setdefault(source, []).append(target)
+        backward.setdefault(target, []).append(source)
+    for node in ('T3', 'T17', 'T29'):
+        descendants, ancestors = reach(node, forward), reach(node, backward)
+        expected = [row for row, (source, target) in enumerate(edges)
+                    if target in ancestors or source in descendants]
+        assert index.paths_through(f'^DB\\.S\\.{node}$', 'Regex').tolist() == expected
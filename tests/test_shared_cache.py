@@ -0,0 +1,125 @@
+import sys
+import threading
+
+import pytest
+
+SCOPE = ('ACCT', 'ANALYST', '[]')
+OTHER_SCOPE = ('ACCT', 'ADMIN', '[]')
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_concurrent_misses_load_once(app):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(True)
+        release.wait(5)
+        return 'rows'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load((SCOPE, 'lineage'), loader)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['rows'] * 4
+    assert len(calls) == 1
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 3
+
+
+def test_failed_load_lets_the_next_caller_retry(app):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+
+    def failing():
+        raise RuntimeError('warehouse suspended')
+    with pytest.raises(RuntimeError):
+        cache.get_or_load((SCOPE, 'lineage'), failing)
+    assert cache.get_or_load((SCOPE, 'lineage'), lambda: 'rows') == 'rows'
+
+
+def test_entries_expire_after_the_ttl(app, clock):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    cache.put((SCOPE, 'databases'), ['DB'])
+    clock[0] += 59
+    assert cache.get((SCOPE, 'databases')) == ['DB']
+    clock[0] += 1
+    assert cache.get((SCOPE, 'databases')) is None
+    assert cache.get_or_load((SCOPE, 'databases'), lambda: ['DB', 'NEW']) == ['DB', 'NEW']
+    assert cache.stats()['entries'] == 1
+
+
+def test_least_recently_used_entries_are_evicted_under_the_byte_bound(app):
+    value_size = sys.getsizeof('x' * 1000)
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=3 * value_size)
+    for name in 'abc':
+        cache.put((SCOPE, name), name * 1000)
+    cache.get((SCOPE, 'a'))  # Now the most recently used
+    cache.put((SCOPE, 'd'), 'd' * 1000)
+
+    assert cache.get((SCOPE, 'b')) is None
+    assert [cache.get((SCOPE, name)) is not None for name in 'acd'] == [True, True, True]
+    assert cache.stats()['megabytes'] * 1024 * 1024 == 3 * value_size
+    # A value larger than the whole cache is returned but never stored
+    assert cache.get_or_load((SCOPE, 'huge'), lambda: 'x' * 10000) == 'x' * 10000
+    assert cache.get((SCOPE, 'huge')) is None and cache.get((SCOPE, 'a')) is not None
+
+
+def test_rejected_values_are_not_stored(app):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    calls = []
+
+    def loader():
+        calls.append(True)
+        return None
+
+    for _ in range(2):
+        assert cache.get_or_load((SCOPE, 'lineage'), loader, should_store=lambda value: value is not None) is None
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_invalidate_drops_only_that_scope(app):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    cache.put((SCOPE, 'databases'), ['DB'])
+    cache.put((OTHER_SCOPE, 'databases'), ['DB', 'SECRET'])
+    cache.invalidate(SCOPE)
+    assert cache.get((SCOPE, 'databases')) is None
+    assert cache.get((OTHER_SCOPE, 'databases')) == ['DB', 'SECRET']
+
+
+def test_load_cached_isolates_roles(app, monkeypatch):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    monkeypatch.setattr(app, 'get_shared_cache', lambda: cache)
+    session = {'cache_scope': SCOPE}
+    monkeypatch.setattr(app.st, 'session_state', session)
+
+    assert app.load_cached('schemas', ['DB'], lambda: ['PUBLIC']) == ['PUBLIC']
+    assert app.load_cached('schemas', ['DB'], lambda: ['OTHER']) == ['PUBLIC']
+    session['cache_scope'] = OTHER_SCOPE
+    assert app.load_cached('schemas', ['DB'], lambda: ['PUBLIC', 'SECRET']) == ['PUBLIC', 'SECRET']
+    assert cache.get((SCOPE, 'schemas', 'DB')) == ['PUBLIC']
+
+
+def test_load_cached_without_a_scope_stays_in_the_session(app, monkeypatch):
+    cache = app.SharedResultCache(ttl_seconds=60, max_bytes=1024 * 1024)
+    monkeypatch.setattr(app, 'get_shared_cache', lambda: cache)
+    session = {'cache_scope': None}
+    monkeypatch.setattr(app.st, 'session_state', session)
+
+    assert app.load_cached('schemas', ['DB'], lambda: ['PUBLIC']) == ['PUBLIC']
+    assert app.load_cached('schemas', ['DB'], lambda: ['OTHER']) == ['PUBLIC']
+    assert session['cached_schemas_DB'] == ['PUBLIC']
+    assert cache.stats()['entries'] == 0
+    # Rejected values are not kept either
+    assert app.load_cached('tables', ['DB', 'S'], lambda: None, should_store=lambda value: value is not None) is None
+    assert 'cached_tables_DB_S' not in session
@@ -0,0 +1,78 @@
+import itertools
+import random
+import re
+
+import pytest
+
+LINEAGE_CALL = re.compile(r"SELECT '([^']+)' AS LINEAGE_ORIGIN, \* FROM TABLE \(SNOWFLAKE\.CORE\.GET_LINEAGE\('[^']+', '(\w+)', '(\w+)', 1\)\)")
+COLUMNS = ['LINEAGE_ORIGIN', 'SOURCE_OBJECT_DATABASE', 'SOURCE_OBJECT_SCHEMA', 'SOURCE_OBJECT_NAME',
+           'TARGET_OBJECT_DATABASE', 'TARGET_OBJECT_SCHEMA', 'TARGET_OBJECT_NAME']
+
+
+def lineage_connection(fake_connection, edges):
+    """Connection answering batched distance-1 GET_LINEAGE calls from an edge list of table names"""
+    def respond(query):
+        rows = []
+        for origin, _, direction in LINEAGE_CALL.findall(query):
+            name = origin.split('.')[-1]
+            for source, target in edges:
+                if (source if direction == 'DOWNSTREAM' else target) == name:
+                    rows.append((origin, 'DB', 'S', source, 'DB', 'S', target))
+        return COLUMNS, rows
+    return fake_connection(respond)
+
+
+def brute_force_shortest(edges, source, target, max_length):
+    nodes = sorted({node for edge in edges for node in edge})
+    successors = {node: [t for s, t in edges if s == node] for node in nodes}
+    paths = [[source]]
+    for _ in range(max_length):
+        paths = [path + [nxt] for path in paths for nxt in successors.get(path[-1], []) if nxt not in path]
+        found = [path for path in paths if path[-1] == target]
+        if found:
+            return sorted(found)
+    return []
+
+
+def qualified(path):
+    return [f'DB.S.{node}' for node in path]
+
+
+@pytest.fixture
+def diamond(fake_connection):
+    edges = [('A', 'B'), ('A', 'C'), ('B', 'D'), ('C', 'D'), ('D', 'E'), ('A', 'X'), ('X', 'Y'), ('Y', 'Z'), ('Z', 'E')]
+    return lineage_connection(fake_connection, edges)
+
+
+def test_finds_every_shortest_path(app, diamond):
+    paths, stats = app.find_shortest_paths(diamond, 'DB.S.A', 'DB.S.E')
+    assert paths == [qualified('ABDE'), qualified('ACDE')]
+    assert stats['levels'] == 3
+
+
+def test_same_source_and_target(app, diamond):
+    assert app.find_shortest_paths(diamond, 'DB.S.A', 'DB.S.A')[0] == [['DB.S.A']]
+
+
+def test_unreachable_and_too_long(app, diamond):
+    assert app.find_shortest_paths(diamond, 'DB.S.E', 'DB.S.A')[0] == []
+    assert app.find_shortest_paths(diamond, 'DB.S.A', 'DB.S.E', max_length=2)[0] == []
+
+
+def test_known_adjacency_avoids_downstream_queries(app, diamond):
+    known_forward = {'DB.S.A': {'DB.S.B'}, 'DB.S.B': set()}
+    paths, stats = app.find_shortest_paths(diamond, 'DB.S.A', 'DB.S.B', known_forward=known_forward)
+    assert paths == [qualified('AB')]
+    assert stats['nodes_fetched'] <= 1  # only the UPSTREAM side of the target may be queried
+
+
+def test_matches_brute_force_on_small_graphs(app, fake_connection):
+    nodes = 'ABCDEFG'
+    for seed in range(30):
+        rng = random.Random(seed)
+        edges = [edge for edge in itertools.permutations(nodes, 2) if rng.random() < 0.25]
+        conn = lineage_connection(fake_connection, edges)
+        for source, target in [('A', 'G'), ('B', 'F'), ('C', 'A')]:
+            expected = [qualified(path) for path in brute_force_shortest(edges, source, target, 6)]
+            paths, _ = app.find_shortest_paths(conn, f'DB.S.{source}', f'DB.S.{target}', max_length=6)
+            assert paths == expected, (seed, source, target)